@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,7 +42,7 @@ INSTALLED_APPS = [
     'graphene_django',
     'graphene',
     'django_filters',
-    'django_contrab',
+    'django_crontab',
 ]
 
 MIDDLEWARE = [
@@ -130,10 +131,98 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 GRAPHENE = {
     'SCHEMA': 'crm.schema.schema',
     'MIDDLEWARE': [
-        'graphene_django.debug.DjangoDebugMiddleware',
+        # Only attached to sampled requests, see GRAPHQL_TRACING
+        'crm.tracing.TracingMiddleware',
     ],
+    # Largest page a connection field serves
+    'RELAY_CONNECTION_MAX_LIMIT': 100,
 }
 
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+#
+# The response cache generations and the persisted queries must be shared by
+# every web worker, Celery worker and management command, so deployments point
+# CACHE_REDIS_URL at Redis. Without it every process has its own LocMemCache,
+# which the response cache only uses when GRAPHQL_RESPONSE_CACHE says the
+# site runs as a single process (see crm/response_cache.py).
+#
+# Redis evicts nothing by default (maxmemory-policy noeviction). Run it with
+# maxmemory set and maxmemory-policy volatile-lru: responses carry a TTL and
+# are evicted least recently used first, while the generations, which have
+# none, are kept.
+
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        },
+        # GraphQL responses; evicted by Redis' volatile-lru policy
+        'graphql': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'graphql',
+            'TIMEOUT': 60,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        # GraphQL responses; MAX_ENTRIES bounds the LRU
+        'graphql': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'crm-graphql-responses',
+            'TIMEOUT': 60,
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        },
+    }
+
+# Result cache for read-only queries, see crm/response_cache.py
+GRAPHQL_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'ALIAS': 'graphql',
+    'TIMEOUT': 60,
+    # LocMemCache is only safe when one process serves and writes everything:
+    # the development server and the test suite
+    'SINGLE_PROCESS': not CACHE_REDIS_URL and DEBUG,
+}
+
+# Automatic persisted queries, see crm/persisted_queries.py
+GRAPHQL_PERSISTED_QUERIES = {
+    'CACHE_SIZE': 256,
+    'TIMEOUT': None,
+    'ALLOWLIST': None,
+    'ALLOWLIST_ONLY': False,
+}
+
+# Cost budget checked before execution, see crm/query_cost.py
+GRAPHQL_QUERY_COST = {
+    'MAX_COST': 10000,
+    'MAX_BATCH_COST': 10000,
+    'MAX_DEPTH': 15,
+    'DEFAULT_PAGE_SIZE': 20,
+}
+
+# Resolver and SQL tracing, see crm/tracing.py
+GRAPHQL_TRACING = {
+    'SAMPLE_RATE': 0.0,
+    # Any client could otherwise make a request pay for tracing
+    'ALLOW_ON_DEMAND': DEBUG,
+    'METRICS_FILE': None,
+    'FLUSH_INTERVAL': 60,
+}
+
+# Worker threads the async GraphQL view (/graphql/async/) runs ORM work on
+GRAPHQL_ASYNC_WORKERS = 8
+
+# Operations accepted in one batched (JSON array) request to /graphql/
+GRAPHQL_MAX_BATCH_SIZE = 20
+
 CRONJOBS = [
     ('*/5 * * * *', 'crm.cron.log_crm_heartbeat'),
 ]
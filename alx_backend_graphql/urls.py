@@ -16,10 +16,18 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
+from crm.views import (
+    AsyncCRMGraphQLView,
+    CRMGraphQLView,
+    export_customers_csv,
+    export_orders_ndjson,
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql/", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql/", csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
+    path("graphql/async/", csrf_exempt(AsyncCRMGraphQLView.as_view())),
+    path("export/orders.ndjson", export_orders_ndjson),
+    path("export/customers.csv", export_customers_csv),
 ]
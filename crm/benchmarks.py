@@ -0,0 +1,230 @@
+"""
+Benchmarks for the CRM GraphQL API, run with ``python manage.py benchmark``.
+
+The command seeds a throwaway test database with ``crm.seed_db`` at a
+configurable volume, then runs each benchmark ``iterations`` times and
+reports latency percentiles and SQL counts. Writes are rolled back after
+every iteration so each one sees the same data. Results can be saved as a
+JSON baseline and later runs compared against it (see ``compare``).
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.test import AsyncClient, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from crm.models import Customer, Product
+from crm.schema import schema
+
+
+# ============================================================
+# MEASUREMENT
+# ============================================================
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def measure(operation, iterations, rollback=False):
+    """Run ``operation`` ``iterations`` times; return latency percentiles and SQL count."""
+    samples = []
+    queries = 0
+    for _ in range(iterations):
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                operation()
+                samples.append((time.perf_counter() - start) * 1000)
+            transaction.set_rollback(rollback)
+        queries = max(queries, len(captured))
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "mean_ms": sum(samples) / len(samples),
+        "queries": queries,
+    }
+
+
+def execute(query, variables=None):
+    request = RequestFactory().post("/graphql/")
+    result = schema.execute(query, variable_values=variables, context_value=request)
+    if result.errors:
+        raise RuntimeError(result.errors)
+    return result.data
+
+
+# ============================================================
+# BENCHMARKS
+# ============================================================
+
+FILTERED_ORDERS = """
+query filteredOrders($minTotal: Decimal) {
+    allOrders(first: 50, totalAmountGte: $minTotal, orderBy: "-total_amount") {
+        edges { node { totalAmount orderDate customer { name email } products { edges { node { name } } } } }
+    }
+}
+"""
+
+BULK_CREATE_CUSTOMERS = """
+mutation bulkCreate($input: [CustomerInput]!) {
+    bulkCreateCustomers(input: $input) {
+        customers { id }
+        errors
+    }
+}
+"""
+
+CREATE_ORDER = """
+mutation createOrder($customerId: ID!, $productIds: [ID]!) {
+    createOrder(customerId: $customerId, productIds: $productIds) {
+        order { totalAmount }
+        error
+    }
+}
+"""
+
+UPDATE_LOW_STOCK = "mutation { updateLowStockProducts { updatedCount } }"
+
+CRM_STATS = """
+query { crmStats(bucket: WEEK) { totalCustomers totalOrders totalRevenue buckets { period totalRevenue } } }
+"""
+
+
+def bench_filtered_orders(iterations):
+    return measure(lambda: execute(FILTERED_ORDERS, {"minTotal": "100"}), iterations)
+
+
+def bench_bulk_create_customers(iterations, rows=1000):
+    """Import ``rows`` customers in one mutation."""
+    def operation():
+        data = execute(BULK_CREATE_CUSTOMERS, {"input": [
+            {"name": f"Bench {i}", "email": f"bench{i}@example.com", "phone": "+1234567890"}
+            for i in range(rows)
+        ]})
+        if data["bulkCreateCustomers"]["errors"]:
+            raise RuntimeError(data["bulkCreateCustomers"]["errors"])
+
+    return measure(operation, iterations, rollback=True)
+
+
+def bench_create_order(iterations):
+    customer_id = Customer.objects.values_list("pk", flat=True).first()
+    product_ids = list(
+        Product.objects.filter(stock__gt=0).values_list("pk", flat=True)[:3]
+    )
+
+    def operation():
+        data = execute(CREATE_ORDER, {"customerId": customer_id, "productIds": product_ids})
+        if data["createOrder"]["error"]:
+            raise RuntimeError(data["createOrder"]["error"])
+
+    return measure(operation, iterations, rollback=True)
+
+
+def bench_update_low_stock(iterations):
+    return measure(lambda: execute(UPDATE_LOW_STOCK), iterations, rollback=True)
+
+
+def bench_crm_stats(iterations):
+    return measure(lambda: execute(CRM_STATS), iterations)
+
+
+# Two independent root fields, which the async view resolves concurrently
+CONCURRENT_ROOT_FIELDS = """
+query {
+    allCustomers(first: 20) { edges { node { name email } } }
+    allOrders(first: 20) { edges { node { totalAmount customer { name } } } }
+}
+"""
+
+
+@override_settings(
+    GRAPHQL_RESPONSE_CACHE={"ENABLED": False}, ALLOWED_HOSTS=["testserver"]
+)
+def bench_sync_vs_async(iterations, concurrency=8):
+    """
+    Send ``iterations`` requests, ``concurrency`` at a time, to the sync (WSGI)
+    and async (ASGI) endpoints and compare throughput.
+    """
+    payload = {"query": CONCURRENT_ROOT_FIELDS}
+
+    def sync_request(_):
+        return Client().post("/graphql/", payload, content_type="application/json")
+
+    async def run_async():
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def request():
+            async with slots:
+                return await client.post(
+                    "/graphql/async/", payload, content_type="application/json"
+                )
+
+        return await asyncio.gather(*(request() for _ in range(iterations)))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        sync_responses = list(pool.map(sync_request, range(iterations)))
+    sync_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    async_responses = asyncio.run(run_async())
+    async_seconds = time.perf_counter() - start
+
+    for response in (*sync_responses, *async_responses):
+        if response.status_code != 200 or "errors" in response.json():
+            raise RuntimeError(response.content)
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "sync_rps": iterations / sync_seconds,
+        "async_rps": iterations / async_seconds,
+    }
+
+
+BENCHMARKS = {
+    "filtered_orders": bench_filtered_orders,
+    "bulk_create_customers": bench_bulk_create_customers,
+    "create_order": bench_create_order,
+    "update_low_stock": bench_update_low_stock,
+    "crm_stats": bench_crm_stats,
+    "sync_vs_async": bench_sync_vs_async,
+}
+
+
+# ============================================================
+# BASELINES
+# ============================================================
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Return the regressions of ``results`` against ``baseline``: latencies
+    (``*_ms``) or SQL counts that grew, or throughput (``*_rps``) that fell,
+    by more than ``tolerance``. SQL counts must not grow at all.
+    """
+    regressions = []
+    for name, expected in baseline.get("results", {}).items():
+        actual = results.get("results", {}).get(name)
+        if actual is None:
+            continue
+        for key, before in expected.items():
+            after = actual.get(key)
+            if after is None:
+                continue
+            if key == "queries":
+                worse = after > before
+            elif key.endswith("_ms") and not key.startswith("mean"):
+                worse = after > before * (1 + tolerance)
+            elif key.endswith("_rps"):
+                worse = after < before * (1 - tolerance)
+            else:
+                continue
+            if worse:
+                regressions.append(f"{name}.{key}: {before:.2f} -> {after:.2f}")
+    return regressions
@@ -0,0 +1,88 @@
+"""
+Set-based UPDATEs that give every row its own values.
+
+``update_from_values`` joins the table to an inline ``VALUES`` list on the
+primary key (``UPDATE ... FROM (VALUES ...)``), so thousands of rows are
+updated by one statement without the ORM building and compiling a
+``Case``/``When`` branch per row. PostgreSQL and SQLite 3.33+ support the
+syntax; callers check ``supports_update_from`` and fall back to ``Case``
+elsewhere, or use ``update_field`` which does both.
+"""
+from django.db import connections, router
+from django.db.models import Case, Value, When
+
+
+def supports_update_from(connection):
+    if connection.vendor == "postgresql":
+        return True
+    return connection.vendor == "sqlite" and connection.Database.sqlite_version_info >= (3, 33)
+
+
+def supports_update_returning(connection):
+    # Not can_return_columns_from_insert: that is about INSERT, and other
+    # backends with it (Oracle, MariaDB) have no UPDATE ... RETURNING
+    if connection.vendor == "postgresql":
+        return True
+    return connection.vendor == "sqlite" and connection.Database.sqlite_version_info >= (3, 35)
+
+
+def connection_for(model):
+    return connections[router.db_for_write(model)]
+
+
+def update_from_values(model, rows, assignments, where=None):
+    """
+    ``UPDATE`` the rows of ``model`` whose primary key is the first value of
+    one of ``rows`` (tuples of database-ready values).
+
+    ``assignments`` and ``where`` are SQL referring to the other values as
+    ``v.column2``, ``v.column3`` and so on. Statements are split to stay under
+    the backend's parameter limit. Returns the number of rows updated.
+    """
+    if not rows:
+        return 0
+    connection = connection_for(model)
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk = connection.ops.quote_name(model._meta.pk.column)
+    width = len(rows[0])
+    size = max(1, (connection.features.max_query_params or len(rows) * width) // width)
+    row_sql = f"({', '.join(['%s'] * width)})"
+    updated = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), size):
+            batch = rows[start:start + size]
+            cursor.execute(
+                f"UPDATE {table} SET {assignments} "
+                f"FROM (VALUES {', '.join([row_sql] * len(batch))}) AS v "
+                f"WHERE {table}.{pk} = v.column1" + (f" AND {where}" if where else ""),
+                [value for row in batch for value in row],
+            )
+            updated += cursor.rowcount
+    return updated
+
+
+def update_field(model, name, values, batch_size=None):
+    """
+    Set field ``name`` of the rows of ``model`` to ``values`` (a mapping of
+    primary key to value), with ``update_from_values`` where supported and
+    ``Case``/``When`` in batches of ``batch_size`` rows elsewhere.
+    """
+    if not values:
+        return 0
+    connection = connection_for(model)
+    field = model._meta.get_field(name)
+    if supports_update_from(connection):
+        return update_from_values(
+            model,
+            [(pk, field.get_db_prep_save(value, connection)) for pk, value in values.items()],
+            f"{connection.ops.quote_name(field.column)} = v.column2",
+        )
+    pks = list(values)
+    size = batch_size or len(pks)
+    updated = 0
+    for start in range(0, len(pks), size):
+        batch = pks[start:start + size]
+        updated += model._base_manager.filter(pk__in=batch).update(**{name: Case(
+            *(When(pk=pk, then=Value(values[pk], output_field=field)) for pk in batch)
+        )})
+    return updated
@@ -0,0 +1,128 @@
+"""
+Product catalog imports, keyed by SKU.
+
+Rows are validated in memory and written with ``bulk_create(update_conflicts=True)``
+on the ``sku`` unique index, so one INSERT ... ON CONFLICT DO UPDATE per batch
+both creates new products and updates existing ones, and re-running an import
+is harmless. Used by the ``bulkUpsertProducts`` mutation and the
+``import_products`` management command, which streams CSV or NDJSON files.
+
+A row is a mapping with ``sku``, ``name``, ``price`` and an optional ``stock``
+(strings, as read from a file, or values). Rows without a stock leave the
+stock of existing products unchanged; new products start at 0.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+
+from crm import search
+from crm.models import Product
+
+UPSERT_BATCH_SIZE = 1000
+
+CATALOG_FIELDS = ("name", "price")
+
+FORMATS = ("csv", "ndjson")
+
+
+def clean_product(row):
+    """
+    Validate one row. Returns ``(product, error)``; ``product.stock`` is None
+    when the row does not set it.
+    """
+    sku = str(row.get("sku") or "").strip()
+    if not sku:
+        return None, "SKU is required"
+    try:
+        price = Decimal(str(row.get("price")).strip())
+    except InvalidOperation:
+        return None, "Invalid price"
+    if not price.is_finite() or price <= 0:
+        return None, "Price must be positive"
+    stock = row.get("stock")
+    if stock is not None and str(stock).strip() != "":
+        try:
+            stock = int(str(stock).strip())
+        except (TypeError, ValueError):
+            return None, "Invalid stock"
+        if stock < 0:
+            return None, "Stock cannot be negative"
+    else:
+        stock = None
+
+    product = Product(sku=sku, name=str(row.get("name") or "").strip(), price=price, stock=stock)
+    try:
+        # The SKU conflicts are the point of an upsert, so uniqueness is not checked
+        product.clean_fields(exclude=["stock"])
+    except ValidationError as e:
+        return None, "; ".join(
+            f"{field}: {' '.join(messages)}" for field, messages in e.message_dict.items()
+        )
+    return product, None
+
+
+def upsert_products(rows, batch_size=UPSERT_BATCH_SIZE):
+    """
+    Validate ``rows`` and create or update their products by SKU.
+
+    Returns ``(products, errors)`` where ``errors`` is ``[(index, message), ...]``
+    for the rejected rows. A SKU repeated in ``rows`` takes its last values.
+    """
+    by_sku = {}
+    errors = []
+    for idx, row in enumerate(rows):
+        product, error = clean_product(row)
+        if error:
+            errors.append((idx, error))
+        else:
+            by_sku.pop(product.sku, None)
+            by_sku[product.sku] = product
+
+    for stock_given in (True, False):
+        products = [p for p in by_sku.values() if (p.stock is not None) == stock_given]
+        if not products:
+            continue
+        fields = [*CATALOG_FIELDS, "stock"] if stock_given else CATALOG_FIELDS
+        Product.objects.bulk_create(
+            [
+                # New products without a stock start at 0; existing ones keep
+                # theirs, since stock is not in update_fields
+                p if stock_given else Product(sku=p.sku, name=p.name, price=p.price, stock=0)
+                for p in products
+            ],
+            batch_size=batch_size,
+            update_conflicts=True, unique_fields=["sku"], update_fields=fields,
+        )
+    # Stored rows, not the instances: stock and rollups may differ from the input
+    skus = list(by_sku)
+    products = []
+    for start in range(0, len(skus), batch_size):
+        products.extend(Product.objects.filter(sku__in=skus[start:start + batch_size]))
+    # bulk_create sends no post_save
+    search.index(Product, products)
+    return products, errors
+
+
+def read_rows(lines, format):
+    """
+    Yield ``(row, error)`` for each record of a CSV (with a header row) or
+    NDJSON stream of text ``lines``, without reading it all into memory.
+    """
+    if format == "csv":
+        for row in csv.DictReader(lines):
+            yield row, None
+        return
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield None, "Invalid JSON"
+            continue
+        if isinstance(row, dict):
+            yield row, None
+        else:
+            yield None, "Expected a JSON object"
@@ -1,12 +1,24 @@
 from datetime import datetime
-import requests
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from crm.graphql_client import execute_batch
+
+LOW_STOCK_THRESHOLD = 10
+RESTOCK_AMOUNT = 10
+# Only this many restocked products are listed individually in the log
+RESTOCK_LOG_LIMIT = 100
+
+# Products below the threshold, counted without fetching them
+LOW_STOCK_COUNT_QUERY = """
+query lowStock($below: Decimal!) {
+    allProducts(stockLte: $below) {
+        totalCount
+    }
+}
+"""
 
 def log_crm_heartbeat():
     """
     Logs a heartbeat message every 5 minutes to confirm CRM is alive.
-    Queries the GraphQL hello endpoint using gql to satisfy checker requirements.
+    Queries the GraphQL hello field and the low-stock count in one batch.
     """
     timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
     message = f"{timestamp} CRM is alive\n"
@@ -15,54 +27,59 @@ def log_crm_heartbeat():
     with open("/tmp/crm_heartbeat_log.txt", "a") as f:
         f.write(message)
 
-    # GraphQL query using gql library
-    transport = RequestsHTTPTransport(url="http://localhost:8000/graphql", verify=False, retries=3)
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-    query = gql("""
+    # GraphQL query through the shared client
+    query = """
     query {
         hello
     }
-    """)
+    """
 
     try:
-        result = client.execute(query)
+        result, low_stock = execute_batch([
+            (query, None),
+            (LOW_STOCK_COUNT_QUERY, {"below": LOW_STOCK_THRESHOLD - 1}),
+        ])
         with open("/tmp/crm_heartbeat_log.txt", "a") as f:
             f.write(f"{timestamp} GraphQL endpoint responsive, hello: {result.get('hello')}\n")
+            f.write(f"{timestamp} Low stock products: {low_stock['allProducts']['totalCount']}\n")
     except Exception as e:
         with open("/tmp/crm_heartbeat_log.txt", "a") as f:
             f.write(f"{timestamp} GraphQL query failed: {e}\n")
 
 def update_low_stock():
     """
-    Cron job that updates low-stock products (stock < 10) by adding 10 units each.
+    Cron job that updates low-stock products (stock < LOW_STOCK_THRESHOLD) by adding
+    RESTOCK_AMOUNT units each, with a single set-based UPDATE on the server, and
+    counts the products still low afterwards in the same batched request.
     Logs updated products and stock levels to /tmp/low_stock_updates_log.txt with a timestamp.
     """
     timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
 
-    # Setup GraphQL client
-    transport = RequestsHTTPTransport(
-        url="http://localhost:8000/graphql",
-        verify=False,
-        retries=3,
-    )
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-
     # GraphQL mutation to update low-stock products
-    mutation = gql("""
-    mutation {
-        updateLowStockProducts {
+    mutation = """
+    mutation restock($threshold: Int!, $amount: Int!, $limit: Int!) {
+        updateLowStockProducts(threshold: $threshold, amount: $amount, limit: $limit) {
             updatedProducts {
                 id
                 name
                 stock
             }
+            updatedCount
             message
         }
     }
-    """)
+    """
+    variables = {
+        "threshold": LOW_STOCK_THRESHOLD,
+        "amount": RESTOCK_AMOUNT,
+        "limit": RESTOCK_LOG_LIMIT,
+    }
 
     try:
-        result = client.execute(mutation)
+        result, low_stock = execute_batch([
+            (mutation, variables),
+            (LOW_STOCK_COUNT_QUERY, {"below": LOW_STOCK_THRESHOLD - 1}),
+        ])
         updated_products = result['updateLowStockProducts']['updatedProducts']
         message = result['updateLowStockProducts']['message']
 
@@ -71,6 +88,10 @@ def update_low_stock():
             f.write(f"{timestamp} - {message}\n")
             for p in updated_products:
                 f.write(f"Product {p['name']} (ID: {p['id']}) new stock: {p['stock']}\n")
+            unlisted = result['updateLowStockProducts']['updatedCount'] - len(updated_products)
+            if unlisted > 0:
+                f.write(f"... and {unlisted} more products\n")
+            f.write(f"Products still below {LOW_STOCK_THRESHOLD}: {low_stock['allProducts']['totalCount']}\n")
 
         print("Low stock products updated successfully!")
 
@@ -4,16 +4,10 @@
 
 TIMESTAMP=$(date "+%Y-%m-%d %H:%M:%S")
 
-# Get number of customers to delete using count()
-DELETED_COUNT=$(python3 manage.py shell -c "
-from datetime import timedelta
-from django.utils import timezone
-from crm.models import Customer
+# Run from the project root whatever the cron working directory
+cd "$(dirname "$0")/../.." || exit 1
 
-cutoff_date = timezone.now() - timedelta(days=365)
-customers_to_delete = Customer.objects.filter(order__isnull=True, created_at__lte=cutoff_date)
-print(customers_to_delete.count())
-customers_to_delete.delete()
-")
+# Batched deletes; the last line is "Deleted N inactive customers (M orders)"
+RESULT=$(python3 manage.py cleanup_inactive_customers --days 365 2>&1 | tail -n 1)
 
-echo \"$TIMESTAMP - Deleted $DELETED_COUNT inactive customers\" >> /tmp/customer_cleanup_log.txt
+echo "$TIMESTAMP - $RESULT" >> /tmp/customer_cleanup_log.txt
@@ -1,55 +1,64 @@
 #!/usr/bin/env python3
 """
-Python script to query GraphQL for pending orders in the last 7 days
-and log reminders to /tmp/order_reminders_log.txt
-"""
-
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
-from datetime import datetime, timedelta
+Python script to send reminders for the orders placed since its last run
+(within the last 7 days), at most one per customer, logged to
+/tmp/order_reminders_log.txt
 
-# GraphQL endpoint
-GRAPHQL_URL = "http://localhost:8000/graphql"
+Orders are paged here by keyset cursor; the pages are read by Celery workers
+and the reminders written once all of them are in (see
+crm.tasks.send_order_reminders).
+"""
 
-# Prepare transport and client
-transport = RequestsHTTPTransport(url=GRAPHQL_URL, verify=False, retries=3)
-client = Client(transport=transport, fetch_schema_from_transport=True)
+import os
+import sys
 
-# GraphQL query to get orders in the last 7 days
-query = gql("""
-query getRecentOrders($startDate: DateTime!) {
-  allOrders(filter: {orderDateGte: $startDate}) {
+# GraphQL query reading one page of recent orders in id order
+REMINDER_QUERY = """
+query getRecentOrders($startDate: Date!, $first: Int!, $after: String) {
+  allOrders(orderDateGte: $startDate, keyset: true, first: $first, after: $after) {
     edges {
+      cursor
       node {
         id
         customer {
           email
         }
-        orderDate
       }
     }
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+  }
+}
+"""
+
+# GraphQL query paging through the same orders for their page boundaries only
+REMINDER_PAGES_QUERY = """
+query getRecentOrderPages($startDate: Date!, $first: Int!, $after: String) {
+  allOrders(orderDateGte: $startDate, keyset: true, first: $first, after: $after) {
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
   }
 }
-""")
-
-# Calculate start date
-start_date = (datetime.now() - timedelta(days=7)).isoformat()
-
-# Execute query
-try:
-    result = client.execute(query, variable_values={"startDate": start_date})
-    orders = result["allOrders"]["edges"]
-except Exception as e:
-    print(f"Error fetching orders: {e}")
-    orders = []
-
-# Logging
-timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-with open("/tmp/order_reminders_log.txt", "a") as f:
-    for order in orders:
-        order_node = order["node"]
-        order_id = order_node["id"]
-        customer_email = order_node["customer"]["email"]
-        f.write(f"{timestamp} - Order ID {order_id}, Customer {customer_email}\n")
-
-print("Order reminders processed!")
+"""
+
+
+def main():
+    from crm.tasks import send_order_reminders
+
+    try:
+        pages = send_order_reminders()
+    except Exception as e:
+        print(f"Error fetching orders: {e}")
+        return
+
+    print(f"Order reminders processed! ({pages} pages queued)")
+
+
+if __name__ == "__main__":
+    # Run as a script from cron; make the project importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    main()
@@ -1,16 +1,35 @@
 import django_filters
-from .models import Customer, Product, Order
+from django.db import connection
+
+from crm import search
+from .models import Customer, Product, Order, OrderItem
 
 # ============================================================
 # CUSTOMER FILTER
 # ============================================================
 
+def filter_search(queryset, name, value):
+    # Declared before order_by, which replaces the rank ordering when given
+    return search.search(queryset, value)
+
+
 class CustomerFilter(django_filters.FilterSet):
+    search = django_filters.CharFilter(method=filter_search)
     name_icontains = django_filters.CharFilter(field_name="name", lookup_expr="icontains")
     email_icontains = django_filters.CharFilter(field_name="email", lookup_expr="icontains")
     created_at_gte = django_filters.DateFilter(field_name="created_at", lookup_expr="gte")
     created_at_lte = django_filters.DateFilter(field_name="created_at", lookup_expr="lte")
     phone_pattern = django_filters.CharFilter(method="filter_phone_pattern")
+    order_by = django_filters.OrderingFilter(
+        fields=(
+            ('name', 'name'),
+            ('email', 'email'),
+            ('created_at', 'created_at'),
+            ('lifetime_value', 'lifetime_value'),
+            ('order_count', 'order_count'),
+            ('last_order_date', 'last_order_date'),
+        )
+    )
 
     class Meta:
         model = Customer
@@ -18,7 +37,13 @@ class CustomerFilter(django_filters.FilterSet):
 
     def filter_phone_pattern(self, queryset, name, value):
         # Example: filter phones starting with "+1"
-        return queryset.filter(phone__startswith=value)
+        queryset = queryset.filter(phone__startswith=value)
+        if value and connection.vendor == "sqlite":
+            # SQLite's case-insensitive LIKE cannot use crm_customer_phone_idx,
+            # the equivalent range on the prefix can
+            upper = value[:-1] + chr(ord(value[-1]) + 1)
+            queryset = queryset.filter(phone__gte=value, phone__lt=upper)
+        return queryset
 
 
 # ============================================================
@@ -26,11 +51,22 @@ class CustomerFilter(django_filters.FilterSet):
 # ============================================================
 
 class ProductFilter(django_filters.FilterSet):
+    search = django_filters.CharFilter(method=filter_search)
     name_icontains = django_filters.CharFilter(field_name="name", lookup_expr="icontains")
+    sku = django_filters.CharFilter(field_name="sku")
     price_gte = django_filters.NumberFilter(field_name="price", lookup_expr="gte")
     price_lte = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
     stock_gte = django_filters.NumberFilter(field_name="stock", lookup_expr="gte")
     stock_lte = django_filters.NumberFilter(field_name="stock", lookup_expr="lte")
+    order_by = django_filters.OrderingFilter(
+        fields=(
+            ('name', 'name'),
+            ('price', 'price'),
+            ('stock', 'stock'),
+            ('units_sold', 'units_sold'),
+            ('revenue', 'revenue'),
+        )
+    )
 
     class Meta:
         model = Product
@@ -42,6 +78,7 @@ class ProductFilter(django_filters.FilterSet):
 # ============================================================
 
 class OrderFilter(django_filters.FilterSet):
+    search = django_filters.CharFilter(method=filter_search)
     total_amount_gte = django_filters.NumberFilter(field_name="total_amount", lookup_expr="gte")
     total_amount_lte = django_filters.NumberFilter(field_name="total_amount", lookup_expr="lte")
     order_date_gte = django_filters.DateFilter(field_name="order_date", lookup_expr="gte")
@@ -49,13 +86,23 @@ class OrderFilter(django_filters.FilterSet):
     customer_name = django_filters.CharFilter(field_name="customer__name", lookup_expr="icontains")
     product_name = django_filters.CharFilter(method="filter_product_name")
     product_id = django_filters.NumberFilter(method="filter_product_id")
+    order_by = django_filters.OrderingFilter(
+        fields=(
+            ('total_amount', 'total_amount'),
+            ('order_date', 'order_date'),
+        )
+    )
 
     class Meta:
         model = Order
         fields = []
 
+    # Subqueries rather than joins, so an order matching several lines is
+    # returned once
     def filter_product_name(self, queryset, name, value):
-        return queryset.filter(products__name__icontains=value)
+        return queryset.filter(
+            pk__in=OrderItem.objects.filter(product__name__icontains=value).values("order_id")
+        )
 
     def filter_product_id(self, queryset, name, value):
-        return queryset.filter(products__id=value)
+        return queryset.filter(pk__in=OrderItem.objects.filter(product_id=value).values("order_id"))
@@ -0,0 +1,264 @@
+"""
+GraphQL client helpers shared by the CRM cron jobs and Celery tasks.
+
+``get_client()`` returns a process-wide client. Inside a Django process with
+the CRM app and a database (django-crontab jobs, Celery workers) it runs
+operations directly against ``crm.schema.schema``; elsewhere it talks HTTP
+over one kept-alive
+connection pool and validates against a schema cached on disk, refreshed
+only when the server reports a different schema hash.
+
+Configured with ``GRAPHQL_CLIENT`` in settings, when settings are available::
+
+    GRAPHQL_CLIENT = {
+        "MODE": "auto",         # "auto", "local" or "http"
+        "URL": GRAPHQL_URL,
+        "SCHEMA_CACHE": "/tmp/crm_graphql_schema.json",
+        "POOL_SIZE": 4,         # kept-alive connections per host
+        "RETRIES": 3,
+    }
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+
+from gql import Client, GraphQLRequest, gql
+from gql.transport.exceptions import TransportQueryError
+from gql.transport.requests import RequestsHTTPTransport
+from graphql import GraphQLError, OperationType, get_operation_ast
+from graphql import execute as execute_document
+from requests.adapters import HTTPAdapter, Retry
+
+from crm.persisted_queries import SCHEMA_HASH_HEADER
+
+GRAPHQL_URL = "http://localhost:8000/graphql/"
+
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+
+DEFAULTS = {
+    "MODE": "auto",
+    "URL": GRAPHQL_URL,
+    "SCHEMA_CACHE": os.path.join(tempfile.gettempdir(), "crm_graphql_schema.json"),
+    "POOL_SIZE": 4,
+    "RETRIES": 3,
+}
+
+
+def get_setting(name):
+    from django.conf import settings
+
+    configured = getattr(settings, "GRAPHQL_CLIENT", {}) if settings.configured else {}
+    return configured.get(name, DEFAULTS[name])
+
+
+class PersistedQueryTransport(RequestsHTTPTransport):
+    """
+    Requests transport speaking the automatic persisted query protocol.
+
+    Each operation is first sent as its SHA-256 hash only; if the server has
+    not seen it yet, it is resent once with the full query text. The session
+    keeps up to ``pool_maxsize`` connections alive between operations.
+    """
+
+    send_query = False
+
+    def __init__(self, *args, pool_maxsize=DEFAULTS["POOL_SIZE"], **kwargs):
+        self.pool_maxsize = pool_maxsize
+        super().__init__(*args, **kwargs)
+
+    def connect(self):
+        super().connect()
+        adapter = HTTPAdapter(
+            pool_maxsize=self.pool_maxsize,
+            max_retries=Retry(
+                total=self.retries,
+                backoff_factor=self.retry_backoff_factor,
+                status_forcelist=self.retry_status_forcelist,
+                allowed_methods=None,
+            ),
+        )
+        for prefix in "http://", "https://":
+            self.session.mount(prefix, adapter)
+
+    def _prepare_request(self, request, *args, **kwargs):
+        post_args = super()._prepare_request(request, *args, **kwargs)
+        payload = post_args.get("json")
+        if isinstance(payload, dict) and "query" in payload:
+            sha256 = hashlib.sha256(payload["query"].encode("utf-8")).hexdigest()
+            payload["extensions"] = {"persistedQuery": {"version": 1, "sha256Hash": sha256}}
+            if not self.send_query:
+                del payload["query"]
+        return post_args
+
+    def execute(self, request, *args, **kwargs):
+        result = super().execute(request, *args, **kwargs)
+        if any(e.get("message") == PERSISTED_QUERY_NOT_FOUND for e in result.errors or ()):
+            self.send_query = True
+            try:
+                result = super().execute(request, *args, **kwargs)
+            finally:
+                self.send_query = False
+        return result
+
+
+class HTTPClient:
+    """
+    gql client holding one connected session for the life of the process.
+
+    The server schema is read from ``schema_cache`` instead of being
+    introspected on every run, and refetched when a response carries a
+    different schema hash or local validation rejects an operation.
+    """
+
+    def __init__(self, url=None, schema_cache=None, pool_size=None, retries=None):
+        self.schema_cache = schema_cache or get_setting("SCHEMA_CACHE")
+        self.transport = PersistedQueryTransport(
+            url=url or get_setting("URL"),
+            verify=False,
+            retries=get_setting("RETRIES") if retries is None else retries,
+            pool_maxsize=pool_size or get_setting("POOL_SIZE"),
+        )
+        cached = self.load_schema()
+        self.schema_hash = cached["hash"] if cached else None
+        self.client = Client(
+            transport=self.transport,
+            introspection=cached["introspection"] if cached else None,
+            fetch_schema_from_transport=cached is None,
+        )
+        self.session = self.client.connect_sync()
+        if cached is None:
+            self.save_schema()
+        self._lock = threading.Lock()
+
+    def load_schema(self):
+        try:
+            with open(self.schema_cache) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_schema(self):
+        headers = self.transport.response_headers or {}
+        self.schema_hash = headers.get(SCHEMA_HASH_HEADER)
+        directory = os.path.dirname(os.path.abspath(self.schema_cache))
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as f:
+            json.dump({"hash": self.schema_hash, "introspection": self.client.introspection}, f)
+        os.replace(f.name, self.schema_cache)
+
+    def refresh_schema(self):
+        self.session.fetch_schema()
+        self.save_schema()
+
+    def execute(self, query, variables=None):
+        request = gql(query)
+        with self._lock:
+            try:
+                result = self.session.execute(request, variable_values=variables)
+            except GraphQLError:
+                # Validated against a stale schema; refetch and try once more
+                self.refresh_schema()
+                result = self.session.execute(request, variable_values=variables)
+            headers = self.transport.response_headers or {}
+            if headers.get(SCHEMA_HASH_HEADER, self.schema_hash) != self.schema_hash:
+                self.refresh_schema()
+        return result
+
+    def execute_batch(self, operations):
+        """
+        Send ``[(query, variables), ...]`` in a single POST; return their data in order.
+
+        Batches are sent with their full queries, not as persisted query hashes.
+        """
+        requests = [GraphQLRequest(query, variable_values=variables) for query, variables in operations]
+        with self._lock:
+            try:
+                results = self.session.execute_batch(requests)
+            except GraphQLError:
+                self.refresh_schema()
+                results = self.session.execute_batch(requests)
+            headers = self.transport.response_headers or {}
+            if headers.get(SCHEMA_HASH_HEADER, self.schema_hash) != self.schema_hash:
+                self.refresh_schema()
+        return results
+
+    def close(self):
+        self.client.close_sync()
+
+
+class LocalClient:
+    """Runs operations in this process against ``crm.schema.schema``, skipping HTTP."""
+
+    def execute(self, query, variables=None, context=None):
+        from crm import response_cache
+        from crm.loaders import reset_loaders
+        from crm.persisted_queries import get_document_cache
+        from crm.schema import schema
+
+        # A fresh context per operation gives each one its own loaders
+        context = SimpleNamespace() if context is None else context
+        document, errors = get_document_cache().get(schema.graphql_schema, query)
+        if not errors:
+            result = execute_document(
+                schema.graphql_schema, document,
+                variable_values=variables, context_value=context,
+            )
+            errors = result.errors
+            operation = get_operation_ast(document)
+            if operation is not None and operation.operation == OperationType.MUTATION:
+                # Set-based writes send no model signals, as in the view
+                response_cache.invalidate()
+                reset_loaders(context)
+        if errors:
+            raise TransportQueryError(
+                str(errors[0]), errors=[error.formatted for error in errors]
+            )
+        return result.data
+
+    def execute_batch(self, operations):
+        """Run ``[(query, variables), ...]`` in order, sharing one context and its loaders."""
+        context = SimpleNamespace()
+        return [self.execute(query, variables, context) for query, variables in operations]
+
+    def close(self):
+        pass
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def in_django_process():
+    from django.apps import apps
+    from django.conf import settings
+
+    # Celery can run under settings without the CRM app or a database
+    return apps.ready and apps.is_installed("crm") and bool(settings.DATABASES)
+
+
+def get_client():
+    """Return the shared client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            mode = get_setting("MODE")
+            if mode == "local" or (mode == "auto" and in_django_process()):
+                _client = LocalClient()
+            else:
+                _client = HTTPClient()
+        return _client
+
+
+def execute(query, variables=None):
+    """Run ``query`` with the shared client and return its data."""
+    return get_client().execute(query, variables)
+
+
+def execute_batch(operations):
+    """
+    Run ``[(query, variables), ...]`` with the shared client as one batch and
+    return their data in order. Raises TransportQueryError if any fails.
+    """
+    return get_client().execute_batch(operations)
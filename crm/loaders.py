@@ -0,0 +1,288 @@
+"""
+Per-request batching loaders for the CRM GraphQL schema.
+
+graphene-django executes synchronously, so these loaders batch by priming:
+once a page of parents is known (a connection has been sliced, or a batch
+has been loaded) the keys their children will ask for are queued, and the
+first ``load()`` that misses the cache fetches every queued key with a single
+``IN`` query.
+
+Nested connections are loaded one page per parent: a ``ROW_NUMBER()`` window
+keeps the first ``first`` rows of each parent, so the rows read grow with the
+page size, not with the parents' whole history.
+"""
+import threading
+from collections import defaultdict
+from functools import partial
+
+import graphene
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from graphene_django.filter import DjangoFilterConnectionField
+
+from crm import query_cost
+from crm.models import Customer, Order, OrderItem
+from crm.optimizer import optimize_queryset
+from crm.pagination import paginate_keyset
+
+
+class DataLoader:
+    """
+    Synchronous batching loader with a per-instance cache.
+
+    ``batch_load_fn`` receives a list of keys and returns a dict mapping each
+    key to its value; keys missing from the dict resolve to ``default()``.
+    """
+
+    def __init__(self, batch_load_fn, default=None, on_load=None, queue=None):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        self.on_load = on_load
+        self._cache = {}
+        # A queue shared between loaders is never emptied: each of them loads
+        # the keys it has not cached yet
+        self._shared = queue is not None
+        self._queue = set() if queue is None else queue
+
+    def prime(self, key, value):
+        """
+        Seed the cache with a value that was fetched some other way.
+
+        Returns False if the key was already cached.
+        """
+        if not self._shared:
+            self._queue.discard(key)
+        if key in self._cache:
+            return False
+        self._cache[key] = value
+        return True
+
+    def prime_keys(self, keys):
+        self._queue.update(key for key in keys if key not in self._cache)
+
+    def load(self, key):
+        if key not in self._cache:
+            self._queue.add(key)
+            self.dispatch()
+        return self._cache[key]
+
+    def dispatch(self):
+        keys = [key for key in self._queue if key not in self._cache]
+        if not self._shared:
+            self._queue.clear()
+        if not keys:
+            return
+        results = self.batch_load_fn(keys)
+        for key in keys:
+            value = results.get(key)
+            if value is None and self.default is not None:
+                value = self.default()
+            self._cache[key] = value
+        if self.on_load:
+            self.on_load(results.values())
+
+
+class Loaders:
+    """The set of loaders shared by every resolver of a single request."""
+
+    def __init__(self):
+        self.customer_by_id = DataLoader(
+            load_customers, on_load=self.prime,
+        )
+        # Parents whose nested connections may be asked for, by loader name
+        self.parents = defaultdict(set)
+        self._pages = {}
+
+    def page(self, name, limit):
+        """
+        Return the loader of the first ``limit`` children of each parent for
+        the nested connection ``name``, as ``Page`` objects.
+        """
+        loader = self._pages.get((name, limit))
+        if loader is None:
+            batch_load_fn, on_load = {
+                "orders_by_customer_id": (load_orders_by_customer, self.prime_pages),
+                "products_by_order_id": (load_products_by_order, None),
+            }[name]
+            loader = self._pages[name, limit] = DataLoader(
+                partial(batch_load_fn, limit=limit), default=Page,
+                on_load=on_load, queue=self.parents[name],
+            )
+        return loader
+
+    def prime_pages(self, pages):
+        self.prime(obj for page in pages for obj in page)
+
+    def prime(self, instances):
+        """
+        Queue the relation keys of freshly resolved instances.
+
+        Customers already fetched with select_related are seeded into the
+        cache instead, so they cost no further queries.
+        """
+        for obj in instances:
+            if isinstance(obj, Order):
+                if Order.customer.is_cached(obj):
+                    if self.customer_by_id.prime(obj.customer_id, obj.customer):
+                        self.prime([obj.customer])
+                elif "customer_id" not in obj.get_deferred_fields():
+                    self.customer_by_id.prime_keys([obj.customer_id])
+                self.parents["products_by_order_id"].add(obj.pk)
+            elif isinstance(obj, Customer):
+                self.parents["orders_by_customer_id"].add(obj.pk)
+
+
+def get_loaders(info):
+    """
+    Return the loaders bound to the request in ``info.context``.
+
+    Loaders are not thread-safe and the async view resolves root fields in
+    parallel worker threads, so each thread serving the request gets its own.
+    """
+    context = info.context
+    if context is None:
+        return Loaders()
+    by_thread = vars(context).setdefault("crm_loaders", {})
+    ident = threading.get_ident()
+    loaders = by_thread.get(ident)
+    if loaders is None:
+        loaders = by_thread[ident] = Loaders()
+    return loaders
+
+
+def reset_loaders(context):
+    """Drop the loaders bound to ``context``, e.g. after a mutation changed their data."""
+    if context is not None:
+        vars(context).pop("crm_loaders", None)
+
+
+# ============================================================
+# BATCH FUNCTIONS
+# ============================================================
+
+class Page:
+    """The first rows of a parent's children, sized as all of them for pagination."""
+
+    def __init__(self, items=(), total=0):
+        self.items = list(items)
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+
+def first_per_key(queryset, key, limit):
+    """
+    Narrow ``queryset`` to the first ``limit`` rows (in its ordering) for each
+    value of ``key``; every row is annotated with ``group_size``, the number
+    of rows its key has in all.
+    """
+    return queryset.annotate(
+        group_size=Window(Count("pk"), partition_by=F(key)),
+        row_number=Window(RowNumber(), partition_by=F(key), order_by=queryset.query.order_by),
+    ).filter(row_number__lte=limit)
+
+
+def pages(rows, key):
+    grouped = defaultdict(list)
+    sizes = {}
+    for row in rows:
+        grouped[key(row)].append(row)
+        sizes[key(row)] = row.group_size
+    return {k: Page(items, sizes[k]) for k, items in grouped.items()}
+
+
+def load_customers(ids):
+    return Customer.objects.in_bulk(ids)
+
+
+def load_products_by_order(order_ids, limit):
+    lines = first_per_key(
+        OrderItem.objects
+        .filter(order_id__in=order_ids)
+        .select_related("product")
+        .order_by("product_id"),
+        "order_id", limit,
+    )
+    grouped = pages(lines, lambda line: line.order_id)
+    return {
+        order_id: Page([line.product for line in page], page.total)
+        for order_id, page in grouped.items()
+    }
+
+
+def load_orders_by_customer(customer_ids, limit):
+    orders = Order.objects.filter(customer_id__in=customer_ids).order_by("id")
+    return pages(first_per_key(orders, "customer_id", limit), lambda order: order.customer_id)
+
+
+# ============================================================
+# CONNECTION FIELD
+# ============================================================
+
+class BatchedConnectionField(DjangoFilterConnectionField):
+    """
+    Filter connection field that primes the request loaders with its page.
+
+    The queryset is narrowed to the selected fields by ``optimize_queryset``.
+    With ``loader`` set, the field resolves a nested relation through that
+    loader's pages whenever only ``first`` is given; filtered or cursor-paged
+    access falls back to the regular per-parent queryset. With ``keyset_pagination`` the field
+    accepts ``keyset: true`` to page with column cursors instead of offsets.
+
+    Pages hold ``GRAPHQL_QUERY_COST["DEFAULT_PAGE_SIZE"]`` nodes unless
+    ``first`` or ``last`` is given, at every nesting level, so the cost
+    estimate of an unsized connection is also its real size; clients page on
+    with ``after``. Pages never hold more than ``max_limit`` (graphene-django's
+    ``RELAY_CONNECTION_MAX_LIMIT``).
+    """
+
+    def __init__(self, type_, *args, loader=None, keyset_pagination=False, **kwargs):
+        self.loader = loader
+        self.keyset_pagination = keyset_pagination
+        if keyset_pagination:
+            kwargs.setdefault("keyset", graphene.Boolean(
+                description="Page with keyset cursors (sort key + id); skips COUNT(*)."
+            ))
+        super().__init__(type_, *args, **kwargs)
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, **kwargs):
+        queryset = super().resolve_queryset(connection, iterable, info, args, **kwargs)
+        return optimize_queryset(queryset, info)
+
+    def wrap_resolve(self, parent_resolver):
+        resolve = super().wrap_resolve(parent_resolver)
+
+        def batched_resolve(root, info, **args):
+            if args.get("first") is None and args.get("last") is None:
+                args["first"] = min(query_cost.get_setting("DEFAULT_PAGE_SIZE"), self.max_limit)
+            loaders = get_loaders(info)
+            first = args.get("first")
+            paged = first is not None and 0 <= first <= self.max_limit and not any(
+                args.get(name) is not None
+                for name in (*self.filtering_args, "last", "after", "before", "offset")
+            )
+            if self.loader and root is not None and paged:
+                instances = loaders.page(self.loader, first).load(root.pk)
+                connection = self.resolve_connection(
+                    self.connection_type, args, instances, max_limit=self.max_limit
+                )
+            elif self.keyset_pagination and args.get("keyset"):
+                iterable = (self.resolver or parent_resolver)(root, info, **args)
+                if iterable is None:
+                    iterable = self.get_manager()
+                queryset = self.get_queryset_resolver()(self.connection_type, iterable, info, args)
+                connection = paginate_keyset(queryset, args, self.connection_type, self.max_limit)
+            else:
+                connection = resolve(root, info, **args)
+            loaders.prime(edge.node for edge in getattr(connection, "edges", ()))
+            return connection
+
+        return batched_resolve
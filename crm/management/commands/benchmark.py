@@ -0,0 +1,88 @@
+import json
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from crm.benchmarks import BENCHMARKS, compare
+from crm.models import Customer, Order, Product
+from crm.seed_db import seed
+
+
+def holds_dataset(dataset):
+    """Whether the database has the row counts seeding ``dataset`` produces."""
+    return (
+        Customer.objects.count() == dataset["customers"]
+        and Product.objects.count() == dataset["products"]
+        and Order.objects.count() == dataset["orders"]
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and run the CRM GraphQL benchmarks, "
+        "e.g. --customers 100000 --products 10000 --orders 1000000."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help=f"Any of: {', '.join(BENCHMARKS)}")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--customers", type=int, default=1000)
+        parser.add_argument("--products", type=int, default=100)
+        parser.add_argument("--orders", type=int, default=10000)
+        parser.add_argument("--lines-per-order", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--keepdb", action="store_true", help="Reuse an existing test database")
+        parser.add_argument("--output", help="Write the results as JSON to this path")
+        parser.add_argument("--baseline", help="Fail if results regress against this JSON file")
+        parser.add_argument("--tolerance", type=float, default=0.25)
+
+    def handle(self, *args, names, **options):
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options["keepdb"], serialize=False
+        )
+        try:
+            dataset = {
+                "customers": options["customers"],
+                "products": options["products"],
+                "orders": options["orders"],
+                "lines_per_order": options["lines_per_order"],
+                "seed": options["seed"],
+            }
+            # create_test_db has migrated even a new kept database; look for rows
+            if not options["keepdb"] or not Customer.objects.exists():
+                seed(**dataset)
+            elif not holds_dataset(dataset):
+                raise CommandError(
+                    "The kept test database holds a different dataset; "
+                    "run without --keepdb to reseed it."
+                )
+            results = {
+                "dataset": dataset,
+                "vendor": connection.vendor,
+                "python": platform.python_version(),
+                "results": {},
+            }
+            for name in names or BENCHMARKS:
+                stats = BENCHMARKS[name](options["iterations"])
+                results["results"][name] = stats
+                self.stdout.write(f"{name}: " + ", ".join(
+                    f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                    for key, value in stats.items()
+                ))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                regressions = compare(results, json.load(f), options["tolerance"])
+            if regressions:
+                raise CommandError("Regressions:\n" + "\n".join(regressions))
+            self.stdout.write("No regressions against the baseline.")
@@ -0,0 +1,90 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from crm import response_cache, rollups
+from crm.models import Customer, Order, OrderItem, Product
+
+
+def inactive_customers(cutoff):
+    """Customers created before ``cutoff`` with no order since, as an anti-join."""
+    recent_orders = Order.objects.filter(customer=OuterRef("pk"), order_date__gte=cutoff)
+    return Customer.objects.filter(created_at__lt=cutoff).filter(~Exists(recent_orders))
+
+
+def delete_customers(customers):
+    """
+    Delete the ``customers`` queryset with their orders and order lines, and
+    take the lines out of the product rollups. Run inside a transaction.
+
+    Returns the number of customers and of orders deleted.
+    """
+    product_ids = list(
+        OrderItem.objects.filter(order__customer__in=customers)
+        .order_by().values_list("product_id", flat=True).distinct()
+    )
+    # Signals keep the search index in sync; line deletes skip the order
+    # totals since their orders go too
+    _, deleted = customers.delete()
+    rollups.rebuild_products(Product.objects.filter(pk__in=product_ids))
+    return deleted.get(Customer._meta.label, 0), deleted.get(Order._meta.label, 0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete customers with no orders in the last --days days (and created "
+        "before then), with their old orders, in short batched transactions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--rate", type=float, default=0,
+            help="Delete at most this many customers per second (0: no limit)",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only count what would be deleted"
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+
+        customers = orders = batches = 0
+        last = 0
+        start = time.monotonic()
+        while True:
+            with transaction.atomic():
+                # Selected and deleted in one transaction, with the rows locked
+                # where supported, so a customer who orders meanwhile is kept
+                candidates = inactive_customers(cutoff).filter(pk__gt=last).order_by("pk")
+                if not options["dry_run"]:
+                    candidates = candidates.select_for_update()
+                ids = list(candidates.values_list("pk", flat=True)[:options["batch_size"]])
+                if not ids:
+                    break
+                last = ids[-1]
+                if options["dry_run"]:
+                    deleted = len(ids), Order.objects.filter(customer_id__in=ids).count()
+                else:
+                    deleted = delete_customers(inactive_customers(cutoff).filter(pk__in=ids))
+            if not options["dry_run"]:
+                response_cache.invalidate(Customer, Order, Product)
+            customers += deleted[0]
+            orders += deleted[1]
+            batches += 1
+            if options["verbosity"] > 1:
+                self.stdout.write(f"batch {batches}: {customers} customers, {orders} orders")
+            if options["rate"]:
+                ahead = customers / options["rate"] - (time.monotonic() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+        self.stdout.write(f"{verb} {customers} inactive customers ({orders} orders)")
@@ -0,0 +1,70 @@
+import os
+import sys
+from contextlib import nullcontext
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from crm import catalog, response_cache
+from crm.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update products by SKU from a CSV (with a header row) or "
+        "NDJSON file, streamed in batches of --batch-size rows, one transaction "
+        "per batch. Columns: sku, name, price and optionally stock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for stdin")
+        parser.add_argument(
+            "--format", choices=catalog.FORMATS,
+            help="Defaults to the file extension (.csv, .ndjson or .jsonl)",
+        )
+        parser.add_argument("--batch-size", type=int, default=catalog.UPSERT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        path = options["path"]
+        format = options["format"]
+        if format is None:
+            extension = os.path.splitext(path)[1].lower()
+            format = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}.get(extension)
+            if format is None:
+                raise CommandError("Cannot tell the format from the file name; pass --format")
+
+        try:
+            source = nullcontext(sys.stdin) if path == "-" else open(path, newline="", encoding="utf-8")
+        except OSError as e:
+            raise CommandError(e)
+        upserted = failed = 0
+        with source as f:
+            # Rows are numbered from 1 in file order, whatever batch they fall in
+            records = enumerate(catalog.read_rows(f, format), 1)
+            while True:
+                batch = list(islice(records, options["batch_size"]))
+                if not batch:
+                    break
+                rows, numbers = [], []
+                for number, (row, error) in batch:
+                    if error:
+                        failed += 1
+                        self.stderr.write(f"[{number}] {error}")
+                    else:
+                        rows.append(row)
+                        numbers.append(number)
+                with transaction.atomic():
+                    products, errors = catalog.upsert_products(rows)
+                for idx, error in errors:
+                    self.stderr.write(f"[{numbers[idx]}] {error}")
+                upserted += len(products)
+                failed += len(errors)
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"{upserted} products upserted, {failed} rows rejected")
+
+        # Bulk writes send no model signals
+        response_cache.invalidate(Product)
+        self.stdout.write(f"Upserted {upserted} products ({failed} rows rejected)")
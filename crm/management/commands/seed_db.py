@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.seed_db import seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Add synthetic customers, products and orders (with their product lines), "
+        "e.g. --customers 100000 --products 10000 --orders 1000000 --processes 8."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=0)
+        parser.add_argument("--products", type=int, default=0)
+        parser.add_argument("--orders", type=int, default=0)
+        parser.add_argument("--lines-per-order", type=int, default=3)
+        parser.add_argument("--days", type=int, default=365, help="Spread order dates over this many days")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--processes", type=int, default=1,
+            help="Insert partitions in parallel (ignored on SQLite)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            seed(
+                customers=options["customers"],
+                products=options["products"],
+                orders=options["orders"],
+                lines_per_order=options["lines_per_order"],
+                days=options["days"],
+                seed=options["seed"],
+                processes=options["processes"],
+                progress=self.stdout.write if options["verbosity"] else None,
+            )
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS("Database seeded successfully!"))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-17 09:30
+
+from datetime import datetime, timezone
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery
+
+# Stand-in for customers who predate created_at and never ordered, so the
+# inactive customer cleanup treats them as old rather than as new signups
+UNKNOWN_CREATED_AT = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+def backfill_created_at(apps, schema_editor):
+    Customer = apps.get_model("crm", "Customer")
+    Order = apps.get_model("crm", "Order")
+    first_order = (
+        Order.objects.filter(customer=OuterRef("pk"))
+        .order_by().values("customer").annotate(first=Min("order_date")).values("first")
+    )
+    customers = Customer.objects.all()
+    customers.filter(orders__isnull=True).update(created_at=UNKNOWN_CREATED_AT)
+    customers.filter(orders__isnull=False).update(created_at=Subquery(first_order))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['created_at', 'id'], name='crm_customer_created_idx'),
+        ),
+    ]
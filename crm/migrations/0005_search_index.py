@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 13:20
+
+from django.db import migrations
+
+import crm.search
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_orderitem'),
+    ]
+
+    operations = [
+        # FTS5 tables on SQLite, tsvector and trigram indexes on PostgreSQL
+        migrations.RunPython(crm.search.install, crm.search.uninstall),
+    ]
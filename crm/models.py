@@ -1,4 +1,8 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.core.validators import RegexValidator, MinValueValidator
 
 class Customer(models.Model):
@@ -14,28 +18,109 @@ class Customer(models.Model):
             )
         ]
     )
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Sales rollups, maintained by crm.rollups
+    lifetime_value = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    last_order_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # CustomerFilter: order_by name, phone_pattern prefix match
+            models.Index(fields=["name", "id"], name="crm_customer_name_idx"),
+            # CustomerFilter order_by on the rollups ("top customers")
+            models.Index(fields=["lifetime_value", "id"], name="crm_customer_ltv_idx"),
+            models.Index(fields=["order_count", "id"], name="crm_customer_order_count_idx"),
+            models.Index(fields=["last_order_date", "id"], name="crm_customer_last_order_idx"),
+            # CustomerFilter created_at ranges and order_by; inactive cleanup
+            models.Index(fields=["created_at", "id"], name="crm_customer_created_idx"),
+            models.Index(
+                fields=["phone"], name="crm_customer_phone_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 class Product(models.Model):
+    # Natural key for catalog imports; products created by hand may have none
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
     stock = models.PositiveIntegerField(default=0)
+    # Sales rollups, maintained by crm.rollups
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            # ProductFilter: price/stock ranges and every order_by option
+            models.Index(fields=["name", "id"], name="crm_product_name_idx"),
+            models.Index(fields=["price", "id"], name="crm_product_price_idx"),
+            models.Index(fields=["stock", "id"], name="crm_product_stock_idx"),
+            models.Index(fields=["units_sold", "id"], name="crm_product_units_sold_idx"),
+            models.Index(fields=["revenue", "id"], name="crm_product_revenue_idx"),
+            # UpdateLowStockProducts with the default threshold
+            models.Index(
+                fields=["stock"], name="crm_product_low_stock_idx",
+                condition=models.Q(stock__lt=10),
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="orders")
-    products = models.ManyToManyField(Product, related_name="orders")
+    products = models.ManyToManyField(Product, through="OrderItem", related_name="orders")
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     order_date = models.DateTimeField(auto_now_add=True)
 
-    def save(self, *args, **kwargs):
-        # Calculate total_amount from product prices
-        self.total_amount = sum([p.price for p in self.products.all()])
-        super().save(*args, **kwargs)
+    class Meta:
+        indexes = [
+            # OrderFilter ranges and order_by; id breaks ties for keyset paging
+            models.Index(fields=["order_date", "id"], name="crm_order_date_idx"),
+            models.Index(fields=["total_amount", "id"], name="crm_order_total_idx"),
+            models.Index(fields=["customer", "order_date"], name="crm_order_customer_date_idx"),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.customer.name}"
+
+
+class OrderItem(models.Model):
+    """
+    One product line of an order, with the price it was sold at.
+
+    ``Order.total_amount`` is the sum of ``quantity * unit_price`` over the
+    order's lines; ``crm.signals`` keeps it up to date as lines change.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="order_items")
+    quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        unique_together = [("order", "product")]
+
+    @property
+    def line_total(self):
+        return self.quantity * self.unit_price
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} @ {self.unit_price}"
+
+
+def update_order_totals(order_ids):
+    """Recompute ``total_amount`` of ``order_ids`` from their lines in one UPDATE."""
+    output_field = DecimalField(max_digits=10, decimal_places=2)
+    line_totals = (
+        OrderItem.objects.filter(order=OuterRef("pk"))
+        .values("order")
+        .annotate(total=Sum(F("quantity") * F("unit_price"), output_field=output_field))
+        .values("total")
+    )
+    return Order.objects.filter(pk__in=order_ids).update(
+        total_amount=Coalesce(Subquery(line_totals), Value(Decimal("0")), output_field=output_field)
+    )
@@ -0,0 +1,81 @@
+"""
+Selection-set driven queryset optimization for the CRM connection fields.
+
+The GraphQL selection under ``edges { node { ... } }`` (fragments included)
+is mapped onto the model: scalar fields become ``only()`` and forward
+foreign keys become ``select_related()``. To-many relations are paged
+connections, which a prefetch cannot limit per parent; their fields load one
+page per parent through the request loaders (``crm.loaders``).
+"""
+from django.core.exceptions import FieldDoesNotExist
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+def optimize_queryset(queryset, info):
+    """Apply only/select_related for the fields ``info`` selects."""
+    fields = connection_node_fields(info.field_nodes, info.fragments)
+    only, select = plan(queryset.model, fields, info.fragments)
+    if only:
+        queryset = queryset.only(*only)
+    if select:
+        queryset = queryset.select_related(*select)
+    return queryset
+
+
+def selected_fields(nodes, fragments):
+    """Merge the sub-selections of ``nodes`` into ``{name: [FieldNode, ...]}``."""
+    fields = {}
+
+    def visit(selection_set):
+        if selection_set is None:
+            return
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                fields.setdefault(selection.name.value, []).append(selection)
+            elif isinstance(selection, InlineFragmentNode):
+                visit(selection.selection_set)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = fragments.get(selection.name.value)
+                if fragment is not None:
+                    visit(fragment.selection_set)
+
+    for node in nodes:
+        visit(node.selection_set)
+    return fields
+
+
+def connection_node_fields(nodes, fragments):
+    edges = selected_fields(nodes, fragments).get("edges", [])
+    return selected_fields(selected_fields(edges, fragments).get("node", []), fragments)
+
+
+def plan(model, fields, fragments, prefix=""):
+    """
+    Return ``(only, select_related)`` lookups for ``fields``.
+
+    Nested forward relations are folded into the same lists under ``prefix``.
+    """
+    only, select = [], []
+    for name, nodes in fields.items():
+        try:
+            field = model._meta.get_field(to_snake_case(name))
+        except FieldDoesNotExist:
+            continue
+
+        if field.many_to_many or field.one_to_many:
+            continue
+        if field.many_to_one or field.one_to_one:
+            if not field.concrete:
+                continue
+            only.append(prefix + field.name)
+            select.append(prefix + field.name)
+            nested = selected_fields(nodes, fragments)
+            nested_only, nested_select = plan(
+                field.related_model, nested, fragments, prefix + field.name + "__"
+            )
+            only.extend(nested_only)
+            select.extend(nested_select)
+        elif field.concrete:
+            only.append(prefix + field.name)
+    return only, select
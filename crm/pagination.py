@@ -0,0 +1,168 @@
+"""
+Keyset (seek) pagination for the CRM connection fields.
+
+Keyset cursors encode the values of the ordering columns plus the primary
+key, so a page is fetched with ``WHERE (sort, id) > (cursor)`` over an index
+instead of an OFFSET scan, and no ``COUNT(*)`` is run unless ``totalCount``
+is selected. NULLs in nullable sort columns sort as the smallest value on
+every backend, both in the page ordering and in the seek condition.
+"""
+import base64
+import binascii
+import json
+
+import graphene
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from graphene.relay import PageInfo
+from graphql import GraphQLError
+
+CURSOR_PREFIX = "keyset:"
+
+
+class CountableConnection(graphene.relay.Connection):
+    """Connection with a ``totalCount`` that is only counted when selected."""
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(root, info):
+        if getattr(root, "length", None) is None:
+            root.length = root.iterable.count()
+        return root.length
+
+
+def ordering_keys(queryset):
+    """Return the queryset ordering as ``[(field, descending), ...]``, ending with pk."""
+    model = queryset.model
+    keys = []
+    for name in queryset.query.order_by or model._meta.ordering:
+        if not isinstance(name, str) or "__" in name:
+            raise GraphQLError("Keyset pagination only supports ordering on model fields")
+        descending = name.startswith("-")
+        name = name.lstrip("-+")
+        if name in ("pk", model._meta.pk.name):
+            break
+        try:
+            model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # e.g. the search rank
+            raise GraphQLError("Keyset pagination only supports ordering on model fields")
+        keys.append((name, descending))
+    keys.append(("pk", keys[0][1] if keys else False))
+    return keys
+
+
+def encode_cursor(keys, obj):
+    values = []
+    for name, _ in keys:
+        value = getattr(obj, name)
+        # str() keeps datetimes and decimals at full precision
+        values.append(value if value is None or isinstance(value, (int, str)) else str(value))
+    payload = CURSOR_PREFIX + json.dumps(values)
+    return base64.b64encode(payload.encode()).decode()
+
+
+def decode_cursor(keys, model, cursor):
+    try:
+        payload = base64.b64decode(cursor).decode()
+        if not payload.startswith(CURSOR_PREFIX):
+            raise ValueError(cursor)
+        values = json.loads(payload[len(CURSOR_PREFIX):])
+        if len(values) != len(keys):
+            raise ValueError(cursor)
+        return [
+            (model._meta.pk if name == "pk" else model._meta.get_field(name)).to_python(value)
+            for (name, _), value in zip(keys, values)
+        ]
+    except (binascii.Error, UnicodeDecodeError, ValueError, ValidationError):
+        raise GraphQLError(f"Invalid keyset cursor: {cursor}")
+
+
+def nullable_keys(model, keys):
+    return {name for name, _ in keys if name != "pk" and model._meta.get_field(name).null}
+
+
+def beyond(name, lookup, value, nullable):
+    """Q for ``name`` strictly greater (``gt``) or less (``lt``) than ``value``, NULL lowest."""
+    if value is None:
+        return Q(**{f"{name}__isnull": False}) if lookup == "gt" else Q(pk__in=[])
+    term = Q(**{f"{name}__{lookup}": value})
+    if lookup == "lt" and name in nullable:
+        term |= Q(**{f"{name}__isnull": True})
+    return term
+
+
+def seek(keys, values, forward, nullable=()):
+    """Q matching rows strictly after (or before) ``values`` in ``keys`` order."""
+    condition = None
+    equal = Q()
+    for (name, descending), value in zip(keys, values):
+        lookup = "lt" if descending == forward else "gt"
+        term = equal & beyond(name, lookup, value, nullable)
+        condition = term if condition is None else condition | term
+        equal &= Q(**{f"{name}__isnull": True} if value is None else {name: value})
+    return condition
+
+
+def paginate_keyset(queryset, args, connection_type, max_limit=None):
+    """Build a page of ``connection_type`` from ``queryset`` using keyset cursors."""
+    first, last = args.get("first"), args.get("last")
+    after, before = args.get("after"), args.get("before")
+    if first is not None and last is not None:
+        raise GraphQLError("Keyset pagination takes either `first` or `last`, not both")
+    if args.get("offset") is not None:
+        raise GraphQLError("Keyset pagination does not support `offset`")
+
+    backward = last is not None
+    size = last if backward else first
+    if size is None:
+        size = max_limit
+    elif max_limit is not None and size > max_limit:
+        raise GraphQLError(
+            f"Requesting {size} records exceeds the limit of {max_limit} records"
+        )
+
+    keys = ordering_keys(queryset)
+    loaded, defer = queryset.query.deferred_loading
+    if not defer:
+        # Cursor columns must be loaded alongside the fields picked by only()
+        queryset = queryset.only(*loaded, *(name for name, _ in keys))
+
+    nullable = nullable_keys(queryset.model, keys)
+    page = queryset
+    if after:
+        page = page.filter(seek(keys, decode_cursor(keys, queryset.model, after), True, nullable))
+    if before:
+        page = page.filter(seek(keys, decode_cursor(keys, queryset.model, before), False, nullable))
+    ordering = []
+    for name, descending in keys:
+        if name in nullable:
+            column = F(name)
+            ordering.append(
+                column.desc(nulls_last=True) if descending != backward else column.asc(nulls_first=True)
+            )
+        else:
+            ordering.append(("-" if descending != backward else "") + name)
+    page = page.order_by(*ordering)
+    rows = list(page[:size + 1] if size is not None else page)
+    has_more = size is not None and len(rows) > size
+    rows = rows[:size]
+    if backward:
+        rows.reverse()
+
+    edges = [connection_type.Edge(node=row, cursor=encode_cursor(keys, row)) for row in rows]
+    connection = connection_type(
+        edges=edges,
+        page_info=PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_more if backward else bool(after),
+            has_next_page=bool(before) if backward else has_more,
+        ),
+    )
+    connection.iterable = queryset
+    connection.length = None
+    return connection
@@ -0,0 +1,147 @@
+"""
+Automatic persisted queries and the parsed-document cache for the GraphQL view.
+
+Clients may send ``extensions.persistedQuery.sha256Hash`` instead of the query
+text (Apollo APQ protocol). Hash-to-text mappings live in the default Django
+cache, which all workers share when it is Redis (``CACHE_REDIS_URL``); with the
+per-process fallback a worker that has not seen a hash answers
+``PersistedQueryNotFound`` and the client resends the query. Parsed and
+validated documents are kept in a per-process LRU so repeated queries skip
+parsing and validation entirely.
+
+Configured with ``GRAPHQL_PERSISTED_QUERIES`` in settings::
+
+    GRAPHQL_PERSISTED_QUERIES = {
+        "CACHE_SIZE": 256,        # parsed documents kept per process
+        "TIMEOUT": None,          # seconds a registered hash is remembered
+        "ALLOWLIST": None,        # path to a JSON manifest {sha256: query}
+        "ALLOWLIST_ONLY": False,  # reject every query not in the manifest
+    }
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from graphql import GraphQLError, parse, print_schema, validate
+
+DEFAULTS = {
+    "CACHE_SIZE": 256,
+    "TIMEOUT": None,
+    "ALLOWLIST": None,
+    "ALLOWLIST_ONLY": False,
+}
+
+CACHE_KEY_PREFIX = "crm:persisted-query:"
+
+NOT_FOUND = "PersistedQueryNotFound"
+
+# Response header carrying ``schema_hash()``
+SCHEMA_HASH_HEADER = "X-GraphQL-Schema-Hash"
+
+
+def get_setting(name):
+    return getattr(settings, "GRAPHQL_PERSISTED_QUERIES", {}).get(name, DEFAULTS[name])
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def schema_hash(graphql_schema):
+    """Hash of the printed schema, sent to clients to invalidate their cached copy."""
+    return query_hash(print_schema(graphql_schema))
+
+
+@lru_cache(maxsize=None)
+def load_allowlist(path):
+    """Return the ``{sha256: query}`` manifest at ``path``."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_allowlist():
+    path = get_setting("ALLOWLIST")
+    return load_allowlist(str(path)) if path else {}
+
+
+class PersistedQueryError(Exception):
+    def __init__(self, message, status=200):
+        self.message = message
+        self.status = status
+        super().__init__(message)
+
+
+def resolve_query(query, extensions):
+    """
+    Return the query text for a request, registering or looking up its hash.
+
+    Raises PersistedQueryError when the hash is unknown, does not match the
+    query, or the query is not allow-listed.
+    """
+    persisted = (extensions or {}).get("persistedQuery")
+    allowlist = get_allowlist()
+    if persisted:
+        sha256 = persisted.get("sha256Hash")
+        if not sha256:
+            raise PersistedQueryError("persistedQuery requires a sha256Hash", status=400)
+        if query:
+            if query_hash(query) != sha256:
+                raise PersistedQueryError("provided sha does not match query", status=400)
+            if sha256 not in allowlist:
+                cache.set(CACHE_KEY_PREFIX + sha256, query, get_setting("TIMEOUT"))
+        else:
+            query = allowlist.get(sha256) or cache.get(CACHE_KEY_PREFIX + sha256)
+            if query is None:
+                raise PersistedQueryError(NOT_FOUND)
+    if query and get_setting("ALLOWLIST_ONLY") and query_hash(query) not in allowlist:
+        raise PersistedQueryError("Query is not in the allow-list", status=403)
+    return query
+
+
+class DocumentCache:
+    """Thread-safe LRU of parsed documents and their validation errors."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, schema, query, validation_rules=None, max_errors=None):
+        """Parse and validate ``query`` once, then serve it from the cache."""
+        key = (query_hash(query), id(schema), tuple(validation_rules or ()))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        try:
+            document = parse(query)
+        except GraphQLError as e:
+            entry = (None, [e])
+        else:
+            entry = (document, validate(schema, document, validation_rules, max_errors))
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+
+_documents = None
+
+
+def get_document_cache():
+    """Return the process-wide document cache (views are instantiated per request)."""
+    global _documents
+    if _documents is None:
+        _documents = DocumentCache(get_setting("CACHE_SIZE"))
+    return _documents
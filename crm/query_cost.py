@@ -0,0 +1,178 @@
+"""
+Query cost analysis for the CRM GraphQL API.
+
+The cost of an operation is the sum of its field weights, where everything
+below a connection's ``edges`` is multiplied by the page size requested with
+``first``/``last`` (or ``DEFAULT_PAGE_SIZE``, the size ``BatchedConnectionField``
+gives pages without either). Scalars are free, object fields
+cost 1 unless ``FIELD_WEIGHTS`` says otherwise, and introspection is ignored.
+Operations over budget are rejected during validation, before any resolver
+runs; the view reports the computed cost in ``extensions.cost``.
+
+Configured with ``GRAPHQL_QUERY_COST`` in settings::
+
+    GRAPHQL_QUERY_COST = {
+        "MAX_COST": 10000,
+        "MAX_BATCH_COST": 10000,  # all operations of a batched request together
+        "MAX_DEPTH": 15,
+        "DEFAULT_PAGE_SIZE": 20,  # page size of connections without first/last
+    }
+
+The maximum page size is graphene-django's ``RELAY_CONNECTION_MAX_LIMIT``.
+"""
+from django.conf import settings
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    IntValueNode,
+    OperationDefinitionNode,
+    VariableNode,
+    get_named_type,
+    is_leaf_type,
+)
+from graphql.validation import ValidationRule
+
+DEFAULTS = {
+    "MAX_COST": 10000,
+    "MAX_BATCH_COST": 10000,
+    "MAX_DEPTH": 15,
+    "DEFAULT_PAGE_SIZE": 20,
+}
+
+# Fields that are more expensive than one row fetch, by type and field name
+FIELD_WEIGHTS = {
+    "Query": {"allCustomers": 2, "allProducts": 2, "allOrders": 2, "crmStats": 5},
+    "OrderNode": {"customer": 1, "products": 2},
+    "CustomerNode": {"orders": 2},
+    "ProductNode": {},
+}
+
+
+def get_setting(name):
+    return getattr(settings, "GRAPHQL_QUERY_COST", {}).get(name, DEFAULTS[name])
+
+
+def is_connection(graphql_type):
+    fields = getattr(graphql_type, "fields", None) or {}
+    return "edges" in fields and "pageInfo" in fields
+
+
+def page_size(node, variables):
+    for name in ("first", "last"):
+        for argument in node.arguments:
+            if argument.name.value != name:
+                continue
+            value = argument.value
+            if isinstance(value, VariableNode):
+                # Variables are not coerced yet; GraphQL rejects bad ones later
+                value = (variables or {}).get(value.name.value)
+            elif isinstance(value, IntValueNode):
+                value = int(value.value)
+            else:
+                value = None
+            if isinstance(value, int) and not isinstance(value, bool):
+                # Negative sizes are rejected by the connection, but must not
+                # lower the cost of the rest of the operation meanwhile
+                return max(value, 0)
+    return get_setting("DEFAULT_PAGE_SIZE")
+
+
+def selection_cost(schema, parent_type, selection_set, fragments, variables, depth, size=1):
+    """Return ``(cost, depth)`` of ``selection_set`` on ``parent_type``."""
+    cost = 0
+    max_depth = depth
+    fields = getattr(parent_type, "fields", {})
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            name = selection.name.value
+            if name.startswith("__") or name not in fields:
+                continue
+            field_type = get_named_type(fields[name].type)
+            if is_leaf_type(field_type) or selection.selection_set is None:
+                max_depth = max(max_depth, depth + 1)
+                continue
+            weight = FIELD_WEIGHTS.get(parent_type.name, {}).get(name, 1)
+            child_size = page_size(selection, variables) if is_connection(field_type) else 1
+            child_cost, child_depth = selection_cost(
+                schema, field_type, selection.selection_set, fragments, variables,
+                depth + 1, child_size,
+            )
+            multiplier = size if name == "edges" else 1
+            cost += multiplier * (weight + child_cost)
+        else:
+            if isinstance(selection, FragmentSpreadNode):
+                fragment = fragments.get(selection.name.value)
+                if fragment is None:
+                    continue
+            else:
+                fragment = selection
+            condition = fragment.type_condition
+            fragment_type = schema.get_type(condition.name.value) if condition else parent_type
+            if fragment_type is None:
+                continue
+            child_cost, child_depth = selection_cost(
+                schema, fragment_type, fragment.selection_set, fragments, variables, depth, size,
+            )
+            cost += child_cost
+        max_depth = max(max_depth, child_depth)
+    return cost, max_depth
+
+
+def operation_cost(schema, operation, fragments, variables=None):
+    """Return ``(cost, depth)`` of an operation definition."""
+    root_type = schema.get_root_type(operation.operation)
+    return selection_cost(schema, root_type, operation.selection_set, fragments, variables, 0)
+
+
+def query_cost_validator(
+    max_cost=None, max_depth=None, variables=None, operation_name=None, callback=None
+):
+    """
+    Return a validation rule rejecting operations over ``max_cost`` or nested
+    deeper than ``max_depth`` (both default to the settings).
+
+    ``variables`` supply the page sizes given as variables, ``operation_name``
+    limits the check to the operation being executed, and ``callback``
+    receives ``{operation_name: {"cost": ..., "depth": ...}}``, like graphene's
+    ``depth_limit_validator``.
+    """
+    max_cost = get_setting("MAX_COST") if max_cost is None else max_cost
+    max_depth = get_setting("MAX_DEPTH") if max_depth is None else max_depth
+
+    class QueryCostValidator(ValidationRule):
+        def __init__(self, validation_context):
+            super().__init__(validation_context)
+            definitions = validation_context.document.definitions
+            fragments = {
+                definition.name.value: definition
+                for definition in definitions
+                if isinstance(definition, FragmentDefinitionNode)
+            }
+            costs = {}
+            for definition in definitions:
+                if not isinstance(definition, OperationDefinitionNode):
+                    continue
+                name = definition.name.value if definition.name else ""
+                if operation_name and name != operation_name:
+                    continue
+                cost, depth = operation_cost(
+                    validation_context.schema, definition, fragments, variables
+                )
+                costs[name] = {"cost": cost, "depth": depth}
+                if cost > max_cost:
+                    validation_context.report_error(GraphQLError(
+                        f"'{name or 'anonymous'}' has a cost of {cost}, "
+                        f"exceeding the maximum of {max_cost}.",
+                        definition,
+                    ))
+                if depth > max_depth:
+                    validation_context.report_error(GraphQLError(
+                        f"'{name or 'anonymous'}' exceeds maximum operation depth of {max_depth}.",
+                        definition,
+                    ))
+            if callable(callback):
+                callback(costs)
+
+    return QueryCostValidator
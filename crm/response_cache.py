@@ -0,0 +1,150 @@
+"""
+Result cache for read-only GraphQL operations.
+
+Responses are keyed on the normalized document, variables and operation name
+plus a generation number for every model the root fields depend on. Writes
+bump the generations (``crm.signals`` for ORM saves and deletes, the view
+after every mutation for set-based updates that send no signals), so stale
+entries are never read again and simply age out of the cache backend, which
+provides the TTL and LRU eviction.
+
+Writes happen in every web worker, Celery worker and management command, so
+the generations only protect readers that share their cache. A per-process
+``LocMemCache`` (as the default cache or ``ALIAS``) is therefore only used
+with ``SINGLE_PROCESS``, for sites where one process serves and writes
+everything; otherwise every query is executed.
+
+Configured with ``GRAPHQL_RESPONSE_CACHE`` in settings::
+
+    GRAPHQL_RESPONSE_CACHE = {
+        "ENABLED": True,
+        "ALIAS": "graphql",       # entry in CACHES used for responses
+        "TIMEOUT": 60,            # seconds a response is served
+        "SINGLE_PROCESS": False,  # allow per-process caches
+    }
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from graphql import FieldNode, OperationType, print_ast
+
+from crm.models import Customer, Order, Product
+
+DEFAULTS = {
+    "ENABLED": True,
+    "ALIAS": "default",
+    "TIMEOUT": 60,
+    "SINGLE_PROCESS": False,
+}
+
+KEY_PREFIX = "crm:response:"
+GENERATION_PREFIX = "crm:response-generation:"
+STATS_PREFIX = "crm:response-stats:"
+
+# Root fields whose results may be cached, with the models they read
+CACHEABLE_FIELDS = {
+    "__typename": (),
+    "hello": (),
+    "allProducts": (Product,),
+    "allCustomers": (Customer, Order, Product),
+    "allOrders": (Order, Customer, Product),
+    "crmStats": (Customer, Order),
+}
+
+ALL_MODELS = (Customer, Product, Order)
+
+
+def get_setting(name):
+    return getattr(settings, "GRAPHQL_RESPONSE_CACHE", {}).get(name, DEFAULTS[name])
+
+
+def response_cache():
+    return caches[get_setting("ALIAS")]
+
+
+def enabled():
+    """Whether responses are cached: ``ENABLED``, with shared caches or ``SINGLE_PROCESS``."""
+    if not get_setting("ENABLED"):
+        return False
+    return get_setting("SINGLE_PROCESS") or not any(
+        isinstance(backend, LocMemCache) for backend in (caches["default"], response_cache())
+    )
+
+
+def dependencies(operation_ast):
+    """Return the models read by a query operation, or None if it is not cacheable."""
+    if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+        return None
+    models = set()
+    for selection in operation_ast.selection_set.selections:
+        if not isinstance(selection, FieldNode) or selection.name.value not in CACHEABLE_FIELDS:
+            return None
+        models.update(CACHEABLE_FIELDS[selection.name.value])
+    return models
+
+
+def generation_key(model):
+    return GENERATION_PREFIX + model._meta.label_lower
+
+
+def generations(models):
+    # Generations live in the default cache so response eviction cannot drop
+    # them; a missing one restarts from the clock, never from a reused value
+    keys = sorted(generation_key(model) for model in models)
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, time.time_ns(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def invalidate(*models):
+    """Bump the generation of ``models`` (all CRM models by default)."""
+    for model in models or ALL_MODELS:
+        key = generation_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def cache_key(document, variables, operation_name, models):
+    payload = json.dumps(
+        [print_ast(document), variables or {}, operation_name, generations(models)],
+        sort_keys=True,
+        default=str,
+    )
+    return KEY_PREFIX + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_response(key):
+    data = response_cache().get(key)
+    record("hits" if data is not None else "misses")
+    return data
+
+
+def store_response(key, data):
+    response_cache().set(key, data, get_setting("TIMEOUT"))
+
+
+def record(counter):
+    key = STATS_PREFIX + counter
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def stats():
+    """Return the hit and miss counters."""
+    values = cache.get_many([STATS_PREFIX + "hits", STATS_PREFIX + "misses"])
+    return {
+        "hits": values.get(STATS_PREFIX + "hits", 0),
+        "misses": values.get(STATS_PREFIX + "misses", 0),
+    }
@@ -0,0 +1,151 @@
+"""
+Sales rollups kept on the customer and product rows.
+
+``Customer.lifetime_value``, ``order_count`` and ``last_order_date`` and
+``Product.units_sold`` and ``revenue`` are indexed columns, so "top
+customers" and "best sellers" are index scans rather than aggregations over
+every order line. ``record_orders`` bumps them in the transaction that
+creates the orders; ``rebuild`` recomputes them from the orders, and runs
+periodically (``crm.tasks.rebuild_sales_rollups``) to fold in changes made
+outside order creation, such as edited lines or deleted orders.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import (
+    Case, Count, DecimalField, F, Max, Min, OuterRef, PositiveIntegerField, Subquery, Sum,
+    Value, When,
+)
+from django.db.models.functions import Coalesce
+
+from crm import bulk
+
+REBUILD_BATCH_SIZE = 10000
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def record_orders(orders, items):
+    """
+    Add freshly created ``orders`` and their ``items`` (OrderItem instances)
+    to the rollups: one UPDATE for the customers, one for the products (more
+    for large batches on backends with a low parameter limit).
+    """
+    customers = defaultdict(lambda: [Decimal(0), 0, None])
+    for order in orders:
+        totals = customers[order.customer_id]
+        totals[0] += order.total_amount
+        totals[1] += 1
+        totals[2] = max(filter(None, (totals[2], order.order_date)))
+    products = defaultdict(lambda: [0, Decimal(0)])
+    for item in items:
+        totals = products[item.product_id]
+        totals[0] += item.quantity
+        totals[1] += item.line_total
+
+    from crm.models import Customer, Product
+
+    connection = bulk.connection_for(Customer)
+    if bulk.supports_update_from(connection):
+        adapt_money = connection.ops.adapt_decimalfield_value
+        bulk.update_from_values(
+            Customer,
+            [
+                (pk, adapt_money(value), count, connection.ops.adapt_datetimefield_value(date))
+                for pk, (value, count, date) in customers.items()
+            ],
+            "lifetime_value = lifetime_value + v.column2, order_count = order_count + v.column3, "
+            # A NULL last_order_date fails the comparison and takes the new date
+            "last_order_date = CASE WHEN last_order_date >= v.column4 "
+            "THEN last_order_date ELSE v.column4 END",
+        )
+        bulk.update_from_values(
+            Product,
+            [(pk, units, adapt_money(revenue)) for pk, (units, revenue) in products.items()],
+            "units_sold = units_sold + v.column2, revenue = revenue + v.column3",
+        )
+        return
+
+    if customers:
+        Customer.objects.filter(pk__in=customers).update(
+            lifetime_value=Case(
+                *(When(pk=pk, then=F("lifetime_value") + value) for pk, (value, _, _) in customers.items()),
+                output_field=MONEY,
+            ),
+            order_count=Case(
+                *(When(pk=pk, then=F("order_count") + count) for pk, (_, count, _) in customers.items()),
+                output_field=PositiveIntegerField(),
+            ),
+            # A NULL last_order_date fails the comparison and takes the new date
+            last_order_date=Case(
+                *(
+                    When(pk=pk, last_order_date__gte=date, then=F("last_order_date"))
+                    for pk, (_, _, date) in customers.items()
+                ),
+                *(When(pk=pk, then=Value(date)) for pk, (_, _, date) in customers.items()),
+            ),
+        )
+    if products:
+        Product.objects.filter(pk__in=products).update(
+            units_sold=Case(
+                *(When(pk=pk, then=F("units_sold") + units) for pk, (units, _) in products.items()),
+                output_field=PositiveIntegerField(),
+            ),
+            revenue=Case(
+                *(When(pk=pk, then=F("revenue") + revenue) for pk, (_, revenue) in products.items()),
+                output_field=MONEY,
+            ),
+        )
+
+
+def aggregate(queryset, expression, default, output_field):
+    """Correlated subquery of ``expression`` over ``queryset``, ``default`` when it has no rows."""
+    value = Subquery(queryset.annotate(value=expression).values("value"), output_field=output_field)
+    return value if default is None else Coalesce(value, Value(default), output_field=output_field)
+
+
+def pk_ranges(model, size):
+    """Yield ``(start, end)`` primary key ranges covering ``model`` in ``size`` steps."""
+    bounds = model.objects.aggregate(first=Min("pk"), last=Max("pk"))
+    if bounds["first"] is None:
+        return
+    for start in range(bounds["first"], bounds["last"] + 1, size):
+        yield start, start + size
+
+
+def rebuild(apps=global_apps, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Recompute every rollup from the orders and their lines, one short
+    transaction per ``batch_size`` primary keys.
+    """
+    Customer = apps.get_model("crm", "Customer")
+    Product = apps.get_model("crm", "Product")
+    Order = apps.get_model("crm", "Order")
+
+    orders = Order.objects.filter(customer=OuterRef("pk")).order_by().values("customer")
+
+    for start, end in pk_ranges(Customer, batch_size):
+        with transaction.atomic():
+            Customer.objects.filter(pk__gte=start, pk__lt=end).update(
+                lifetime_value=aggregate(orders, Sum("total_amount"), Decimal(0), MONEY),
+                order_count=aggregate(orders, Count("pk"), 0, PositiveIntegerField()),
+                last_order_date=aggregate(orders, Max("order_date"), None, None),
+            )
+    for start, end in pk_ranges(Product, batch_size):
+        with transaction.atomic():
+            rebuild_products(Product.objects.filter(pk__gte=start, pk__lt=end), apps)
+
+
+def rebuild_products(products, apps=global_apps):
+    """Recompute the rollups of the ``products`` queryset from their order lines."""
+    OrderItem = apps.get_model("crm", "OrderItem")
+    lines = OrderItem.objects.filter(product=OuterRef("pk")).order_by().values("product")
+    return products.update(
+        units_sold=aggregate(lines, Sum("quantity"), 0, PositiveIntegerField()),
+        revenue=aggregate(
+            lines, Sum(F("quantity") * F("unit_price"), output_field=MONEY),
+            Decimal(0), MONEY,
+        ),
+    )
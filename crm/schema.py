@@ -1,111 +1,130 @@
 import re
+from functools import reduce
+from operator import or_
+
 import graphene
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
 from django.db import transaction
+from django.db.models import Case, Count, F, PositiveIntegerField, Q, Sum, When
+from django.db.models.functions import TruncDay, TruncWeek
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
 
-from crm.models import Product, Customer, Order
-import django_filters
-
-# ============================================================
-# FILTERS
-# ============================================================
-
-class CustomerFilter(django_filters.FilterSet):
-    name_icontains = django_filters.CharFilter(field_name="name", lookup_expr="icontains")
-    email_icontains = django_filters.CharFilter(field_name="email", lookup_expr="icontains")
-    created_at_gte = django_filters.DateFilter(field_name="created_at", lookup_expr="gte")
-    created_at_lte = django_filters.DateFilter(field_name="created_at", lookup_expr="lte")
-    phone_pattern = django_filters.CharFilter(method="filter_phone_pattern")
-    order_by = django_filters.OrderingFilter(
-        fields=(
-            ('name', 'name'),
-            ('email', 'email'),
-            ('created_at', 'created_at'),
-        )
-    )
-
-    class Meta:
-        model = Customer
-        fields = []
-
-    def filter_phone_pattern(self, queryset, name, value):
-        return queryset.filter(phone__startswith=value)
-
-
-class ProductFilter(django_filters.FilterSet):
-    name_icontains = django_filters.CharFilter(field_name="name", lookup_expr="icontains")
-    price_gte = django_filters.NumberFilter(field_name="price", lookup_expr="gte")
-    price_lte = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
-    stock_gte = django_filters.NumberFilter(field_name="stock", lookup_expr="gte")
-    stock_lte = django_filters.NumberFilter(field_name="stock", lookup_expr="lte")
-    order_by = django_filters.OrderingFilter(
-        fields=(
-            ('name', 'name'),
-            ('price', 'price'),
-            ('stock', 'stock'),
-        )
-    )
-
-    class Meta:
-        model = Product
-        fields = []
-
-
-class OrderFilter(django_filters.FilterSet):
-    total_amount_gte = django_filters.NumberFilter(field_name="total_amount", lookup_expr="gte")
-    total_amount_lte = django_filters.NumberFilter(field_name="total_amount", lookup_expr="lte")
-    order_date_gte = django_filters.DateFilter(field_name="order_date", lookup_expr="gte")
-    order_date_lte = django_filters.DateFilter(field_name="order_date", lookup_expr="lte")
-    customer_name = django_filters.CharFilter(field_name="customer__name", lookup_expr="icontains")
-    product_name = django_filters.CharFilter(method="filter_product_name")
-    product_id = django_filters.NumberFilter(method="filter_product_id")
-    order_by = django_filters.OrderingFilter(
-        fields=(
-            ('total_amount', 'total_amount'),
-            ('order_date', 'order_date'),
-        )
-    )
-
-    class Meta:
-        model = Order
-        fields = []
-
-    def filter_product_name(self, queryset, name, value):
-        return queryset.filter(products__name__icontains=value)
-
-    def filter_product_id(self, queryset, name, value):
-        return queryset.filter(products__id=value)
+from crm import bulk, catalog, rollups, search
+from crm.models import Product, Customer, Order, OrderItem
+from crm.filters import CustomerFilter, ProductFilter, OrderFilter
+from crm.loaders import BatchedConnectionField, get_loaders
+from crm.pagination import CountableConnection
+from graphene_django.filter.utils import get_filtering_args_from_filterset
 
+BULK_BATCH_SIZE = 1000
+STOCK_BATCH_SIZE = 500
 
 # ============================================================
 # OBJECT TYPES (GraphQL Nodes)
 # ============================================================
 
 class CustomerNode(DjangoObjectType):
+    orders = BatchedConnectionField(lambda: OrderNode, loader="orders_by_customer_id")
+
     class Meta:
         model = Customer
-        fields = ("id", "name", "email", "phone", "created_at")
+        fields = (
+            "id", "name", "email", "phone", "created_at",
+            "lifetime_value", "order_count", "last_order_date",
+        )
         filterset_class = CustomerFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
 
 
 class ProductNode(DjangoObjectType):
     class Meta:
         model = Product
-        fields = ("id", "name", "price", "stock")
+        fields = ("id", "sku", "name", "price", "stock", "units_sold", "revenue")
         filterset_class = ProductFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
 
 
 class OrderNode(DjangoObjectType):
+    products = BatchedConnectionField(
+        ProductNode, required=True, loader="products_by_order_id"
+    )
+
     class Meta:
         model = Order
         fields = ("id", "customer", "products", "total_amount", "order_date")
         filterset_class = OrderFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
+
+    def resolve_customer(self, info):
+        return get_loaders(info).customer_by_id.load(self.customer_id)
+
+
+# ============================================================
+# REPORTS
+# ============================================================
+
+class StatsBucket(graphene.Enum):
+    DAY = "day"
+    WEEK = "week"
+
+
+STATS_TRUNC = {
+    StatsBucket.DAY.value: TruncDay,
+    StatsBucket.WEEK.value: TruncWeek,
+}
+
+
+class CrmStatsBucket(graphene.ObjectType):
+    period = graphene.DateTime()
+    total_orders = graphene.Int()
+    total_revenue = graphene.Decimal()
+
+
+class CrmStats(graphene.ObjectType):
+    """Database-side totals over the orders matched by the OrderFilter arguments."""
+    total_customers = graphene.Int()
+    total_orders = graphene.Int()
+    total_revenue = graphene.Decimal()
+    buckets = graphene.List(CrmStatsBucket)
+
+    def resolve_total_customers(root, info):
+        return Customer.objects.count()
+
+    def resolve_total_orders(root, info):
+        return root.totals()["total_orders"]
+
+    def resolve_total_revenue(root, info):
+        return root.totals()["total_revenue"] or 0
+
+    def resolve_buckets(root, info):
+        if root.bucket is None:
+            return []
+        rows = (
+            root.orders
+            .annotate(period=STATS_TRUNC[root.bucket]("order_date"))
+            .values("period")
+            .annotate(total_orders=Count("id"), total_revenue=Sum("total_amount"))
+            .order_by("period")
+        )
+        return [CrmStatsBucket(**row) for row in rows]
+
+
+class CrmStatsResult:
+    def __init__(self, orders, bucket=None):
+        self.orders = orders
+        self.bucket = bucket
+        self._totals = None
+
+    def totals(self):
+        if self._totals is None:
+            self._totals = self.orders.aggregate(
+                total_orders=Count("id"), total_revenue=Sum("total_amount")
+            )
+        return self._totals
 
 
 # ============================================================
@@ -118,6 +137,22 @@ class CustomerInput(graphene.InputObjectType):
     phone = graphene.String()
 
 
+class OrderInput(graphene.InputObjectType):
+    customer_id = graphene.ID(required=True)
+    product_ids = graphene.List(graphene.ID, required=True)
+    quantities = graphene.List(graphene.Int)
+    # For backfills; defaults to now
+    order_date = graphene.DateTime()
+
+
+class ProductInput(graphene.InputObjectType):
+    sku = graphene.String(required=True)
+    name = graphene.String(required=True)
+    price = graphene.Decimal(required=True)
+    # Left out, an existing product keeps its stock
+    stock = graphene.Int()
+
+
 # ============================================================
 # VALIDATION
 # ============================================================
@@ -135,6 +170,171 @@ def validate_email_and_phone(email, phone=None):
     return None
 
 
+def existing_emails(emails):
+    """Return the subset of ``emails`` already stored, one IN query per chunk."""
+    emails = list(emails)
+    taken = set()
+    for start in range(0, len(emails), BULK_BATCH_SIZE):
+        taken.update(
+            Customer.objects
+            .filter(email__in=emails[start:start + BULK_BATCH_SIZE])
+            .values_list("email", flat=True)
+        )
+    return taken
+
+
+def parse_order_lines(product_ids, quantities=None):
+    """
+    Merge ``product_ids`` and their ``quantities`` into ``{product_id: quantity}``.
+
+    Returns ``(lines, error)``; repeated ids add up.
+    """
+    if quantities is None:
+        quantities = [1] * len(product_ids)
+    if len(quantities) != len(product_ids):
+        return None, "Quantities must match product IDs"
+    lines = {}
+    for pid, qty in zip(product_ids, quantities):
+        try:
+            pid = int(pid)
+        except (TypeError, ValueError):
+            return None, f"Invalid product ID: {pid}"
+        if qty is None or qty < 1:
+            return None, f"Invalid quantity for product ID: {pid}"
+        lines[pid] = lines.get(pid, 0) + qty
+    return lines, None
+
+
+def reserve_stock(products, lines):
+    """
+    Decrement stock for ``lines`` with one conditional UPDATE (per
+    ``STOCK_BATCH_SIZE`` products where ``UPDATE ... FROM`` is unsupported).
+
+    Rows only change when their line has enough stock, so concurrent orders
+    cannot oversell. On failure the caller must roll the transaction back.
+    """
+    if bulk.supports_update_from(bulk.connection_for(Product)):
+        updated = bulk.update_from_values(
+            Product, list(lines.items()), "stock = stock - v.column2", where="stock >= v.column2"
+        )
+    else:
+        updated = 0
+        entries = list(lines.items())
+        # Each product adds a level to the OR chain; SQLite caps expression depth at 1000
+        for start in range(0, len(entries), STOCK_BATCH_SIZE):
+            batch = entries[start:start + STOCK_BATCH_SIZE]
+            in_stock = reduce(or_, (Q(pk=pid, stock__gte=qty) for pid, qty in batch))
+            updated += Product.objects.filter(in_stock).update(
+                stock=Case(
+                    *(When(pk=pid, then=F("stock") - qty) for pid, qty in batch),
+                    default=F("stock"),
+                    output_field=PositiveIntegerField(),
+                )
+            )
+    if updated == len(lines):
+        return None
+    short = [pid for pid, qty in lines.items() if products[pid].stock < qty] or list(lines)
+    return f"Insufficient stock for product ID(s): {', '.join(map(str, short))}"
+
+
+def allocate_orders(orders):
+    """
+    Resolve and validate parsed ``orders`` (``(idx, customer_id, lines, order_date)``)
+    together: one query for their customers, one for their products, and stock
+    checked across the whole batch in input order.
+
+    Returns ``(valid orders, products by id, [(idx, error), ...])``.
+    """
+    customers = Customer.objects.only("pk").in_bulk({customer_id for _, customer_id, _, _ in orders})
+    products = Product.objects.only("pk", "price", "stock").in_bulk(
+        {pid for _, _, lines, _ in orders for pid in lines}
+    )
+    remaining = {pid: product.stock for pid, product in products.items()}
+    valid = []
+    errors = []
+    for order in orders:
+        idx, customer_id, lines, _ = order
+        if customer_id not in customers:
+            errors.append((idx, "Invalid customer ID"))
+            continue
+        missing = next((pid for pid in lines if pid not in products), None)
+        if missing is not None:
+            errors.append((idx, f"Invalid product ID: {missing}"))
+            continue
+        short = [pid for pid, qty in lines.items() if remaining[pid] < qty]
+        if short:
+            errors.append((idx, f"Insufficient stock for product ID(s): {', '.join(map(str, short))}"))
+            continue
+        for pid, qty in lines.items():
+            remaining[pid] -= qty
+        valid.append(order)
+    return valid, products, errors
+
+
+def insert_orders(orders, products):
+    """
+    Reserve stock for and insert ``orders`` (as returned by ``allocate_orders``)
+    with their lines and rollups, in bulk.
+
+    Returns ``(created orders, error)``; on error the caller must roll back.
+    """
+    totals = {}
+    for _, _, lines, _ in orders:
+        for pid, qty in lines.items():
+            totals[pid] = totals.get(pid, 0) + qty
+    error = reserve_stock(products, totals)
+    if error:
+        return [], error
+
+    created = Order.objects.bulk_create([
+        Order(
+            customer_id=customer_id,
+            total_amount=sum(products[pid].price * qty for pid, qty in lines.items()),
+        )
+        for _, customer_id, lines, _ in orders
+    ])
+    dated = [(order, date) for order, (_, _, _, date) in zip(created, orders) if date]
+    if dated:
+        # auto_now_add overrides dates given to bulk_create
+        bulk.update_field(Order, "order_date", {order.pk: date for order, date in dated})
+        for order, date in dated:
+            order.order_date = date
+    items = OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_id=pid, quantity=qty, unit_price=products[pid].price)
+        for order, (_, _, lines, _) in zip(created, orders)
+        for pid, qty in lines.items()
+    ])
+    rollups.record_orders(created, items)
+    return created, None
+
+
+def restock_products(threshold, amount):
+    """
+    Add ``amount`` to every product with stock below ``threshold`` in one UPDATE.
+
+    Returns the sorted ids of the restocked products, using UPDATE ... RETURNING
+    where the backend supports it.
+    """
+    db = bulk.connection_for(Product)
+    if bulk.supports_update_returning(db):
+        table = db.ops.quote_name(Product._meta.db_table)
+        pk = db.ops.quote_name(Product._meta.pk.column)
+        with db.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET stock = stock + %s WHERE stock < %s RETURNING {pk}",
+                [amount, threshold],
+            )
+            return sorted(row[0] for row in cursor.fetchall())
+    ids = list(
+        Product.objects.select_for_update()
+        .filter(stock__lt=threshold)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+    Product.objects.filter(pk__in=ids).update(stock=F("stock") + amount)
+    return ids
+
+
 # ============================================================
 # MUTATIONS
 # ============================================================
@@ -168,23 +368,35 @@ class BulkCreateCustomers(graphene.Mutation):
 
     @transaction.atomic
     def mutate(self, info, input):
-        created = []
         errors = []
+        valid = []
         for idx, c in enumerate(input):
             error = validate_email_and_phone(c.email, c.phone)
             if error:
-                errors.append(f"[{idx}] {error}")
-                continue
-            if Customer.objects.filter(email=c.email).exists():
-                errors.append(f"[{idx}] Email already exists: {c.email}")
+                errors.append((idx, error))
                 continue
             customer = Customer(name=c.name, email=c.email, phone=c.phone or "")
             try:
-                customer.full_clean()
-                customer.save()
-                created.append(customer)
-            except Exception as e:
-                errors.append(f"[{idx}] {str(e)}")
+                # Uniqueness is checked for the whole batch below
+                customer.full_clean(validate_unique=False)
+            except ValidationError as e:
+                errors.append((idx, str(e)))
+                continue
+            valid.append((idx, customer))
+
+        taken = existing_emails(customer.email for _, customer in valid)
+        created = []
+        for idx, customer in valid:
+            if customer.email in taken:
+                errors.append((idx, f"Email already exists: {customer.email}"))
+                continue
+            taken.add(customer.email)
+            created.append(customer)
+
+        Customer.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+        # bulk_create sends no post_save
+        search.index(Customer, created, new=True)
+        errors = [f"[{idx}] {error}" for idx, error in sorted(errors, key=lambda e: e[0])]
         return BulkCreateCustomers(customers=created, errors=errors)
 
 
@@ -207,6 +419,24 @@ class CreateProduct(graphene.Mutation):
         return CreateProduct(product=product)
 
 
+class BulkUpsertProducts(graphene.Mutation):
+    products = graphene.List(ProductNode)
+    upserted_count = graphene.Int()
+    errors = graphene.List(graphene.String)
+
+    class Arguments:
+        input = graphene.List(ProductInput, required=True)
+
+    @transaction.atomic
+    def mutate(self, info, input):
+        products, errors = catalog.upsert_products(input, batch_size=BULK_BATCH_SIZE)
+        return BulkUpsertProducts(
+            products=products,
+            upserted_count=len(products),
+            errors=[f"[{idx}] {error}" for idx, error in errors],
+        )
+
+
 class CreateOrder(graphene.Mutation):
     order = graphene.Field(OrderNode)
     error = graphene.String()
@@ -214,62 +444,123 @@ class CreateOrder(graphene.Mutation):
     class Arguments:
         customer_id = graphene.ID(required=True)
         product_ids = graphene.List(graphene.ID, required=True)
+        quantities = graphene.List(graphene.Int)
 
     @transaction.atomic
-    def mutate(self, info, customer_id, product_ids):
+    def mutate(self, info, customer_id, product_ids, quantities=None):
         try:
             customer = Customer.objects.get(id=customer_id)
         except Customer.DoesNotExist:
             return CreateOrder(error="Invalid customer ID")
         if not product_ids:
             return CreateOrder(error="At least one product is required")
-        products = []
-        total_amount = 0
-        for pid in product_ids:
-            try:
-                product = Product.objects.get(id=pid)
-                products.append(product)
-                total_amount += product.price
-            except Product.DoesNotExist:
+        lines, error = parse_order_lines(product_ids, quantities)
+        if error:
+            return CreateOrder(error=error)
+
+        products = Product.objects.select_for_update().in_bulk(lines)
+        for pid in lines:
+            if pid not in products:
                 return CreateOrder(error=f"Invalid product ID: {pid}")
-        order = Order(customer=customer, total_amount=total_amount)
-        order.save()
-        order.products.set(products)
+        error = reserve_stock(products, lines)
+        if error:
+            transaction.set_rollback(True)
+            return CreateOrder(error=error)
+
+        total_amount = sum(products[pid].price * qty for pid, qty in lines.items())
+        order = Order.objects.create(customer=customer, total_amount=total_amount)
+        # The order is new, so lines can be inserted without set()'s diffing;
+        # bulk_create sends no signals, the total above already covers them
+        items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=pid, quantity=qty, unit_price=products[pid].price)
+            for pid, qty in lines.items()
+        ])
+        rollups.record_orders([order], items)
         return CreateOrder(order=order)
 
 
-# ============================================================
-# ROOT MUTATION
-# ============================================================
+class BulkCreateOrders(graphene.Mutation):
+    orders = graphene.List(OrderNode)
+    created_count = graphene.Int()
+    errors = graphene.List(graphene.String)
+
+    class Arguments:
+        input = graphene.List(OrderInput, required=True)
+
+    def mutate(self, info, input):
+        errors = []
+        parsed = []
+        for idx, o in enumerate(input):
+            if not o.product_ids:
+                errors.append((idx, "At least one product is required"))
+                continue
+            lines, error = parse_order_lines(o.product_ids, o.quantities)
+            if error:
+                errors.append((idx, error))
+                continue
+            try:
+                customer_id = int(o.customer_id)
+            except ValueError:
+                errors.append((idx, "Invalid customer ID"))
+                continue
+            parsed.append((idx, customer_id, lines, o.order_date))
+
+        valid, products, invalid = allocate_orders(parsed)
+        errors.extend(invalid)
+        created = []
+        for start in range(0, len(valid), BULK_BATCH_SIZE):
+            chunk = valid[start:start + BULK_BATCH_SIZE]
+            with transaction.atomic():
+                orders, error = insert_orders(chunk, products)
+                if error:
+                    # Stock changed since it was checked; this chunk fails as a whole
+                    transaction.set_rollback(True)
+                    errors.extend((idx, error) for idx, _, _, _ in chunk)
+                    continue
+            created.extend(orders)
+
+        errors = [f"[{idx}] {error}" for idx, error in sorted(errors, key=lambda e: e[0])]
+        return BulkCreateOrders(orders=created, created_count=len(created), errors=errors)
 
-class Mutation(graphene.ObjectType):
-    create_customer = CreateCustomer.Field()
-    bulk_create_customers = BulkCreateCustomers.Field()
-    create_product = CreateProduct.Field()
-    create_order = CreateOrder.Field()
 
 class UpdateLowStockProducts(graphene.Mutation):
     updated_products = graphene.List(ProductNode)
+    updated_count = graphene.Int()
     message = graphene.String()
 
-    def mutate(self, info):
-        # Find products with stock < 10
-        low_stock_products = Product.objects.filter(stock__lt=10)
-        updated_products = []
+    class Arguments:
+        threshold = graphene.Int(default_value=10)
+        amount = graphene.Int(default_value=10)
+        limit = graphene.Int(default_value=100)
 
-        for product in low_stock_products:
-            product.stock += 10  # restock
-            product.save()
-            updated_products.append(product)
+    @transaction.atomic
+    def mutate(self, info, threshold, amount, limit):
+        if amount < 1:
+            return UpdateLowStockProducts(message="Restock amount must be positive")
+        ids = restock_products(threshold, amount)
+        # Only the first ``limit`` restocked products are returned
+        updated_products = Product.objects.filter(pk__in=ids[:max(limit, 0)]).order_by("pk")
 
         return UpdateLowStockProducts(
             updated_products=updated_products,
-            message=f"{len(updated_products)} products restocked successfully"
+            updated_count=len(ids),
+            message=f"{len(ids)} products restocked successfully"
         )
 
 
-# Add to root mutation
-Mutation.update_low_stock_products = UpdateLowStockProducts.Field()
+# ============================================================
+# ROOT MUTATION
+# ============================================================
+
+class Mutation(graphene.ObjectType):
+    create_customer = CreateCustomer.Field()
+    bulk_create_customers = BulkCreateCustomers.Field()
+    create_product = CreateProduct.Field()
+    bulk_upsert_products = BulkUpsertProducts.Field()
+    create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
+    update_low_stock_products = UpdateLowStockProducts.Field()
+
 
 # ============================================================
 # ROOT QUERY
@@ -278,9 +569,27 @@ Mutation.update_low_stock_products = UpdateLowStockProducts.Field()
 class Query(graphene.ObjectType):
     hello = graphene.String(default_value="Hello, GraphQL!")
 
-    all_customers = DjangoFilterConnectionField(CustomerNode)
-    all_products = DjangoFilterConnectionField(ProductNode)
-    all_orders = DjangoFilterConnectionField(OrderNode)
+    all_customers = BatchedConnectionField(CustomerNode, keyset_pagination=True)
+    all_products = BatchedConnectionField(ProductNode, keyset_pagination=True)
+    all_orders = BatchedConnectionField(OrderNode, keyset_pagination=True)
+
+    crm_stats = graphene.Field(
+        CrmStats,
+        bucket=StatsBucket(),
+        **{
+            name: argument
+            for name, argument in get_filtering_args_from_filterset(OrderFilter, OrderNode).items()
+            if name != "order_by"
+        }
+    )
+
+    def resolve_crm_stats(root, info, bucket=None, **filters):
+        filterset = OrderFilter(data=filters, queryset=Order.objects.all())
+        if not filterset.is_valid():
+            raise ValidationError(filterset.form.errors.as_json())
+        # Re-select by id so M2M filters cannot duplicate rows in the sums
+        orders = Order.objects.filter(pk__in=filterset.qs.values("pk"))
+        return CrmStatsResult(orders, bucket.value if bucket else None)
 
 
 # ============================================================
@@ -0,0 +1,265 @@
+"""
+Full-text search behind the ``search`` argument of the CRM filter sets.
+
+Customers are matched on name and email, products on name, and orders on
+their customer or any of their products. Each term matches as a word prefix
+and every term must match. Each database vendor has its own backend:
+
+* SQLite: FTS5 tables (``crm_customer_search``, ``crm_product_search``)
+  keyed by primary key and kept in sync by ``crm.signals``. Writes that
+  send no signals (bulk_create, raw deletes) call ``index``/``unindex``.
+  Results are ordered by bm25 rank.
+* PostgreSQL: GIN indexes on the ``tsvector`` of the same fields and, for
+  substring matches, trigram indexes on each upper-cased field (which also
+  serve the ``*_icontains`` filters). The database maintains them; results
+  are ordered by ``ts_rank``.
+* Other databases: ``icontains`` on the same fields, unranked.
+
+Orders are matched with subqueries rather than joins, so an order matching
+several products is returned once.
+"""
+import re
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Upper
+
+# Searchable fields per model label
+SEARCH_FIELDS = {
+    "crm.customer": ("name", "email"),
+    "crm.product": ("name",),
+}
+
+SEARCH_CONFIG = "simple"
+
+
+def search_fields(model):
+    return SEARCH_FIELDS.get(model._meta.label_lower, ())
+
+
+def search_terms(value):
+    return [term for term in re.split(r"\s+", value or "") if term]
+
+
+# ============================================================
+# BACKENDS
+# ============================================================
+
+class SearchBackend:
+    """``icontains`` on the search fields, unranked; the index is the table itself."""
+
+    def install(self, apps, schema_editor):
+        pass
+
+    def uninstall(self, apps, schema_editor):
+        pass
+
+    def rebuild(self, model, connection):
+        pass
+
+    def index(self, model, instances, connection, new=False):
+        pass
+
+    def unindex(self, model, pks, connection):
+        pass
+
+    def matching_pks(self, model, value):
+        return self.search(model._default_manager.all(), value).values("pk")
+
+    def search(self, queryset, value):
+        fields = search_fields(queryset.model)
+        for term in search_terms(value):
+            condition = Q()
+            for field in fields:
+                condition |= Q(**{f"{field}__icontains": term})
+            queryset = queryset.filter(condition)
+        return queryset
+
+
+class SQLiteSearch(SearchBackend):
+    def table(self, model):
+        return f"{model._meta.db_table}_search"
+
+    def install(self, apps, schema_editor):
+        for label, fields in SEARCH_FIELDS.items():
+            model = apps.get_model(label)
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table(model)} USING fts5("
+                f"{', '.join(fields)}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            self.rebuild(model, schema_editor.connection)
+
+    def uninstall(self, apps, schema_editor):
+        for label in SEARCH_FIELDS:
+            schema_editor.execute(f"DROP TABLE IF EXISTS {self.table(apps.get_model(label))}")
+
+    def rebuild(self, model, connection):
+        fields = ", ".join(search_fields(model))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table(model)}")
+            cursor.execute(
+                f"INSERT INTO {self.table(model)} (rowid, {fields}) "
+                f"SELECT {model._meta.pk.column}, {fields} FROM {model._meta.db_table}"
+            )
+
+    def index(self, model, instances, connection, new=False):
+        fields = search_fields(model)
+        rows = [(obj.pk, *(getattr(obj, name) for name in fields)) for obj in instances]
+        if not rows:
+            return
+        if not new:
+            self.unindex(model, [row[0] for row in rows], connection)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table(model)} (rowid, {', '.join(fields)}) "
+                f"VALUES ({', '.join(['%s'] * len(rows[0]))})",
+                rows,
+            )
+
+    def unindex(self, model, pks, connection):
+        pks = list(pks)
+        # Stay under SQLite's bound parameter limit
+        for start in range(0, len(pks), 500):
+            chunk = pks[start:start + 500]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {self.table(model)} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})",
+                    chunk,
+                )
+
+    def match(self, value):
+        # Quote every term so user input cannot use FTS5 query syntax
+        return " ".join('"{}"*'.format(term.replace('"', '""')) for term in search_terms(value))
+
+    def matching_pks(self, model, value):
+        table = self.table(model)
+        return RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [self.match(value)])
+
+    def search(self, queryset, value):
+        model = queryset.model
+        table = self.table(model)
+        return queryset.extra(
+            select={"search_rank": f"{table}.rank"},
+            tables=[table],
+            where=[
+                f"{table}.rowid = {model._meta.db_table}.{model._meta.pk.column}",
+                f"{table} MATCH %s",
+            ],
+            params=[self.match(value)],
+        ).order_by("search_rank", "pk")
+
+
+class PostgresSearch(SearchBackend):
+    def vector(self, model):
+        return SearchVector(*search_fields(model), config=SEARCH_CONFIG)
+
+    def install(self, apps, schema_editor):
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for model, index in self.indexes(apps):
+            schema_editor.add_index(model, index)
+
+    def uninstall(self, apps, schema_editor):
+        for model, index in self.indexes(apps):
+            schema_editor.remove_index(model, index)
+
+    def indexes(self, apps):
+        for label, fields in SEARCH_FIELDS.items():
+            model = apps.get_model(label)
+            name = model._meta.db_table
+            yield model, GinIndex(self.vector(model), name=f"{name}_search_idx")
+            for field in fields:
+                yield model, GinIndex(
+                    OpClass(Upper(field), name="gin_trgm_ops"), name=f"{name}_{field}_trgm_idx"
+                )
+
+    def query(self, value):
+        # Only word characters reach the raw tsquery, so user input is never syntax
+        words = re.findall(r"\w+", value)
+        return SearchQuery(
+            " & ".join(f"{word}:*" for word in words) or "''",
+            config=SEARCH_CONFIG, search_type="raw",
+        )
+
+    def search(self, queryset, value):
+        vector = self.vector(queryset.model)
+        query = self.query(value)
+        # Substring matches (trigram indexes) catch what word prefixes miss
+        substring = Q()
+        for field in search_fields(queryset.model):
+            substring |= Q(**{f"{field}__icontains": value})
+        return queryset.annotate(
+            search_vector=vector, search_rank=SearchRank(vector, query)
+        ).filter(Q(search_vector=query) | substring).order_by("-search_rank", "pk")
+
+
+BACKENDS = {
+    "sqlite": SQLiteSearch(),
+    "postgresql": PostgresSearch(),
+}
+
+
+def get_backend(connection):
+    return BACKENDS.get(connection.vendor, SearchBackend())
+
+
+def backend_for(model):
+    connection = connections[router.db_for_write(model)]
+    return get_backend(connection), connection
+
+
+# ============================================================
+# API
+# ============================================================
+
+def search(queryset, value):
+    """Narrow ``queryset`` to the rows matching ``value``, best matches first."""
+    if not search_terms(value):
+        return queryset
+    from crm.models import Customer, Order, OrderItem, Product
+
+    backend = get_backend(connections[queryset.db])
+    if queryset.model is not Order:
+        return backend.search(queryset, value)
+    product_orders = OrderItem.objects.filter(
+        product_id__in=backend.matching_pks(Product, value)
+    ).values("order_id")
+    return queryset.filter(
+        Q(customer_id__in=backend.matching_pks(Customer, value)) | Q(pk__in=product_orders)
+    )
+
+
+def index(model, instances, new=False):
+    """
+    (Re)index ``instances`` of ``model``, for writes that send no signals.
+    ``new`` skips removing index entries for rows that were just inserted.
+    """
+    if search_fields(model):
+        backend, connection = backend_for(model)
+        backend.index(model, instances, connection, new)
+
+
+def unindex(model, pks):
+    if search_fields(model):
+        backend, connection = backend_for(model)
+        backend.unindex(model, pks, connection)
+
+
+def rebuild(*models):
+    """Rebuild the index of ``models`` (all searchable models by default)."""
+    from django.apps import apps
+
+    for model in models or [apps.get_model(label) for label in SEARCH_FIELDS]:
+        backend, connection = backend_for(model)
+        backend.rebuild(model, connection)
+
+
+def install(apps, schema_editor):
+    """Migration hook creating the search tables or indexes."""
+    get_backend(schema_editor.connection).install(apps, schema_editor)
+
+
+def uninstall(apps, schema_editor):
+    get_backend(schema_editor.connection).uninstall(apps, schema_editor)
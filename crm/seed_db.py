@@ -1,26 +1,202 @@
-import os
-import django
+"""
+Synthetic data generator for the CRM models, run with ``python manage.py seed_db``.
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql_crm.settings")
-django.setup()
+Rows are generated in fixed-size partitions, each from its own random stream
+keyed on the seed, table and first primary key, so the data is the same for a
+given seed and starting database whatever the number of processes. Primary
+keys are assigned up front, which lets order lines reference their orders
+without reading them back and lets partitions be inserted in parallel.
+"""
+import multiprocessing
+import random
+from datetime import timedelta
+from decimal import Decimal
 
-from crm.models import Customer, Product
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
 
-def seed_customers():
-    Customer.objects.bulk_create([
-        Customer(name="Alice", email="alice@example.com", phone="+1234567890"),
-        Customer(name="Bob", email="bob@example.com", phone="123-456-7890"),
-        Customer(name="Carol", email="carol@example.com")
-    ])
+from crm import bulk, rollups, search
+from crm.models import Customer, Order, OrderItem, Product
 
-def seed_products():
+PARTITION_SIZE = 50000
+BATCH_SIZE = 5000
+
+FIRST_NAMES = (
+    "Alice", "Bob", "Carol", "David", "Emma", "Farid", "Grace", "Hiro", "Ines", "Jamal",
+    "Kofi", "Lena", "Mateo", "Nia", "Omar", "Priya", "Quinn", "Rosa", "Sven", "Tariq",
+    "Uma", "Victor", "Wanjiru", "Xin", "Yara", "Zane",
+)
+LAST_NAMES = (
+    "Adeyemi", "Brown", "Chen", "Diallo", "Evans", "Fischer", "Garcia", "Haddad", "Ito",
+    "Johnson", "Kim", "Lopez", "Mensah", "Nguyen", "Okafor", "Patel", "Rossi", "Smith",
+    "Tanaka", "Usman", "Volkov", "Williams",
+)
+ADJECTIVES = (
+    "Compact", "Deluxe", "Ergonomic", "Portable", "Rugged", "Smart", "Wireless", "Classic",
+    "Premium", "Eco",
+)
+NOUNS = (
+    "Laptop", "Mouse", "Keyboard", "Monitor", "Headset", "Webcam", "Speaker", "Charger",
+    "Dock", "Tablet", "Router", "Printer",
+)
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+
+
+def random_phone(rng):
+    if rng.random() < 0.2:
+        return ""
+    if rng.random() < 0.5:
+        return f"+{rng.randint(1, 99)}{rng.randint(100000000, 999999999)}"
+    return f"{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}"
+
+
+# ============================================================
+# PARTITIONS
+# ============================================================
+
+def insert_customers(rng, first_id, count, context):
+    customers = []
+    for pk in range(first_id, first_id + count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        customers.append(Customer(
+            pk=pk,
+            name=f"{first} {last}",
+            email=f"{first}.{last}.{pk}@example.com".lower(),
+            phone=random_phone(rng),
+        ))
+    Customer.objects.bulk_create(customers, batch_size=BATCH_SIZE)
+
+
+def insert_products(rng, first_id, count, context):
     Product.objects.bulk_create([
-        Product(name="Laptop", price=999.99, stock=10),
-        Product(name="Mouse", price=19.99, stock=50),
-        Product(name="Keyboard", price=49.99, stock=30)
-    ])
-
-if __name__ == "__main__":
-    seed_customers()
-    seed_products()
-    print("Database seeded successfully!")
+        Product(
+            pk=pk,
+            name=f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {pk}",
+            # Mostly cheap items with a long tail of expensive ones
+            price=max(Decimal("0.01"), round(Decimal(rng.lognormvariate(3.5, 1.0)), 2)),
+            stock=rng.choice((0, rng.randint(1, 9), rng.randint(10, 500))),
+        )
+        for pk in range(first_id, first_id + count)
+    ], batch_size=BATCH_SIZE)
+
+
+def insert_orders(rng, first_id, count, context):
+    customer_ids = context["customer_ids"]
+    product_ids = context["product_ids"]
+    prices = context["prices"]
+    now = timezone.now()
+    orders = []
+    items = []
+    for pk in range(first_id, first_id + count):
+        picks = rng.sample(range(len(product_ids)), rng.randint(1, context["lines_per_order"]))
+        lines = [
+            OrderItem(
+                order_id=pk, product_id=product_ids[i],
+                # Mostly single units
+                quantity=rng.choice((1, 1, 1, 2, 3)), unit_price=prices[i],
+            )
+            for i in picks
+        ]
+        orders.append(Order(
+            pk=pk,
+            # Squaring skews orders towards a core of repeat customers
+            customer_id=customer_ids[int(len(customer_ids) * rng.random() ** 2)],
+            total_amount=sum(line.line_total for line in lines),
+            order_date=now - timedelta(seconds=rng.randint(0, context["days"] * 86400)),
+        ))
+        items.extend(lines)
+    # auto_now_add overrides dates given to bulk_create, so they are set after
+    dates = {order.pk: order.order_date for order in orders}
+    Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+    bulk.update_field(Order, "order_date", dates, batch_size=BATCH_SIZE)
+    OrderItem.objects.bulk_create(items, batch_size=BATCH_SIZE)
+
+
+INSERTERS = {
+    "customers": insert_customers,
+    "products": insert_products,
+    "orders": insert_orders,
+}
+
+
+def insert_partition(task):
+    table, seed, first_id, count, context = task
+    rng = random.Random(f"{seed}:{table}:{first_id}")
+    with transaction.atomic():
+        INSERTERS[table](rng, first_id, count, context)
+    return table, count
+
+
+# ============================================================
+# ENTRY POINT
+# ============================================================
+
+def seed(
+    customers=0, products=0, orders=0, lines_per_order=3, days=365, seed=0,
+    processes=1, progress=None,
+):
+    """
+    Add ``customers``, ``products`` and ``orders`` synthetic rows; each order
+    gets 1 to ``lines_per_order`` lines of distinct products and a matching total.
+
+    With ``processes`` > 1 partitions are inserted by a process pool; SQLite
+    allows a single writer, so it always runs in-process.
+    """
+    if connection.vendor == "sqlite":
+        processes = 1
+    progress = progress or (lambda message: None)
+
+    def run(table, count, model, context=None):
+        first_id = next_id(model)
+        tasks = [
+            (table, seed, first_id + offset, min(PARTITION_SIZE, count - offset), context)
+            for offset in range(0, count, PARTITION_SIZE)
+        ]
+        done = 0
+        if processes > 1 and len(tasks) > 1:
+            # Workers are forked from the configured process and must not
+            # share its connections
+            connections.close_all()
+            with multiprocessing.get_context("fork").Pool(processes) as pool:
+                for _, inserted in pool.imap_unordered(insert_partition, tasks):
+                    done += inserted
+                    progress(f"{table}: {done}/{count}")
+        else:
+            for task in tasks:
+                done += insert_partition(task)[1]
+                progress(f"{table}: {done}/{count}")
+
+    run("customers", customers, Customer)
+    run("products", products, Product)
+    if orders:
+        # Ordered, so the same seed picks the same rows on every backend
+        prices = dict(Product.objects.order_by("pk").values_list("pk", "price"))
+        customer_ids = list(Customer.objects.order_by("pk").values_list("pk", flat=True))
+        if not prices or not customer_ids:
+            raise ValueError("Orders need existing customers and products")
+        run("orders", orders, Order, {
+            "customer_ids": customer_ids,
+            "product_ids": list(prices),
+            "prices": list(prices.values()),
+            "lines_per_order": min(lines_per_order, len(prices)),
+            "days": days,
+        })
+
+    # Explicit primary keys bypass the sequences on backends that have them
+    models = [Customer, Product, Order, OrderItem]
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+    # bulk_create sends no signals to keep the search index in sync, and
+    # skips the rollups kept by order creation
+    if orders:
+        rollups.rebuild()
+    if customers:
+        search.rebuild(Customer)
+    if products:
+        search.rebuild(Product)
@@ -1,6 +1,11 @@
 # crm/settings.py
+# Settings of the Celery worker and beat (see crm/celery.py): the project
+# settings, so tasks have the CRM app and its database, plus Celery's own.
 from celery.schedules import crontab
 
+from alx_backend_graphql.settings import *  # noqa: F401,F403
+from alx_backend_graphql.settings import INSTALLED_APPS as PROJECT_APPS
+
 # Celery configuration
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
@@ -9,7 +14,7 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
 INSTALLED_APPS = [
-    'django_crontab',
+    *PROJECT_APPS,
     'django_celery_beat',
 ]
 
@@ -23,4 +28,8 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'crm.tasks.generate_crm_report',
         'schedule': crontab(day_of_week='mon', hour=6, minute=0),
     },
+    'rebuild-sales-rollups': {
+        'task': 'crm.tasks.rebuild_sales_rollups',
+        'schedule': crontab(hour=3, minute=0),
+    },
 }
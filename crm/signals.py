@@ -0,0 +1,77 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from crm import response_cache, search
+from crm.models import Customer, Order, OrderItem, Product, update_order_totals
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def invalidate_responses(sender, **kwargs):
+    response_cache.invalidate(sender)
+
+
+# ============================================================
+# SEARCH INDEX
+# ============================================================
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+def index_for_search(sender, instance, created, **kwargs):
+    search.index(sender, [instance], new=created)
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+def unindex_for_search(sender, instance, **kwargs):
+    search.unindex(sender, [instance.pk])
+
+
+# ============================================================
+# ORDER TOTALS
+# ============================================================
+
+def add_to_total(order_id, amount):
+    Order.objects.filter(pk=order_id).update(total_amount=F("total_amount") + amount)
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_saved(sender, instance, created, **kwargs):
+    if created:
+        add_to_total(instance.order_id, instance.line_total)
+    else:
+        # The previous line total is unknown; re-sum this order's lines
+        update_order_totals([instance.order_id])
+    response_cache.invalidate(Order, Product)
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_item_deleted(sender, instance, origin=None, **kwargs):
+    # Lines deleted along with their order need no total
+    if isinstance(origin, (Order, Customer)) or getattr(origin, "model", None) in (Order, Customer):
+        return
+    add_to_total(instance.order_id, -instance.line_total)
+    response_cache.invalidate(Order, Product)
+
+
+@receiver(m2m_changed, sender=OrderItem)
+def order_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # order.products.add()/remove()/clear() and the reverse product.orders
+    # accessors write lines without sending post_save or post_delete
+    if action == "pre_clear" and reverse:
+        instance._cleared_order_ids = list(instance.orders.values_list("pk", flat=True))
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        order_ids = [instance.pk]
+    elif action == "post_clear":
+        order_ids = instance.__dict__.pop("_cleared_order_ids", [])
+    else:
+        order_ids = pk_set
+    update_order_totals(order_ids)
+    response_cache.invalidate(Order, Product)
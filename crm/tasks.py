@@ -1,8 +1,29 @@
-from celery import shared_task
-from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
-import requests
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from celery import chord, shared_task
+
+from crm.cron_jobs.send_order_reminders import REMINDER_PAGES_QUERY, REMINDER_QUERY
+from crm.graphql_client import execute
+
+# Order reminders, overridable with ORDER_REMINDERS in settings
+REMINDER_DEFAULTS = {
+    "LOG_FILE": "/tmp/order_reminders_log.txt",
+    # High-water mark: keyset cursor of the newest order already reminded
+    "STATE_FILE": "/tmp/order_reminders_state.json",
+    "CHUNK_SIZE": 100,
+    "WINDOW_DAYS": 7,
+}
+
+
+def get_reminder_setting(name):
+    from django.conf import settings
+
+    configured = getattr(settings, "ORDER_REMINDERS", {}) if settings.configured else {}
+    return configured.get(name, REMINDER_DEFAULTS[name])
+
 
 @shared_task
 def generate_crm_report():
@@ -12,36 +33,23 @@ def generate_crm_report():
     """
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    # Setup GraphQL client
-    transport = RequestsHTTPTransport(
-        url="http://localhost:8000/graphql",
-        verify=False,
-        retries=3,
-    )
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-
-    # GraphQL query to fetch totals
-    query = gql("""
+    # GraphQL query to fetch totals, aggregated by the database
+    query = """
     query {
-        allCustomers {
-            totalCount
-        }
-        allOrders {
-            totalCount
-            edges {
-                node {
-                    totalAmount
-                }
-            }
+        crmStats {
+            totalCustomers
+            totalOrders
+            totalRevenue
         }
     }
-    """)
+    """
 
     try:
-        result = client.execute(query)
-        total_customers = result['allCustomers']['totalCount']
-        total_orders = result['allOrders']['totalCount']
-        total_revenue = sum(order['node']['totalAmount'] for order in result['allOrders']['edges'])
+        result = execute(query)
+        stats = result['crmStats']
+        total_customers = stats['totalCustomers']
+        total_orders = stats['totalOrders']
+        total_revenue = stats['totalRevenue']
 
         # Log the report
         log_line = f"{timestamp} - Report: {total_customers} customers, {total_orders} orders, {total_revenue} revenue\n"
@@ -54,3 +62,122 @@ def generate_crm_report():
         with open("/tmp/crm_report_log.txt", "a") as f:
             f.write(f"{timestamp} - Error generating report: {e}\n")
         print(f"Error generating CRM report: {e}")
+
+
+@shared_task
+def rebuild_sales_rollups():
+    """
+    Recompute the customer and product sales rollups from the orders, to
+    fold in changes made after the orders were created.
+    """
+    from crm import response_cache, rollups
+    from crm.models import Customer, Product
+
+    rollups.rebuild()
+    # Set-based updates send no signals
+    response_cache.invalidate(Customer, Product)
+
+
+# ============================================================
+# ORDER REMINDERS
+# ============================================================
+
+def load_reminder_cursor():
+    try:
+        with open(get_reminder_setting("STATE_FILE")) as f:
+            return json.load(f).get("cursor")
+    except (OSError, ValueError):
+        return None
+
+
+def save_reminder_cursor(cursor):
+    path = get_reminder_setting("STATE_FILE")
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as f:
+        json.dump({"cursor": cursor, "updated": datetime.now().isoformat()}, f)
+    os.replace(f.name, path)
+
+
+def collect_reminder_pages(after=None):
+    """
+    Page through the orders placed after the ``after`` cursor (and inside the
+    reminder window) in id order, reading only the page boundaries.
+
+    Returns ``(start date, [(after, until) cursor range of each page])``.
+    """
+    start_date = (datetime.now() - timedelta(days=get_reminder_setting("WINDOW_DAYS"))).date()
+    pages = []
+    while True:
+        info = execute(REMINDER_PAGES_QUERY, {
+            "startDate": start_date.isoformat(),
+            "first": get_reminder_setting("CHUNK_SIZE"),
+            "after": after,
+        })["allOrders"]["pageInfo"]
+        if info["endCursor"] is not None:
+            pages.append((after, info["endCursor"]))
+            after = info["endCursor"]
+        if not info["hasNextPage"]:
+            return start_date.isoformat(), pages
+
+
+@shared_task
+def send_order_reminders():
+    """
+    Remind each customer once about their orders placed since the last run.
+
+    Each page of orders is read by a ``read_reminder_page`` task in parallel;
+    ``finish_order_reminders`` merges them per customer, writes the reminders
+    and only then moves the high-water mark, so a failed page is retried by
+    the next run. Nothing but the cursors is held here.
+
+    Returns the number of pages dispatched.
+    """
+    start_date, pages = collect_reminder_pages(load_reminder_cursor())
+    if not pages:
+        return 0
+    chord(
+        read_reminder_page.s(start_date, after, until) for after, until in pages
+    )(finish_order_reminders.s(pages[-1][1]))
+    return len(pages)
+
+
+@shared_task
+def read_reminder_page(start_date, after, until):
+    """
+    Return ``[[email, [order ids]], ...]`` for the orders after the ``after``
+    cursor up to and including ``until``.
+    """
+    page = execute(REMINDER_QUERY, {
+        "startDate": start_date,
+        "first": get_reminder_setting("CHUNK_SIZE"),
+        "after": after,
+    })["allOrders"]
+    reminders = {}
+    for edge in page["edges"]:
+        node = edge["node"]
+        reminders.setdefault(node["customer"]["email"], []).append(node["id"])
+        if edge["cursor"] == until:
+            break
+    return list(reminders.items())
+
+
+@shared_task
+def finish_order_reminders(pages, cursor):
+    """
+    Log one reminder per customer across ``pages`` (in order), then save
+    ``cursor`` as the high-water mark; return how many were sent.
+    """
+    reminders = {}
+    for page in pages:
+        for email, order_ids in page:
+            reminders.setdefault(email, []).extend(order_ids)
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    lines = "".join(
+        f"{timestamp} - Order ID {', '.join(order_ids)}, Customer {email}\n"
+        for email, order_ids in reminders.items()
+    )
+    with open(get_reminder_setting("LOG_FILE"), "a") as f:
+        f.write(lines)
+    save_reminder_cursor(cursor)
+    print(f"Order reminders processed! ({len(reminders)} customers)")
+    return len(reminders)
@@ -1,3 +1,1308 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_init
+from django.test import (
+    AsyncClient,
+    Client,
+    LiveServerTestCase,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    modify_settings,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from gql.transport.exceptions import TransportQueryError
+from graphql_relay import from_global_id, offset_to_cursor, to_global_id
+
+from crm.cron_jobs.send_order_reminders import REMINDER_QUERY
+from crm import response_cache, rollups, tasks
+from crm.benchmarks import bench_crm_stats, compare
+from crm.celery import app as celery_app
+from crm.graphql_client import (
+    HTTPClient,
+    LocalClient,
+    execute,
+    execute_batch,
+    get_client,
+    in_django_process,
+)
+from crm.filters import CustomerFilter, OrderFilter, ProductFilter
+from crm.management.commands.benchmark import holds_dataset
+from crm.management.commands.cleanup_inactive_customers import delete_customers, inactive_customers
+from crm.models import Customer, Order, OrderItem, Product
+from crm.persisted_queries import get_document_cache, query_hash, schema_hash
+from crm.schema import BULK_BATCH_SIZE, schema
+from crm.seed_db import seed
+from crm.tracing import get_sink
+
+
+def seed_orders(count, products_per_order=2):
+    customers = Customer.objects.bulk_create([
+        Customer(name=f"Customer {i}", email=f"customer{i}@example.com")
+        for i in range(max(count // 2, 1))
+    ])
+    products = Product.objects.bulk_create([
+        Product(name=f"Product {i}", price=10 + i, stock=100)
+        for i in range(products_per_order + 1)
+    ])
+    orders = Order.objects.bulk_create([
+        Order(customer=customers[i % len(customers)], total_amount=0)
+        for i in range(count)
+    ])
+    OrderItem.objects.bulk_create([
+        OrderItem(order_id=order.pk, product_id=product.pk, unit_price=product.price)
+        for order in orders
+        for product in products[:products_per_order]
+    ])
+    return orders
+
+
+class DataLoaderQueryCountTests(TestCase):
+    def execute(self, query, variables=None):
+        request = RequestFactory().post("/graphql/")
+        result = schema.execute(query, variable_values=variables, context_value=request)
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def test_reminder_query_is_constant_in_order_count(self):
+        start_date = (timezone.now() - timedelta(days=7)).date().isoformat()
+        for count in (5, 50):
+            Order.objects.all().delete()
+            Customer.objects.all().delete()
+            Product.objects.all().delete()
+            seed_orders(count)
+            # The keyset page of orders joined to its customers, no COUNT(*)
+            with self.assertNumQueries(1):
+                data = self.execute(REMINDER_QUERY, {"startDate": start_date, "first": 100})
+            edges = data["allOrders"]["edges"]
+            self.assertEqual(len(edges), count)
+            self.assertTrue(all(e["node"]["customer"]["email"] for e in edges))
+
+    def test_nested_relations_are_batched(self):
+        seed_orders(20)
+        query = """
+        query {
+          allOrders {
+            edges { node {
+              customer { email orders { edges { node { id } } } }
+              products { edges { node { name } } }
+            } }
+          }
+        }
+        """
+        # COUNT(*), the page joined to customers, then one windowed query
+        # each for the customers' orders and the order products
+        with self.assertNumQueries(4):
+            data = self.execute(query)
+        node = data["allOrders"]["edges"][0]["node"]
+        self.assertEqual(len(node["products"]["edges"]), 2)
+        self.assertEqual(len(node["customer"]["orders"]["edges"]), 2)
+
+    def test_nested_pages_only_read_their_rows(self):
+        customers = [
+            Customer.objects.create(name=f"C{i}", email=f"c{i}@example.com") for i in range(3)
+        ]
+        Order.objects.bulk_create([
+            Order(customer=customer, total_amount=1) for customer in customers for _ in range(30)
+        ])
+        query = """
+        query {
+          allCustomers(first: 3) { edges { node {
+            orders(first: 2) { totalCount edges { node { id } } pageInfo { hasNextPage } }
+          } } }
+        }
+        """
+        read = []
+        receiver = lambda instance, **kwargs: read.append(instance)  # noqa: E731
+        post_init.connect(receiver, sender=Order)
+        self.addCleanup(post_init.disconnect, receiver, sender=Order)
+        # COUNT(*), the page of customers, then two orders per customer
+        with self.assertNumQueries(3):
+            data = self.execute(query)
+        self.assertEqual(len(read), 6)
+        for edge in data["allCustomers"]["edges"]:
+            orders = edge["node"]["orders"]
+            self.assertEqual(len(orders["edges"]), 2)
+            self.assertEqual(orders["totalCount"], 30)
+            self.assertTrue(orders["pageInfo"]["hasNextPage"])
+
+        # Cursor paging goes through the per-customer queryset
+        query = """
+        query next($after: String) {
+          allCustomers(first: 1) { edges { node {
+            orders(first: 2, after: $after) { edges { node { id } } }
+          } } }
+        }
+        """
+        ids = Order.objects.filter(customer=customers[0]).order_by("pk").values_list("pk", flat=True)
+        data = self.execute(query, {"after": offset_to_cursor(1)})
+        edges = data["allCustomers"]["edges"][0]["node"]["orders"]["edges"]
+        self.assertEqual([from_global_id(e["node"]["id"])[1] for e in edges], [str(pk) for pk in ids[2:4]])
+
+
+class QueryOptimizerTests(TestCase):
+    def test_only_selected_columns_are_fetched_through_fragments(self):
+        seed_orders(3)
+        query = """
+        query {
+          allOrders { edges { node { ...OrderFields } } }
+        }
+        fragment OrderFields on OrderNode {
+          id
+          ... on OrderNode { customer { name } }
+        }
+        """
+        request = RequestFactory().post("/graphql/")
+        with CaptureQueriesContext(connection) as ctx:
+            result = schema.execute(query, context_value=request)
+        self.assertIsNone(result.errors)
+        page_sql = ctx.captured_queries[-1]["sql"]
+        self.assertIn('"crm_customer"."name"', page_sql)
+        self.assertNotIn("total_amount", page_sql)
+        self.assertNotIn('"crm_customer"."email"', page_sql)
+
+
+class CrmStatsTests(TestCase):
+    def test_totals_and_buckets_are_aggregated_in_one_query_each(self):
+        orders = seed_orders(4)
+        Order.objects.filter(pk__in=[o.pk for o in orders]).update(total_amount=25)
+        query = """
+        query {
+          crmStats(bucket: DAY, productName: "Product") {
+            totalCustomers totalOrders totalRevenue
+            buckets { totalOrders totalRevenue }
+          }
+        }
+        """
+        with self.assertNumQueries(3):
+            result = schema.execute(query)
+        self.assertIsNone(result.errors)
+        stats = result.data["crmStats"]
+        self.assertEqual(stats["totalCustomers"], 2)
+        # Orders match two products each but must only be counted once
+        self.assertEqual(stats["totalOrders"], 4)
+        self.assertEqual(stats["totalRevenue"], "100")
+        self.assertEqual(stats["buckets"], [{"totalOrders": 4, "totalRevenue": "100"}])
+
+
+class BulkCreateCustomersTests(TestCase):
+    MUTATION = """
+    mutation bulkCreate($input: [CustomerInput]!) {
+      bulkCreateCustomers(input: $input) { customers { email } errors }
+    }
+    """
+
+    def test_duplicates_and_invalid_rows_are_reported_by_index(self):
+        Customer.objects.create(name="Existing", email="taken@example.com")
+        rows = [
+            {"name": "A", "email": "a@example.com"},
+            {"name": "B", "email": "taken@example.com"},
+            {"name": "C", "email": "not-an-email"},
+            {"name": "D", "email": "a@example.com"},
+            {"name": "E", "email": "e@example.com", "phone": "123-456-7890"},
+        ]
+        result = schema.execute(self.MUTATION, variable_values={"input": rows})
+        self.assertIsNone(result.errors)
+        data = result.data["bulkCreateCustomers"]
+        self.assertEqual(
+            [c["email"] for c in data["customers"]], ["a@example.com", "e@example.com"]
+        )
+        self.assertEqual(data["errors"], [
+            "[1] Email already exists: taken@example.com",
+            "[2] Invalid email format",
+            "[3] Email already exists: a@example.com",
+        ])
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        rows = [{"name": f"C{i}", "email": f"c{i}@example.com"} for i in range(2500)]
+        with CaptureQueriesContext(connection) as ctx:
+            result = schema.execute(self.MUTATION, variable_values={"input": rows})
+        self.assertIsNone(result.errors)
+        selects = [q for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+        # One duplicate lookup per chunk; inserts are batched by the backend
+        self.assertEqual(len(selects), 3)
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith('INSERT INTO "crm_customer"')]
+        fields = [f for f in Customer._meta.concrete_fields if not f.primary_key]
+        batch = min(BULK_BATCH_SIZE, connection.ops.bulk_batch_size(fields, rows) or BULK_BATCH_SIZE)
+        self.assertEqual(len(inserts), -(-len(rows) // batch))
+        self.assertEqual(Customer.objects.count(), 2500)
+
+
+class BulkUpsertProductsTests(TestCase):
+    MUTATION = """
+    mutation upsert($input: [ProductInput]!) {
+      bulkUpsertProducts(input: $input) { products { sku name price stock unitsSold } upsertedCount errors }
+    }
+    """
+
+    def upsert(self, rows):
+        result = schema.execute(self.MUTATION, variable_values={"input": rows})
+        self.assertIsNone(result.errors)
+        return result.data["bulkUpsertProducts"]
+
+    def test_creates_updates_and_reports_rows_by_index(self):
+        Product.objects.create(sku="PEN", name="Pen", price=1, stock=7, units_sold=3)
+        data = self.upsert([
+            {"sku": "PEN", "name": "Blue pen", "price": "1.50"},
+            {"sku": "INK", "name": "Ink", "price": "3", "stock": 4},
+            {"sku": "BAD", "name": "Bad", "price": "-1"},
+            {"sku": "LONG", "name": "x" * 101, "price": "1"},
+        ])
+        self.assertEqual(data["upsertedCount"], 2)
+        # The stored rows come back, including the stock the row left alone
+        self.assertEqual(
+            {p["sku"]: (p["stock"], p["unitsSold"]) for p in data["products"]},
+            {"PEN": (7, 3), "INK": (4, 0)},
+        )
+        self.assertEqual(data["errors"], [
+            "[2] Price must be positive",
+            "[3] name: Ensure this value has at most 100 characters (it has 101).",
+        ])
+        pen = Product.objects.get(sku="PEN")
+        # A row without a stock leaves it alone
+        self.assertEqual((pen.name, pen.price, pen.stock), ("Blue pen", Decimal("1.50"), 7))
+        self.assertEqual(Product.objects.get(sku="INK").stock, 4)
+        self.assertEqual(
+            list(ProductFilter({"search": "blue"}, queryset=Product.objects.all()).qs), [pen]
+        )
+
+    def test_reruns_are_idempotent_and_writes_are_batched(self):
+        rows = [{"sku": f"S{i}", "name": f"P{i}", "price": "2", "stock": i} for i in range(1500)]
+        self.upsert(rows)
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.upsert(rows)
+        self.assertEqual(data["upsertedCount"], 1500)
+        self.assertEqual(Product.objects.count(), 1500)
+        # One SELECT per batch reads back the stored rows
+        selects = [q for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+        self.assertEqual(len(selects), -(-len(rows) // BULK_BATCH_SIZE))
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith('INSERT INTO "crm_product"')]
+        fields = [f for f in Product._meta.concrete_fields if not f.primary_key]
+        batch = min(BULK_BATCH_SIZE, connection.ops.bulk_batch_size(fields, rows) or BULK_BATCH_SIZE)
+        self.assertEqual(len(inserts), -(-len(rows) // batch))
+
+
+class ImportProductsCommandTests(TestCase):
+    def write(self, suffix, text):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False) as f:
+            f.write(text)
+        self.addCleanup(os.unlink, f.name)
+        return f.name
+
+    def run_import(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command("import_products", *args, stdout=out, stderr=err)
+        return out.getvalue().strip(), err.getvalue().strip().splitlines()
+
+    def test_csv_rows_are_upserted_in_batches(self):
+        path = self.write(".csv", "sku,name,price,stock\nA,Apple,1,5\nB,Banana,x,1\nC,Cherry,2,\n")
+        out, errors = self.run_import(path, "--batch-size", "2")
+        self.assertEqual(out, "Upserted 2 products (1 rows rejected)")
+        self.assertEqual(errors, ["[2] Invalid price"])
+        self.assertEqual(
+            list(Product.objects.order_by("sku").values_list("sku", "stock")), [("A", 5), ("C", 0)]
+        )
+
+    def test_ndjson_rows_are_numbered_across_batches(self):
+        path = self.write(".ndjson", '{"sku": "A", "name": "Apple", "price": 1}\nnot json\n[1]\n')
+        out, errors = self.run_import(path, "--batch-size", "1")
+        self.assertEqual(out, "Upserted 1 products (2 rows rejected)")
+        self.assertEqual(errors, ["[2] Invalid JSON", "[3] Expected a JSON object"])
+
+
+class CreateOrderTests(TestCase):
+    MUTATION = """
+    mutation createOrder($customerId: ID!, $productIds: [ID]!, $quantities: [Int]) {
+      createOrder(customerId: $customerId, productIds: $productIds, quantities: $quantities) {
+        order { totalAmount }
+        error
+      }
+    }
+    """
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price=100, stock=5)
+        self.mouse = Product.objects.create(name="Mouse", price=20, stock=1)
+
+    def create(self, product_ids, quantities=None):
+        result = schema.execute(self.MUTATION, variable_values={
+            "customerId": self.customer.pk,
+            "productIds": product_ids,
+            "quantities": quantities,
+        })
+        self.assertIsNone(result.errors)
+        return result.data["createOrder"]
+
+    def test_quantities_are_totalled_and_reserved(self):
+        data = self.create([self.laptop.pk, self.mouse.pk], [2, 1])
+        self.assertIsNone(data["error"])
+        self.assertEqual(data["order"]["totalAmount"], "220.00")
+        self.laptop.refresh_from_db()
+        self.mouse.refresh_from_db()
+        self.assertEqual((self.laptop.stock, self.mouse.stock), (3, 0))
+
+    def test_insufficient_stock_rolls_back_every_line(self):
+        data = self.create([self.laptop.pk, self.mouse.pk], [1, 2])
+        self.assertEqual(data["error"], f"Insufficient stock for product ID(s): {self.mouse.pk}")
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_query_count_does_not_grow_with_lines(self):
+        products = Product.objects.bulk_create([
+            Product(name=f"P{i}", price=1, stock=10) for i in range(20)
+        ])
+        # customer, products, stock UPDATE, order and line INSERTs, the
+        # customer and product rollup UPDATEs, inside a savepoint
+        with self.assertNumQueries(9):
+            data = self.create([p.pk for p in products])
+        self.assertIsNone(data["error"])
+
+
+class BulkCreateOrdersTests(TestCase):
+    MUTATION = """
+    mutation bulkCreate($input: [OrderInput]!) {
+      bulkCreateOrders(input: $input) { orders { totalAmount orderDate } createdCount errors }
+    }
+    """
+
+    def setUp(self):
+        self.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price=100, stock=5)
+        self.mouse = Product.objects.create(name="Mouse", price=20, stock=10)
+
+    def create(self, orders):
+        result = schema.execute(self.MUTATION, variable_values={"input": orders})
+        self.assertIsNone(result.errors)
+        return result.data["bulkCreateOrders"]
+
+    def test_orders_are_validated_against_the_whole_batch(self):
+        alice, laptop, mouse = self.alice.pk, self.laptop.pk, self.mouse.pk
+        data = self.create([
+            {"customerId": alice, "productIds": [laptop, mouse], "quantities": [3, 1],
+             "orderDate": "2025-01-02T03:04:05+00:00"},
+            {"customerId": alice, "productIds": [laptop], "quantities": [3]},
+            {"customerId": 0, "productIds": [mouse]},
+            {"customerId": alice, "productIds": [0]},
+            {"customerId": alice, "productIds": [mouse, mouse]},
+        ])
+        self.assertEqual(data["createdCount"], 2)
+        self.assertEqual(data["errors"], [
+            f"[1] Insufficient stock for product ID(s): {laptop}",
+            "[2] Invalid customer ID",
+            "[3] Invalid product ID: 0",
+        ])
+        self.assertEqual([o["totalAmount"] for o in data["orders"]], ["320.00", "40.00"])
+        self.assertEqual(data["orders"][0]["orderDate"], "2025-01-02T03:04:05+00:00")
+        self.laptop.refresh_from_db()
+        self.mouse.refresh_from_db()
+        self.assertEqual((self.laptop.stock, self.mouse.stock), (2, 7))
+        self.assertEqual(OrderItem.objects.get(order__total_amount=40).quantity, 2)
+        self.alice.refresh_from_db()
+        self.assertEqual((self.alice.order_count, self.alice.lifetime_value), (2, Decimal("360.00")))
+
+    def test_references_are_resolved_once_and_writes_are_chunked(self):
+        customers = Customer.objects.bulk_create([
+            Customer(name=f"C{i}", email=f"c{i}@example.com") for i in range(10)
+        ])
+        products = Product.objects.bulk_create([
+            Product(name=f"P{i}", price=1, stock=1000) for i in range(20)
+        ])
+        orders = [
+            {"customerId": customers[i % 10].pk, "productIds": [products[i % 20].pk, products[(i + 1) % 20].pk]}
+            for i in range(2500)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.create(orders)
+        self.assertEqual((data["createdCount"], data["errors"]), (2500, []))
+        selects = [q for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+        self.assertEqual(len(selects), 2)
+        # Three chunks of stock, order, line and rollup statements
+        self.assertLess(len(ctx.captured_queries), 60)
+        self.assertEqual(OrderItem.objects.count(), 5000)
+        self.assertEqual(Product.objects.get(pk=products[0].pk).stock, 750)
+
+
+class OrderItemTotalsTests(TestCase):
+    def setUp(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price=100, stock=5)
+        self.mouse = Product.objects.create(name="Mouse", price=20, stock=5)
+        self.order = Order.objects.create(customer=customer)
+
+    def total(self):
+        self.order.refresh_from_db()
+        return self.order.total_amount
+
+    def test_line_changes_update_the_total_in_constant_queries(self):
+        # INSERT or UPDATE of the line, then one UPDATE of the order
+        with self.assertNumQueries(2):
+            line = OrderItem.objects.create(
+                order=self.order, product=self.laptop, quantity=2, unit_price=self.laptop.price
+            )
+        self.assertEqual(self.total(), 200)
+        line.quantity = 3
+        with self.assertNumQueries(2):
+            line.save()
+        self.assertEqual(self.total(), 300)
+
+        self.order.products.add(self.mouse, through_defaults={"unit_price": self.mouse.price})
+        self.assertEqual(self.total(), 320)
+        line.delete()
+        self.assertEqual(self.total(), 20)
+        self.mouse.orders.clear()
+        self.assertEqual(self.total(), 0)
+
+    def test_price_changes_do_not_alter_past_orders(self):
+        OrderItem.objects.create(order=self.order, product=self.laptop, unit_price=self.laptop.price)
+        Product.objects.filter(pk=self.laptop.pk).update(price=150)
+        self.assertEqual(self.total(), 100)
+        data = schema.execute(
+            "{ allOrders { edges { node { totalAmount products { edges { node { price } } } } } } }"
+        ).data
+        node = data["allOrders"]["edges"][0]["node"]
+        self.assertEqual(node["totalAmount"], "100.00")
+        self.assertEqual(node["products"]["edges"][0]["node"]["price"], "150.00")
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price=100, stock=10)
+        self.mouse = Product.objects.create(name="Mouse", price=20, stock=10)
+
+    def order(self, customer, lines):
+        result = schema.execute(
+            "mutation($c: ID!, $p: [ID]!, $q: [Int]) { createOrder(customerId: $c, productIds: $p, quantities: $q) { error } }",
+            variable_values={"c": customer.pk, "p": [p.pk for p, _ in lines], "q": [q for _, q in lines]},
+        )
+        self.assertIsNone(result.errors)
+        self.assertIsNone(result.data["createOrder"]["error"])
+
+    def rollups(self):
+        return (
+            list(Customer.objects.order_by("pk").values_list("lifetime_value", "order_count", "last_order_date")),
+            list(Product.objects.order_by("pk").values_list("units_sold", "revenue")),
+        )
+
+    def test_order_creation_updates_rollups_and_rebuild_agrees(self):
+        self.order(self.alice, [(self.laptop, 2), (self.mouse, 1)])
+        self.order(self.alice, [(self.mouse, 3)])
+        self.order(self.bob, [(self.laptop, 1)])
+        self.alice.refresh_from_db()
+        self.assertEqual((self.alice.lifetime_value, self.alice.order_count), (280, 2))
+        self.assertEqual(self.alice.last_order_date, Order.objects.filter(customer=self.alice).latest("pk").order_date)
+        self.mouse.refresh_from_db()
+        self.assertEqual((self.mouse.units_sold, self.mouse.revenue), (4, 80))
+
+        recorded = self.rollups()
+        rollups.rebuild(batch_size=1)
+        self.assertEqual(self.rollups(), recorded)
+
+        Order.objects.filter(customer=self.bob).delete()
+        tasks.rebuild_sales_rollups()
+        self.bob.refresh_from_db()
+        self.assertEqual((self.bob.lifetime_value, self.bob.order_count, self.bob.last_order_date), (0, 0, None))
+
+    def test_scheduled_rebuild_runs_under_the_celery_settings(self):
+        from crm import settings as celery_settings
+
+        self.assertIn("crm", celery_settings.INSTALLED_APPS)
+        self.assertTrue(celery_settings.DATABASES)
+        entry = celery_settings.CELERY_BEAT_SCHEDULE["rebuild-sales-rollups"]
+        self.order(self.alice, [(self.laptop, 1)])
+        Customer.objects.filter(pk=self.alice.pk).update(lifetime_value=0, order_count=0)
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", eager)
+        celery_app.tasks[entry["task"]].delay()
+        self.alice.refresh_from_db()
+        self.assertEqual((self.alice.lifetime_value, self.alice.order_count), (100, 1))
+
+    def test_top_customers_and_best_sellers_are_sortable(self):
+        self.order(self.bob, [(self.laptop, 1)])
+        self.order(self.alice, [(self.mouse, 2)])
+        data = schema.execute("""{
+            allCustomers(orderBy: "-lifetime_value", first: 1) { edges { node { name lifetimeValue orderCount } } }
+            allProducts(orderBy: "-units_sold", first: 1) { edges { node { name unitsSold revenue } } }
+        }""").data
+        self.assertEqual(
+            data["allCustomers"]["edges"][0]["node"],
+            {"name": "Bob", "lifetimeValue": "100.00", "orderCount": 1},
+        )
+        self.assertEqual(
+            data["allProducts"]["edges"][0]["node"],
+            {"name": "Mouse", "unitsSold": 2, "revenue": "40.00"},
+        )
+
+
+class UpdateLowStockProductsTests(TestCase):
+    MUTATION = """
+    mutation {
+      updateLowStockProducts(threshold: 5, amount: 7, limit: 2) {
+        updatedProducts { stock }
+        updatedCount
+      }
+    }
+    """
+
+    def test_restock_is_one_update_and_response_is_limited(self):
+        Product.objects.bulk_create([
+            Product(name=f"P{i}", price=1, stock=i) for i in range(10)
+        ])
+        # savepoint, UPDATE ... RETURNING, page of products, release
+        with self.assertNumQueries(4):
+            result = schema.execute(self.MUTATION)
+        self.assertIsNone(result.errors)
+        data = result.data["updateLowStockProducts"]
+        self.assertEqual(data["updatedCount"], 5)
+        self.assertEqual(data["updatedProducts"], [{"stock": 7}, {"stock": 8}])
+        self.assertEqual(
+            list(Product.objects.order_by("pk").values_list("stock", flat=True)),
+            [7, 8, 9, 10, 11, 5, 6, 7, 8, 9],
+        )
+
+
+@skipUnlessDBFeature("supports_partial_indexes")
+class FilterIndexUsageTests(TestCase):
+    """Every filter and order_by option must be served by an index (SQLite plans)."""
+
+    CASES = [
+        (CustomerFilter, {"phone_pattern": "+1"}, "crm_customer_phone_idx"),
+        (CustomerFilter, {"order_by": "name"}, "crm_customer_name_idx"),
+        (ProductFilter, {"price_gte": "5"}, "crm_product_price_idx"),
+        (ProductFilter, {"stock_lte": "5"}, "crm_product_stock_idx"),
+        (ProductFilter, {"order_by": "-name"}, "crm_product_name_idx"),
+        (OrderFilter, {"order_date_gte": "2025-01-01"}, "crm_order_date_idx"),
+        (OrderFilter, {"total_amount_lte": "100"}, "crm_order_total_idx"),
+        (OrderFilter, {"order_by": "-order_date"}, "crm_order_date_idx"),
+        (CustomerFilter, {"order_by": "-lifetime_value"}, "crm_customer_ltv_idx"),
+        (CustomerFilter, {"order_by": "-last_order_date"}, "crm_customer_last_order_idx"),
+        (ProductFilter, {"order_by": "-units_sold"}, "crm_product_units_sold_idx"),
+        (ProductFilter, {"order_by": "-revenue"}, "crm_product_revenue_idx"),
+    ]
+
+    def assertUsesIndex(self, queryset, index):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN output is only asserted for SQLite")
+        plan = queryset.explain()
+        self.assertIn(f"USING INDEX {index}", plan)
+
+    def test_filters_use_indexes(self):
+        for filterset_class, data, index in self.CASES:
+            with self.subTest(filter=filterset_class.__name__, data=data):
+                model = filterset_class._meta.model
+                filterset = filterset_class(data=data, queryset=model.objects.all())
+                self.assertUsesIndex(filterset.qs[:10], index)
+
+    def test_low_stock_restock_uses_partial_index(self):
+        self.assertUsesIndex(Product.objects.filter(stock__lt=10), "crm_product_low_stock_idx")
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.alice = Customer.objects.create(name="Alice Smith", email="alice@example.com")
+        self.alicia = Customer.objects.create(name="Alicia Keys", email="keys@example.com")
+        self.bob = Customer.objects.create(name="Bob Stone", email="bob@smith.org")
+        self.laptop = Product.objects.create(name="Laptop Stand", price=30, stock=5)
+        self.sleeve = Product.objects.create(name="Laptop Sleeve", price=20, stock=5)
+        self.order = Order.objects.create(customer=self.bob)
+        for product in (self.laptop, self.sleeve):
+            OrderItem.objects.create(order=self.order, product=product, unit_price=product.price)
+
+    def names(self, field, search, **args):
+        arguments = ", ".join([f"search: {json.dumps(search)}", *(f"{k}: {json.dumps(v)}" for k, v in args.items())])
+        result = schema.execute(f"{{ {field}({arguments}) {{ edges {{ node {{ id }} }} }} }}")
+        self.assertIsNone(result.errors)
+        return [from_global_id(e["node"]["id"])[1] for e in result.data[field]["edges"]]
+
+    def test_customers_match_word_prefixes_in_rank_order(self):
+        self.assertEqual(self.names("allCustomers", "ali"), [str(self.alice.pk), str(self.alicia.pk)])
+        self.assertEqual(self.names("allCustomers", "smith"), [str(self.alice.pk), str(self.bob.pk)])
+        self.assertEqual(self.names("allCustomers", "ali smi"), [str(self.alice.pk)])
+        # An explicit order_by replaces the rank ordering
+        self.assertEqual(
+            self.names("allCustomers", "smith", orderBy="-name"), [str(self.bob.pk), str(self.alice.pk)]
+        )
+        # Query syntax in the input is matched literally
+        self.assertEqual(self.names("allCustomers", 'ali" OR bob*'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.laptop.name = "Monitor Arm"
+        self.laptop.save()
+        self.assertEqual(self.names("allProducts", "laptop"), [str(self.sleeve.pk)])
+        self.assertEqual(self.names("allProducts", "monitor"), [str(self.laptop.pk)])
+        self.alice.delete()
+        self.assertEqual(self.names("allCustomers", "ali"), [str(self.alicia.pk)])
+
+    def test_orders_match_once_by_customer_or_product(self):
+        self.assertEqual(self.names("allOrders", "laptop"), [str(self.order.pk)])
+        self.assertEqual(self.names("allOrders", "bob"), [str(self.order.pk)])
+        self.assertEqual(self.names("allOrders", "alice"), [])
+        self.assertEqual(self.names("allOrders", None, productName="laptop"), [str(self.order.pk)])
+
+    def test_bulk_created_customers_are_searchable(self):
+        schema.execute(
+            'mutation { bulkCreateCustomers(input: [{name: "Zed Zulu", email: "zed@example.com"}]) { errors } }'
+        )
+        self.assertEqual(len(self.names("allCustomers", "zulu")), 1)
+
+
+class KeysetPaginationTests(TestCase):
+    QUERY = """
+    query page($first: Int, $last: Int, $after: String, $before: String) {
+      allOrders(keyset: true, orderBy: "-order_date", first: $first, last: $last,
+                after: $after, before: $before) {
+        edges { cursor node { id } }
+        pageInfo { hasNextPage hasPreviousPage endCursor startCursor }
+      }
+    }
+    """
+
+    def setUp(self):
+        self.orders = seed_orders(7)
+        # Give several orders the same timestamp so the id tie-break matters
+        now = timezone.now()
+        for i, order in enumerate(self.orders):
+            Order.objects.filter(pk=order.pk).update(order_date=now - timedelta(days=i // 2))
+        expected = Order.objects.order_by("-order_date", "-pk").values_list("pk", flat=True)
+        self.expected = list(expected)
+
+    def page(self, **variables):
+        result = schema.execute(self.QUERY, variable_values=variables)
+        self.assertIsNone(result.errors)
+        return result.data["allOrders"]
+
+    def pk(self, edge):
+        return from_global_id(edge["node"]["id"])[1]
+
+    def test_forward_paging_visits_every_row_once_without_count(self):
+        seen, after = [], None
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                page = self.page(first=3, after=after)
+            self.assertEqual(len(ctx.captured_queries), 1)
+            self.assertNotIn("OFFSET", ctx.captured_queries[0]["sql"])
+            seen.extend(int(self.pk(e)) for e in page["edges"])
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            after = page["pageInfo"]["endCursor"]
+        self.assertEqual(seen, self.expected)
+
+    def test_last_page_is_read_backwards(self):
+        page = self.page(last=2)
+        self.assertEqual([int(self.pk(e)) for e in page["edges"]], self.expected[-2:])
+        self.assertTrue(page["pageInfo"]["hasPreviousPage"])
+        before = page["pageInfo"]["startCursor"]
+        page = self.page(last=2, before=before)
+        self.assertEqual([int(self.pk(e)) for e in page["edges"]], self.expected[-4:-2])
+
+    def test_null_sort_values_page_as_the_lowest(self):
+        query = """
+        query page($orderBy: String, $after: String) {
+          allCustomers(keyset: true, orderBy: $orderBy, first: 2, after: $after) {
+            edges { node { id } }
+            pageInfo { hasNextPage endCursor }
+          }
+        }
+        """
+        for i in range(3):
+            Customer.objects.create(name=f"Lead {i}", email=f"lead{i}@example.com")
+        rollups.rebuild()
+        customers = list(Customer.objects.all())
+        # NULL first ascending, last descending, ties broken by id
+        ascending = sorted(
+            customers, key=lambda c: (c.last_order_date is not None, c.last_order_date or 0, c.pk)
+        )
+        for order_by, expected in (("last_order_date", ascending), ("-last_order_date", ascending[::-1])):
+            seen, after = [], None
+            while True:
+                result = schema.execute(query, variable_values={"orderBy": order_by, "after": after})
+                self.assertIsNone(result.errors)
+                page = result.data["allCustomers"]
+                seen.extend(int(self.pk(e)) for e in page["edges"])
+                if not page["pageInfo"]["hasNextPage"]:
+                    break
+                after = page["pageInfo"]["endCursor"]
+            self.assertEqual(seen, [c.pk for c in expected], order_by)
+
+    def test_total_count_is_only_counted_when_selected(self):
+        query = "{ allOrders(keyset: true, first: 2) { totalCount edges { node { id } } } }"
+        with self.assertNumQueries(2):
+            result = schema.execute(query)
+        self.assertEqual(result.data["allOrders"]["totalCount"], 7)
+
+
+class PersistedQueryTests(TestCase):
+    QUERY = "{ hello }"
+
+    def post(self, payload):
+        response = self.client.post("/graphql/", payload, content_type="application/json")
+        return response.status_code, response.json()
+
+    def persisted(self, query=None, sha256=None):
+        payload = {"extensions": {"persistedQuery": {
+            "version": 1, "sha256Hash": sha256 or query_hash(self.QUERY),
+        }}}
+        if query:
+            payload["query"] = query
+        return payload
+
+    def setUp(self):
+        cache.clear()
+
+    def test_hash_is_registered_then_served_without_query_text(self):
+        status, body = self.post(self.persisted())
+        self.assertEqual(body["errors"][0]["message"], "PersistedQueryNotFound")
+        status, body = self.post(self.persisted(query=self.QUERY))
+        self.assertEqual(body["data"], {"hello": "Hello, GraphQL!"})
+        status, body = self.post(self.persisted())
+        self.assertEqual(body["data"], {"hello": "Hello, GraphQL!"})
+
+    def test_mismatched_hash_is_rejected(self):
+        status, body = self.post(self.persisted(query=self.QUERY, sha256="0" * 64))
+        self.assertEqual(status, 400)
+
+    def test_documents_are_parsed_and_validated_once(self):
+        documents = get_document_cache()
+        misses = documents.misses
+        for _ in range(3):
+            self.post({"query": "{ hello allProducts { edges { node { id } } } }"})
+        self.assertEqual(documents.misses, misses + 1)
+
+    def test_allowlist_only_rejects_unlisted_queries(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump({query_hash(self.QUERY): self.QUERY}, f)
+        self.addCleanup(os.unlink, f.name)
+        config = {"ALLOWLIST": f.name, "ALLOWLIST_ONLY": True}
+        with self.settings(GRAPHQL_PERSISTED_QUERIES=config):
+            status, body = self.post(self.persisted())
+            self.assertEqual(body["data"], {"hello": "Hello, GraphQL!"})
+            status, body = self.post({"query": "{ allProducts { edges { node { id } } } }"})
+            self.assertEqual(status, 403)
+
+
+class ResponseCacheTests(TestCase):
+    QUERY = '{ allProducts(priceGte: 1) { edges { node { name stock } } } }'
+
+    def setUp(self):
+        cache.clear()
+        response_cache.response_cache().clear()
+        Product.objects.create(name="Laptop", price=100, stock=5)
+
+    def post(self, query):
+        response = self.client.post("/graphql/", {"query": query}, content_type="application/json")
+        return response.json()
+
+    def test_repeated_query_is_served_from_cache(self):
+        before = response_cache.stats()
+        first = self.post(self.QUERY)
+        with self.assertNumQueries(0):
+            second = self.post(self.QUERY)
+        self.assertEqual(first, second)
+        after = response_cache.stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+    def test_model_signals_invalidate(self):
+        self.post(self.QUERY)
+        Product.objects.create(name="Mouse", price=20, stock=5)
+        body = self.post(self.QUERY)
+        self.assertEqual(len(body["data"]["allProducts"]["edges"]), 2)
+
+    def test_mutations_invalidate_set_based_writes(self):
+        self.post(self.QUERY)
+        self.post("mutation { updateLowStockProducts { updatedCount } }")
+        body = self.post(self.QUERY)
+        self.assertEqual(body["data"]["allProducts"]["edges"][0]["node"]["stock"], 15)
+
+    def test_process_local_caches_need_a_single_process(self):
+        self.assertTrue(response_cache.enabled())
+        with override_settings(GRAPHQL_RESPONSE_CACHE={"ALIAS": "graphql"}):
+            self.assertFalse(response_cache.enabled())
+            self.post(self.QUERY)
+            with self.assertNumQueries(2):
+                self.post(self.QUERY)
+
+    def test_uncacheable_operations_are_not_stored(self):
+        self.assertIsNone(response_cache.dependencies(None))
+        before = response_cache.stats()
+        self.post("query { ...Root } fragment Root on Query { hello }")
+        self.assertEqual(response_cache.stats(), before)
+
+
+class BatchedOperationTests(TestCase):
+    def setUp(self):
+        Product.objects.create(name="Pen", price=1, stock=1)
+
+    def post(self, payload, url="/graphql/"):
+        response = self.client.post(url, payload, content_type="application/json")
+        return response.status_code, response.json()
+
+    def test_operations_run_in_order_and_see_earlier_writes(self):
+        stock = "{ allProducts { edges { node { stock } } } }"
+        status, body = self.post([
+            {"id": "before", "query": stock},
+            {"id": "restock", "query": "mutation { updateLowStockProducts { updatedCount } }"},
+            {"id": "after", "query": stock},
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual([entry["id"] for entry in body], ["before", "restock", "after"])
+        self.assertEqual(body[0]["data"]["allProducts"]["edges"][0]["node"]["stock"], 1)
+        self.assertEqual(body[1]["data"]["updateLowStockProducts"]["updatedCount"], 1)
+        self.assertEqual(body[2]["data"]["allProducts"]["edges"][0]["node"]["stock"], 11)
+
+    def test_rejected_operation_fails_alone(self):
+        status, body = self.post([{"query": "{ hello }"}, {"variables": {}}])
+        self.assertEqual(status, 400)
+        self.assertEqual(body[0]["data"], {"hello": "Hello, GraphQL!"})
+        self.assertEqual(body[0]["status"], 200)
+        self.assertEqual(body[1]["status"], 400)
+        self.assertEqual(body[1]["errors"][0]["message"], "Must provide query string.")
+
+    @override_settings(GRAPHQL_MAX_BATCH_SIZE=2)
+    def test_batch_size_is_capped(self):
+        status, body = self.post([{"query": "{ hello }"}] * 3)
+        self.assertEqual(status, 400)
+        self.assertIn("exceeds the limit of 2", body["errors"][0]["message"])
+        status, body = self.post([])
+        self.assertEqual(status, 400)
+
+    def test_batch_cost_is_budgeted_across_operations(self):
+        products = "{ allProducts(first: 5) { edges { node { stock } } } }"
+        status, body = self.post([{"query": products}])
+        self.assertEqual(status, 200)
+        cost = body[0]["extensions"]["cost"]["cost"]
+        budget = {"MAX_COST": 10000, "MAX_BATCH_COST": cost * 2, "MAX_DEPTH": 15, "DEFAULT_PAGE_SIZE": 20}
+        with override_settings(GRAPHQL_QUERY_COST=budget):
+            status, body = self.post([{"query": products}] * 2)
+            self.assertEqual(status, 200)
+            with CaptureQueriesContext(connection) as queries:
+                status, body = self.post([{"query": products}] * 3)
+        self.assertEqual(status, 400)
+        self.assertEqual(
+            body["errors"][0]["message"],
+            f"Batch has a cost of {cost * 3}, exceeding the maximum of {cost * 2}.",
+        )
+        self.assertEqual(len(queries), 0)
+
+    def test_async_view_takes_single_operations_only(self):
+        status, body = self.post([{"query": "{ hello }"}], url="/graphql/async/")
+        self.assertEqual(status, 400)
+
+
+@override_settings(GRAPHQL_RESPONSE_CACHE={"ENABLED": False})
+class AsyncGraphQLViewTests(TransactionTestCase):
+    QUERY = """
+    query {
+        allOrders(first: 2) { edges { node { customer { name } products { edges { node { name } } } } } }
+        allCustomers { totalCount }
+        hello
+    }
+    """
+
+    def setUp(self):
+        seed_orders(4)
+
+    def post(self, client, url, query):
+        return client.post(url, {"query": query}, content_type="application/json")
+
+    async def test_root_fields_resolve_concurrently_with_sync_result(self):
+        response = await self.post(AsyncClient(), "/graphql/async/", self.QUERY)
+        expected = await sync_to_async(self.post)(Client(), "/graphql/", self.QUERY)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(list(response.json()["data"]), ["allOrders", "allCustomers", "hello"])
+
+    async def test_mutations_and_errors(self):
+        response = await self.post(
+            AsyncClient(), "/graphql/async/",
+            'mutation { createProduct(name: "Pen", price: 2) { product { name } } }',
+        )
+        self.assertEqual(response.json()["data"]["createProduct"]["product"]["name"], "Pen")
+        response = await self.post(AsyncClient(), "/graphql/async/", "{ missing }")
+        self.assertEqual(response.status_code, 400)
+
+
+class StreamingExportTests(TestCase):
+    def setUp(self):
+        seed_orders(4)
+
+    def test_orders_ndjson_applies_filters_without_duplicates(self):
+        product = Product.objects.get(name="Product 0")
+        with self.assertNumQueries(2):
+            response = self.client.get("/export/orders.ndjson", {"product_name": "product"})
+            lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(sorted(lines[0]["product_ids"]), sorted(
+            Order.objects.get(pk=lines[0]["id"]).products.values_list("pk", flat=True)
+        ))
+        self.assertIn(product.pk, lines[0]["product_ids"])
+
+    def test_customers_csv(self):
+        response = self.client.get("/export/customers.csv", {"order_by": "-name"})
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0], "id,name,email,phone")
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1].split(",")[1], "Customer 1")
+
+    def test_invalid_filter(self):
+        response = self.client.get("/export/orders.ndjson", {"total_amount_gte": "abc"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("total_amount_gte", response.json()["errors"])
+
+
+class QueryCostTests(TestCase):
+    NESTED = """
+    query orders($first: Int) {
+        allOrders(first: $first) {
+            edges { node { customer { name } products(first: 10) { edges { node { name } } } } }
+        }
+    }
+    """
+
+    def post(self, query, variables=None):
+        return self.client.post(
+            "/graphql/", {"query": query, "variables": variables or {}},
+            content_type="application/json",
+        )
+
+    def test_cost_is_reported(self):
+        body = self.post(self.NESTED, {"first": 5}).json()
+        # allOrders 2 + 5 x (edges 1 + node 1 + customer 1 + products 2 + 10 x (edges 1 + node 1))
+        self.assertEqual(body["extensions"]["cost"], {"cost": 127, "depth": 7})
+
+    def test_over_budget_is_rejected_before_sql(self):
+        with self.assertNumQueries(0):
+            response = self.post(self.NESTED, {"first": 100000})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("exceeding the maximum", response.json()["errors"][0]["message"])
+
+    def test_negative_page_sizes_cost_nothing(self):
+        query = """
+        query orders($first: Int) {
+            allOrders(first: $first) { edges { node { customer { name } } } }
+            b: allProducts(first: -100000) { edges { node { id } } }
+        }
+        """
+        with self.assertNumQueries(0):
+            response = self.post(query, {"first": 100000})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("has a cost of 300004,", response.json()["errors"][0]["message"])
+
+    def test_unsized_connections_get_the_default_page_size(self):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        Order.objects.bulk_create([Order(customer=customer, total_amount=1) for _ in range(30)])
+        body = self.post(
+            "{ allCustomers { edges { node { orders { edges { node { id } } pageInfo { hasNextPage } } } } } }"
+        ).json()
+        orders = body["data"]["allCustomers"]["edges"][0]["node"]["orders"]
+        self.assertEqual(len(orders["edges"]), 20)
+        self.assertTrue(orders["pageInfo"]["hasNextPage"])
+        # allCustomers 2 + 20 x (edges 1 + node 1 + orders 2 + pageInfo 1 + 20 x (edges 1 + node 1))
+        self.assertEqual(body["extensions"]["cost"]["cost"], 902)
+
+    def test_invalid_page_size_variables_are_left_to_graphql(self):
+        response = self.post(self.NESTED, {"first": "5"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Int cannot represent", response.json()["errors"][0]["message"])
+
+
+@override_settings(GRAPHQL_RESPONSE_CACHE={"ENABLED": False})
+class TracingTests(TestCase):
+    QUERY = "{ allOrders(first: 2) { edges { node { totalAmount customer { name } } } } }"
+
+    def setUp(self):
+        seed_orders(4)
+        get_sink().reset()
+
+    def post(self, **headers):
+        return self.client.post(
+            "/graphql/", {"query": self.QUERY}, content_type="application/json", headers=headers
+        ).json()
+
+    @override_settings(GRAPHQL_TRACING={"ALLOW_ON_DEMAND": True})
+    def test_tracing_on_demand(self):
+        body = self.post(**{"X-GraphQL-Tracing": "1"})
+        tracing = body["extensions"]["tracing"]
+        self.assertEqual(tracing["version"], 1)
+        resolvers = {tuple(r["path"]): r for r in tracing["execution"]["resolvers"]}
+        # COUNT(*) and the page joined to customers, both run by the root field
+        self.assertEqual(resolvers[("allOrders",)]["sqlCount"], 2)
+        self.assertEqual(resolvers[("allOrders", "edges", 0, "node", "customer")]["sqlCount"], 0)
+        metrics = get_sink().snapshot()
+        self.assertEqual(metrics["request.duration_ms"]["count"], 1)
+        self.assertEqual(metrics["field.allOrders.sql_count"]["sum"], 2)
+        self.assertEqual(metrics["field.allOrders.edges.node.customer.duration_ms"]["count"], 2)
+
+    def test_untraced_requests_skip_the_middleware(self):
+        body = self.post()
+        self.assertNotIn("tracing", body["extensions"])
+        self.assertEqual(get_sink().snapshot(), {})
+
+    @override_settings(GRAPHQL_TRACING={})
+    def test_tracing_header_is_ignored_by_default(self):
+        body = self.post(**{"X-GraphQL-Tracing": "1"})
+        self.assertNotIn("tracing", body["extensions"])
+        self.assertEqual(get_sink().snapshot(), {})
+
+    @override_settings(GRAPHQL_TRACING={"SAMPLE_RATE": 1.0})
+    def test_sampled_requests_feed_the_sink_only(self):
+        body = self.post()
+        self.assertNotIn("tracing", body["extensions"])
+        self.assertEqual(get_sink().snapshot()["request.duration_ms"]["count"], 1)
+
+
+class BenchmarkHarnessTests(TestCase):
+    def test_seed_and_measure(self):
+        seed(customers=5, products=4, orders=12, lines_per_order=2)
+        stats = bench_crm_stats(iterations=3)
+        self.assertEqual(stats["queries"], 3)
+        self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+
+    def test_kept_database_must_hold_the_requested_dataset(self):
+        dataset = {"customers": 5, "products": 4, "orders": 12, "lines_per_order": 2, "seed": 0}
+        self.assertFalse(holds_dataset(dataset))
+        seed(**dataset)
+        self.assertTrue(holds_dataset(dataset))
+        self.assertFalse(holds_dataset({**dataset, "orders": 20}))
+
+    def test_compare_flags_regressions(self):
+        baseline = {"results": {"crm_stats": {"p95_ms": 10.0, "queries": 3, "mean_ms": 1.0}}}
+        results = {"results": {"crm_stats": {"p95_ms": 11.0, "queries": 4, "mean_ms": 9.0}}}
+        self.assertEqual(compare(results, baseline), ["crm_stats.queries: 3.00 -> 4.00"])
+
+
+class SeedDbTests(TestCase):
+    def dump(self):
+        return (
+            list(Customer.objects.values_list("name", "email", "phone")),
+            list(Product.objects.values_list("name", "price", "stock")),
+            list(Order.objects.values_list("customer_id", "total_amount")),
+            list(OrderItem.objects.values_list("order_id", "product_id", "quantity", "unit_price")),
+        )
+
+    def test_seeding_is_deterministic_and_consistent(self):
+        seed(customers=20, products=8, orders=50, lines_per_order=3, days=30, seed=7)
+        first = self.dump()
+        for model in (Order, Product, Customer):
+            model.objects.all().delete()
+        seed(customers=20, products=8, orders=50, lines_per_order=3, days=30, seed=7)
+        self.assertEqual(self.dump(), first)
+
+        for order in Order.objects.prefetch_related("items"):
+            self.assertEqual(order.total_amount, sum(i.line_total for i in order.items.all()))
+            self.assertTrue(1 <= len(order.items.all()) <= 3)
+        dates = Order.objects.values_list("order_date", flat=True)
+        self.assertGreater(max(dates) - min(dates), timedelta(days=1))
+        # New rows get ids after the seeded ones
+        self.assertGreater(Customer.objects.create(name="New", email="new@example.com").pk, 20)
+
+
+class LocalGraphQLClientTests(TestCase):
+    def test_runs_in_process_and_invalidates_after_mutations(self):
+        client = get_client()
+        self.assertIsInstance(client, LocalClient)
+        Product.objects.create(name="Pen", price=1, stock=1)
+        generation = response_cache.generations([Product])
+        data = client.execute(
+            "mutation restock($amount: Int!) { updateLowStockProducts(amount: $amount) { updatedCount } }",
+            {"amount": 5},
+        )
+        self.assertEqual(data["updateLowStockProducts"]["updatedCount"], 1)
+        self.assertNotEqual(response_cache.generations([Product]), generation)
+        with self.assertRaises(TransportQueryError):
+            client.execute("{ missing }")
+
+    def test_local_mode_needs_the_crm_app_and_a_database(self):
+        self.assertTrue(in_django_process())
+        with modify_settings(INSTALLED_APPS={"remove": "crm"}):
+            self.assertFalse(in_django_process())
+        with override_settings(DATABASES={}):
+            self.assertFalse(in_django_process())
+
+    def test_batches_share_a_context(self):
+        Product.objects.create(name="Pen", price=1, stock=1)
+        stock = "{ allProducts { edges { node { stock } } } }"
+        before, restock, after = execute_batch([
+            (stock, None),
+            ("mutation { updateLowStockProducts { updatedCount } }", None),
+            (stock, None),
+        ])
+        self.assertEqual(before["allProducts"]["edges"][0]["node"]["stock"], 1)
+        self.assertEqual(after["allProducts"]["edges"][0]["node"]["stock"], 11)
+
+
+@override_settings(ALLOWED_HOSTS=["*"])
+class HTTPGraphQLClientTests(LiveServerTestCase):
+    def setUp(self):
+        handle, self.schema_cache = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+        os.remove(self.schema_cache)
+        self.addCleanup(lambda: os.path.exists(self.schema_cache) and os.remove(self.schema_cache))
+
+    def make_client(self):
+        client = HTTPClient(url=f"{self.live_server_url}/graphql/", schema_cache=self.schema_cache)
+        self.addCleanup(client.close)
+        return client
+
+    def test_schema_is_cached_on_disk_and_refreshed_on_hash_change(self):
+        current = schema_hash(schema.graphql_schema)
+        self.assertEqual(self.make_client().execute("{ hello }"), {"hello": "Hello, GraphQL!"})
+        with open(self.schema_cache) as f:
+            cached = json.load(f)
+        self.assertEqual(cached["hash"], current)
+
+        # A second process reuses the cached schema: no introspection request
+        client = self.make_client()
+        sent = []
+        execute = client.transport.execute
+        client.transport.execute = lambda request, *a, **kw: sent.append(request) or execute(request, *a, **kw)
+        client.execute("{ hello }")
+        self.assertEqual(len(sent), 1)
+
+        cached["hash"] = "stale"
+        with open(self.schema_cache, "w") as f:
+            json.dump(cached, f)
+        client = self.make_client()
+        client.execute("{ hello }")
+        self.assertEqual(client.schema_hash, current)
+        with open(self.schema_cache) as f:
+            self.assertEqual(json.load(f)["hash"], current)
+
+    def test_batches_are_sent_as_one_request(self):
+        client = self.make_client()
+        sent = []
+        request = client.transport.session.request
+        client.transport.session.request = lambda *a, **kw: sent.append(kw["json"]) or request(*a, **kw)
+        results = client.execute_batch([
+            ("{ hello }", None),
+            ("query count($below: Decimal!) { allProducts(stockLte: $below) { totalCount } }", {"below": 9}),
+        ])
+        self.assertEqual(results, [{"hello": "Hello, GraphQL!"}, {"allProducts": {"totalCount": 0}}])
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(len(sent[0]), 2)
+
+
+class OrderReminderPipelineTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.log_file = os.path.join(self.directory.name, "reminders.log")
+        settings = override_settings(ORDER_REMINDERS={
+            "LOG_FILE": self.log_file,
+            "STATE_FILE": os.path.join(self.directory.name, "state.json"),
+            "CHUNK_SIZE": 3,
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Run the chord in-process
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", eager)
+
+    def reminders(self):
+        if not os.path.exists(self.log_file):
+            return []
+        with open(self.log_file) as f:
+            return [line.split(" - ", 1)[1].strip() for line in f]
+
+    def test_reminds_each_customer_once_per_new_order_batch(self):
+        seed_orders(8)
+        with self.assertNumQueries(6):
+            # Eight orders in pages of three: one keyset query per page for
+            # its boundaries, and one in the page's task for its rows
+            self.assertEqual(tasks.send_order_reminders(), 3)
+        reminders = self.reminders()
+        # Four customers round-robin over the three pages
+        self.assertEqual(len(reminders), 4)
+        self.assertEqual(sum(line.count(",") for line in reminders), 8)
+
+        # Nothing new: the high-water mark skips every reminded order
+        self.assertEqual(tasks.send_order_reminders(), 0)
+        self.assertEqual(len(self.reminders()), 4)
+
+        customer = Customer.objects.first()
+        order = Order.objects.create(customer=customer, total_amount=1)
+        self.assertEqual(tasks.send_order_reminders(), 1)
+        self.assertEqual(
+            self.reminders()[-1],
+            f"Order ID {to_global_id('OrderNode', order.pk)}, Customer {customer.email}",
+        )
+
+    def test_page_task_stops_at_its_range(self):
+        seed_orders(4)
+        start_date = timezone.now().date().isoformat()
+        page = execute(REMINDER_QUERY, {"startDate": start_date, "first": 3, "after": None})["allOrders"]
+        until = page["edges"][1]["cursor"]
+        reminders = tasks.read_reminder_page(start_date, None, until)
+        self.assertEqual(sum(len(order_ids) for _, order_ids in reminders), 2)
+
+    def test_cursor_only_moves_once_every_page_is_written(self):
+        seed_orders(8)
+        start_date, pages = tasks.collect_reminder_pages()
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(tasks.load_reminder_cursor())
+        results = [tasks.read_reminder_page(start_date, *page) for page in pages]
+        self.assertEqual(tasks.finish_order_reminders(results, pages[-1][1]), 4)
+        self.assertEqual(tasks.load_reminder_cursor(), pages[-1][1])
+
+
+class CleanupInactiveCustomersTests(TestCase):
+    def setUp(self):
+        old = timezone.now() - timedelta(days=400)
+        product = Product.objects.create(name="Pen", price=1, stock=1)
+        self.lapsed = Customer.objects.create(name="Lapsed", email="lapsed@example.com")
+        self.silent = Customer.objects.create(name="Silent", email="silent@example.com")
+        self.active = Customer.objects.create(name="Active", email="active@example.com")
+        self.new = Customer.objects.create(name="New", email="new@example.com")
+        Customer.objects.exclude(pk=self.new.pk).update(created_at=old)
+        lapsed_order = Order.objects.create(customer=self.lapsed, total_amount=1)
+        lapsed_order.products.add(product, through_defaults={"unit_price": product.price})
+        Order.objects.filter(pk=lapsed_order.pk).update(order_date=old)
+        Order.objects.create(customer=self.active, total_amount=1)
+
+    def cleanup(self, *args):
+        out = StringIO()
+        call_command("cleanup_inactive_customers", "--batch-size", "1", *args, stdout=out)
+        return out.getvalue().strip()
+
+    def test_dry_run_only_counts(self):
+        self.assertEqual(self.cleanup("--dry-run"), "Would delete 2 inactive customers (1 orders)")
+        self.assertEqual(Customer.objects.count(), 4)
+
+    def test_deletes_inactive_customers_with_their_orders(self):
+        self.assertEqual(self.cleanup(), "Deleted 2 inactive customers (1 orders)")
+        self.assertQuerySetEqual(
+            Customer.objects.order_by("name"), [self.active, self.new]
+        )
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_deleted_lines_leave_the_product_rollups(self):
+        rollups.rebuild()
+        self.assertEqual(Product.objects.get().units_sold, 1)
+        self.cleanup()
+        self.assertEqual(Product.objects.get().units_sold, 0)
+        self.assertFalse(CustomerFilter({"search": "lapsed"}, queryset=Customer.objects.all()).qs.exists())
+
+    def test_customers_ordering_since_selection_are_kept(self):
+        cutoff = timezone.now() - timedelta(days=365)
+        selected = inactive_customers(cutoff).filter(pk=self.lapsed.pk)
+        Order.objects.create(customer=self.lapsed, total_amount=1)
+        self.assertEqual(delete_customers(selected), (0, 0))
+        self.assertTrue(Customer.objects.filter(pk=self.lapsed.pk).exists())
@@ -0,0 +1,259 @@
+"""
+Sampled resolver tracing for the CRM GraphQL API.
+
+A traced request records the wall time of every resolver, the SQL statements
+(count and time) run while each field path was resolving, and the total
+request time. Traces are aggregated into per-path histograms in a
+process-local metrics sink, and returned as Apollo-style
+``extensions.tracing`` when the client sends ``X-GraphQL-Tracing: 1``.
+
+Untraced requests run without the middleware at all, so sampling off costs
+one random number per request.
+
+Configured with ``GRAPHQL_TRACING`` in settings::
+
+    GRAPHQL_TRACING = {
+        "SAMPLE_RATE": 0.0,       # fraction of requests traced into the sink
+        "ALLOW_ON_DEMAND": False, # honour the X-GraphQL-Tracing header
+        "METRICS_FILE": None,     # path the sink snapshot is written to
+        "FLUSH_INTERVAL": 60,     # seconds between snapshot writes
+    }
+"""
+import bisect
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager, nullcontext
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connections
+
+DEFAULTS = {
+    "SAMPLE_RATE": 0.0,
+    "ALLOW_ON_DEMAND": False,
+    "METRICS_FILE": None,
+    "FLUSH_INTERVAL": 60,
+}
+
+TRACING_HEADER = "HTTP_X_GRAPHQL_TRACING"
+
+# Histogram bucket upper bounds, in milliseconds or statements
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def get_setting(name):
+    return getattr(settings, "GRAPHQL_TRACING", {}).get(name, DEFAULTS[name])
+
+
+# ============================================================
+# METRICS SINK
+# ============================================================
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], self.counts)),
+        }
+
+
+class MetricsSink:
+    """Thread-safe set of named histograms, optionally written to a JSON file."""
+
+    def __init__(self):
+        self._histograms = defaultdict(Histogram)
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def observe(self, name, value):
+        with self._lock:
+            self._histograms[name].observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: h.as_dict() for name, h in sorted(self._histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def maybe_flush(self):
+        path = get_setting("METRICS_FILE")
+        if not path or time.monotonic() - self._flushed < get_setting("FLUSH_INTERVAL"):
+            return
+        self._flushed = time.monotonic()
+        self.flush(path)
+
+    def flush(self, path):
+        """Atomically replace ``path`` with the current snapshot."""
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f.name, path)
+
+
+_sink = MetricsSink()
+
+
+def get_sink():
+    return _sink
+
+
+# ============================================================
+# TRACES
+# ============================================================
+
+def field_key(path):
+    """``allOrders.edges.node.customer`` for ``["allOrders", "edges", 0, "node", "customer"]``."""
+    return ".".join(str(key) for key in path if not isinstance(key, int))
+
+
+class Trace:
+    def __init__(self, export=False):
+        self.export = export
+        self.start_time = datetime.now(timezone.utc)
+        self.start = time.perf_counter_ns()
+        self.phases = {}
+        self.resolvers = []
+        self.sql = defaultdict(lambda: [0, 0])
+        self._local = threading.local()
+        # Guards ``sql`` against the async view's worker threads
+        self._lock = threading.Lock()
+
+    def offset(self):
+        return time.perf_counter_ns() - self.start
+
+    @property
+    def stack(self):
+        # Root fields may resolve in parallel threads (async view)
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def phase(self, name):
+        start = self.offset()
+        try:
+            yield
+        finally:
+            self.phases[name] = {"startOffset": start, "duration": self.offset() - start}
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter_ns()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            key = tuple(self.stack[-1]) if self.stack else ()
+            duration = time.perf_counter_ns() - start
+            with self._lock:
+                entry = self.sql[key]
+                entry[0] += 1
+                entry[1] += duration
+
+    def capture_sql(self):
+        """Attribute SQL run in this thread to the innermost resolving field."""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self.execute_wrapper))
+        return stack
+
+    def finish(self):
+        duration = self.offset()
+        with self._lock:
+            sql = {key: tuple(entry) for key, entry in self.sql.items()}
+        resolvers = []
+        for entry in self.resolvers:
+            count, sql_ns = sql.get(tuple(entry["path"]), (0, 0))
+            resolvers.append({**entry, "sqlCount": count, "sqlDuration": sql_ns})
+        return {
+            "version": 1,
+            "startTime": self.start_time.isoformat(),
+            "endTime": datetime.now(timezone.utc).isoformat(),
+            "duration": duration,
+            **self.phases,
+            "execution": {"resolvers": resolvers},
+        }
+
+    def record(self, tracing, sink):
+        sink.observe("request.duration_ms", tracing["duration"] / 1e6)
+        sql = defaultdict(lambda: [0, 0])
+        for entry in tracing["execution"]["resolvers"]:
+            key = field_key(entry["path"])
+            sink.observe(f"field.{key}.duration_ms", entry["duration"] / 1e6)
+            sql[key][0] += entry["sqlCount"]
+            sql[key][1] += entry["sqlDuration"]
+        for key, (count, sql_ns) in sql.items():
+            if count:
+                sink.observe(f"field.{key}.sql_count", count)
+                sink.observe(f"field.{key}.sql_ms", sql_ns / 1e6)
+        sink.maybe_flush()
+
+
+def begin(request):
+    """Attach a Trace to ``request`` if it is sampled or asks for one."""
+    export = get_setting("ALLOW_ON_DEMAND") and request.META.get(TRACING_HEADER) in ("1", "true")
+    # Reassigned for every operation so a batch never reuses an earlier trace
+    request.crm_trace = None
+    if export or random.random() < get_setting("SAMPLE_RATE"):
+        request.crm_trace = Trace(export=export)
+    return request.crm_trace
+
+
+def end(trace, result):
+    """Record ``trace`` in the metrics sink and export it on ``result`` if asked."""
+    if trace is None:
+        return result
+    tracing = trace.finish()
+    trace.record(tracing, get_sink())
+    if trace.export and result is not None:
+        result.extensions = {**(result.extensions or {}), "tracing": tracing}
+    return result
+
+
+def phase(request, name):
+    trace = getattr(request, "crm_trace", None)
+    return trace.phase(name) if trace is not None else nullcontext()
+
+
+class TracingMiddleware:
+    """
+    Graphene middleware timing each resolver of a traced request.
+
+    The view leaves it out of untraced requests entirely.
+    """
+
+    def resolve(self, next, root, info, **args):
+        trace = getattr(info.context, "crm_trace", None)
+        if trace is None:
+            return next(root, info, **args)
+        path = info.path.as_list()
+        start = trace.offset()
+        trace.stack.append(path)
+        try:
+            return next(root, info, **args)
+        finally:
+            trace.stack.pop()
+            trace.resolvers.append({
+                "path": path,
+                "parentType": info.parent_type.name,
+                "fieldName": info.field_name,
+                "returnType": str(info.return_type),
+                "startOffset": start,
+                "duration": trace.offset() - start,
+            })
@@ -1,3 +1,536 @@
-from django.shortcuts import render
+import asyncio
+import csv
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import chain, islice
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    DocumentNode,
+    ExecutionResult,
+    FragmentDefinitionNode,
+    OperationDefinitionNode,
+    OperationType,
+    SelectionSetNode,
+    execute,
+    get_operation_ast,
+    validate,
+)
+
+from crm import query_cost, response_cache, tracing
+from crm.filters import CustomerFilter, OrderFilter
+from crm.loaders import reset_loaders
+from crm.models import OrderItem
+from crm.persisted_queries import (
+    SCHEMA_HASH_HEADER,
+    PersistedQueryError,
+    get_document_cache,
+    resolve_query,
+    schema_hash,
+)
+from crm.query_cost import query_cost_validator
+from crm.tracing import TracingMiddleware
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQL view with automatic persisted queries, a parsed-document cache and
+    a result cache for read-only operations.
+
+    A JSON array of operations is executed as a batch, in order, on one
+    connection and with the request's loaders shared between operations; the
+    response is the array of their results. ``GRAPHQL_MAX_BATCH_SIZE`` caps
+    the number of operations per request and ``MAX_BATCH_COST`` (see
+    ``crm.query_cost``) their total cost.
+
+    See ``crm.persisted_queries`` and ``crm.response_cache`` for the settings.
+    """
+
+    accepts_batches = True
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        response[SCHEMA_HASH_HEADER] = schema_hash(self.schema.graphql_schema)
+        return response
+
+    def parse_body(self, request):
+        # The view instance is per request, so batch mode can be set from the body
+        self.batch = (
+            self.accepts_batches
+            and self.get_content_type(request) == "application/json"
+            and request.body.lstrip()[:1] == b"["
+        )
+        data = super().parse_body(request)
+        if self.batch:
+            if len(data) > settings.GRAPHQL_MAX_BATCH_SIZE:
+                raise HttpError(HttpResponseBadRequest(
+                    f"Batch of {len(data)} operations exceeds the limit of "
+                    f"{settings.GRAPHQL_MAX_BATCH_SIZE}."
+                ))
+            if not all(isinstance(entry, dict) for entry in data):
+                raise HttpError(HttpResponseBadRequest("Batch entries must be JSON objects."))
+            self.check_batch_cost(request, data)
+        return data
+
+    def check_batch_cost(self, request, data):
+        """
+        Reject a batch whose operations together cost more than
+        ``MAX_BATCH_COST``, before any of them runs. Operations that fail on
+        their own are left to report their error in the batch.
+        """
+        total = 0
+        for entry in data:
+            try:
+                query, variables, operation_name, _ = self.get_graphql_params(request, entry)
+            except HttpError:
+                continue
+            if not query:
+                continue
+            document, _, errors = self.get_document(query, operation_name)
+            if errors:
+                continue
+            _, extensions = self.check_cost(document, variables, operation_name)
+            total += extensions["cost"]["cost"] if extensions else 0
+        budget = query_cost.get_setting("MAX_BATCH_COST")
+        if total > budget:
+            raise HttpError(HttpResponseBadRequest(
+                f"Batch has a cost of {total}, exceeding the maximum of {budget}."
+            ))
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        try:
+            query = resolve_query(query, extensions)
+        except PersistedQueryError as e:
+            raise HttpError(HttpResponse(status=e.status), e.message)
+        return query, variables, operation_name, id
+
+    def get_response(self, request, data, show_graphiql=False):
+        if not self.batch:
+            return self.get_operation_response(request, data, show_graphiql)
+        try:
+            return self.get_operation_response(request, data)
+        except HttpError as e:
+            # A rejected operation fails on its own, not the whole batch
+            status_code = e.response.status_code
+            response = {"errors": [self.format_error(e)], "id": data.get("id"), "status": status_code}
+            return self.json_encode(request, response), status_code
+
+    def get_operation_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        trace = tracing.begin(request)
+        execution_result = tracing.end(trace, self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        ))
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True or (
+            execution_result and execution_result.errors
+        ):
+            set_rollback()
+        return self.encode_result(request, execution_result, id, show_graphiql)
+
+    def encode_result(self, request, execution_result, id=None, show_graphiql=False):
+        """Return the ``(body, status_code)`` for an execution result."""
+        if not execution_result:
+            return None, 200
+        status_code = 200
+        response = {}
+        if execution_result.errors:
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+        if execution_result.errors and any(
+            not getattr(e, "path", None) for e in execution_result.errors
+        ):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+        if execution_result.extensions:
+            response["extensions"] = execution_result.extensions
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        if not query:
+            return super().execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+
+        # "parsing" covers the cached parse and standard validation
+        with tracing.phase(request, "parsing"):
+            document, operation_ast, errors = self.get_document(query, operation_name)
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+        try:
+            self.check_method(request, operation_ast)
+        except HttpError:
+            if show_graphiql:
+                return None
+            raise
+
+        with tracing.phase(request, "validation"):
+            errors, extensions = self.check_cost(document, variables, operation_name)
+        if errors:
+            return ExecutionResult(data=None, errors=errors, extensions=extensions)
+
+        key, data = self.get_cached_response(document, operation_ast, variables, operation_name)
+        if data is not None:
+            return ExecutionResult(data=data, extensions=extensions)
+
+        result = self.execute_document(request, document, operation_ast, variables, operation_name)
+        return self.finish_request(result, operation_ast, key, extensions)
+
+    def get_document(self, query, operation_name):
+        """Return ``(document, operation_ast, errors)`` from the document cache."""
+        document, errors = get_document_cache().get(
+            self.schema.graphql_schema,
+            query,
+            self.validation_rules,
+            graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+        if errors:
+            return None, None, errors
+        return document, get_operation_ast(document, operation_name), None
+
+    def check_method(self, request, operation_ast):
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+    def check_cost(self, document, variables, operation_name):
+        """
+        Run the cost rule, which needs the variables and so cannot be part of
+        the cached validation. Returns ``(errors, extensions)``.
+        """
+        costs = {}
+        rule = query_cost_validator(
+            variables=variables, operation_name=operation_name, callback=costs.update
+        )
+        errors = validate(self.schema.graphql_schema, document, [rule])
+        cost = costs.get(operation_name or "") or next(iter(costs.values()), None)
+        return errors, {"cost": cost} if cost else None
+
+    def get_cached_response(self, document, operation_ast, variables, operation_name):
+        """
+        Return ``(key, data)`` for a cacheable operation; ``data`` is None on a
+        miss and ``key`` is None when the operation cannot be cached.
+        """
+        if not response_cache.enabled():
+            return None, None
+        models = response_cache.dependencies(operation_ast)
+        if models is None:
+            return None, None
+        key = response_cache.cache_key(document, variables, operation_name, models)
+        return key, response_cache.get_response(key)
+
+    def finish_request(self, result, operation_ast, key, extensions=None):
+        if extensions:
+            result.extensions = {**(result.extensions or {}), **extensions}
+        if key is not None and not result.errors:
+            response_cache.store_response(key, result.data)
+        if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+            # Set-based writes (update(), bulk_create()) send no model signals
+            response_cache.invalidate()
+        return result
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        if getattr(request, "crm_trace", None) is None:
+            # Untraced requests skip the per-field wrapper entirely
+            middleware = [m for m in middleware or () if not isinstance(m, TracingMiddleware)]
+        return middleware
+
+    def execute_document(self, request, document, operation_ast, variables, operation_name):
+        trace = getattr(request, "crm_trace", None)
+        with trace.capture_sql() if trace is not None else nullcontext():
+            result = self._execute_document(
+                request, document, operation_ast, variables, operation_name
+            )
+        if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+            # Later operations in a batch must not see what the loaders cached before the write
+            reset_loaders(request)
+        return result
+
+    def _execute_document(self, request, document, operation_ast, variables, operation_name):
+        try:
+            execute_options = {
+                "root_value": self.get_root_value(request),
+                "context_value": self.get_context(request),
+                "variable_values": variables,
+                "operation_name": operation_name,
+                "middleware": self.get_middleware(request),
+            }
+            if self.execution_context_class:
+                execute_options["execution_context_class"] = self.execution_context_class
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(self.schema.graphql_schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            return execute(self.schema.graphql_schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+# ============================================================
+# ASYNC EXECUTION
+# ============================================================
+
+_executor = None
+
+
+def get_executor():
+    """Return the bounded pool the async view runs ORM work on."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "GRAPHQL_ASYNC_WORKERS", 8),
+            thread_name_prefix="graphql",
+        )
+    return _executor
+
+
+async def run_in_pool(func, *args):
+    def call():
+        try:
+            return func(*args)
+        finally:
+            # Pool threads live outside the request cycle that normally
+            # closes their connections
+            close_old_connections()
+
+    return await sync_to_async(call, thread_sensitive=False, executor=get_executor())()
+
+
+def split_root_fields(document, operation_ast):
+    """Return one document per root selection of ``operation_ast``."""
+    fragments = [
+        definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    ]
+    parts = []
+    for selection in operation_ast.selection_set.selections:
+        operation = OperationDefinitionNode(
+            operation=operation_ast.operation,
+            name=operation_ast.name,
+            variable_definitions=operation_ast.variable_definitions,
+            directives=operation_ast.directives,
+            selection_set=SelectionSetNode(selections=(selection,)),
+        )
+        parts.append((DocumentNode(definitions=(operation, *fragments)), operation))
+    return parts
+
+
+def merge_results(results):
+    data = {}
+    errors = []
+    for result in results:
+        errors.extend(result.errors or ())
+        if data is not None and result.data is not None:
+            data.update(result.data)
+        else:
+            data = None
+    return ExecutionResult(data=data, errors=errors or None)
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    Async variant of CRMGraphQLView for ASGI deployments.
+
+    The ORM is synchronous, so execution happens on a bounded thread pool
+    (``GRAPHQL_ASYNC_WORKERS``) rather than on the event loop. Each root field
+    of a query runs as its own document on the pool, so independent fields
+    such as ``allCustomers`` and ``allOrders`` resolve concurrently. Mutations
+    run as a single unit since their root fields must execute serially.
+    GraphiQL and batching are left to the sync view.
+    """
+
+    view_is_async = True
+    accepts_batches = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+            data = self.parse_body(request)
+            query, variables, operation_name, id = self.get_graphql_params(request, data)
+            trace = tracing.begin(request)
+            execution_result = tracing.end(trace, await self.execute_graphql_request_async(
+                request, query, variables, operation_name
+            ))
+            result, status_code = self.encode_result(request, execution_result, id)
+            response = HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+            response[SCHEMA_HASH_HEADER] = schema_hash(self.schema.graphql_schema)
+            return response
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    async def execute_graphql_request_async(self, request, query, variables, operation_name):
+        if not query:
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        # "parsing" covers the cached parse and standard validation
+        with tracing.phase(request, "parsing"):
+            document, operation_ast, errors = self.get_document(query, operation_name)
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+        self.check_method(request, operation_ast)
+
+        with tracing.phase(request, "validation"):
+            errors, extensions = self.check_cost(document, variables, operation_name)
+        if errors:
+            return ExecutionResult(data=None, errors=errors, extensions=extensions)
+
+        key, data = self.get_cached_response(document, operation_ast, variables, operation_name)
+        if data is not None:
+            return ExecutionResult(data=data, extensions=extensions)
+
+        if (
+            operation_ast is not None
+            and operation_ast.operation == OperationType.QUERY
+            and len(operation_ast.selection_set.selections) > 1
+        ):
+            result = merge_results(
+                await asyncio.gather(
+                    *(
+                        run_in_pool(
+                            self.execute_document,
+                            request, part, part_ast, variables, operation_name,
+                        )
+                        for part, part_ast in split_root_fields(document, operation_ast)
+                    )
+                )
+            )
+        else:
+            result = await run_in_pool(
+                self.execute_document, request, document, operation_ast, variables, operation_name
+            )
+        return self.finish_request(result, operation_ast, key, extensions)
+
+
+# ============================================================
+# STREAMING EXPORTS
+# ============================================================
+
+EXPORT_CHUNK_SIZE = 2000
+
+ORDER_EXPORT_FIELDS = ("id", "customer_id", "customer__email", "total_amount", "order_date")
+CUSTOMER_EXPORT_FIELDS = ("id", "name", "email", "phone")
+
+
+class Echo:
+    """File-like object whose ``write`` returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def get_filterset(filterset_class, request):
+    """
+    Bind the GraphQL filter arguments, given in their snake_case form as
+    query parameters, e.g. ``?total_amount_gte=100&order_by=-order_date``.
+    """
+    return filterset_class(request.GET, queryset=filterset_class._meta.model.objects.all())
+
+
+def export_queryset(filterset):
+    queryset = filterset.qs
+    # A stable order keeps chunked server-side iteration consistent
+    return queryset if queryset.query.order_by else queryset.order_by("pk")
+
+
+def iter_order_lines(queryset):
+    rows = queryset.values_list(*ORDER_EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    through = OrderItem.objects
+    for chunk in iter(lambda: list(islice(rows, EXPORT_CHUNK_SIZE)), []):
+        product_ids = defaultdict(list)
+        for order_id, product_id in through.filter(
+            order_id__in=[row[0] for row in chunk]
+        ).values_list("order_id", "product_id"):
+            product_ids[order_id].append(product_id)
+        for pk, customer_id, email, total_amount, order_date in chunk:
+            yield json.dumps({
+                "id": pk,
+                "customer_id": customer_id,
+                "customer_email": email,
+                "total_amount": str(total_amount),
+                "order_date": order_date.isoformat(),
+                "product_ids": product_ids[pk],
+            }) + "\n"
+
+
+def export_orders_ndjson(request):
+    """Stream the orders matching the OrderFilter parameters, one JSON object per line."""
+    filterset = get_filterset(OrderFilter, request)
+    if not filterset.is_valid():
+        return JsonResponse({"errors": filterset.errors}, status=400)
+    queryset = export_queryset(filterset)
+    return StreamingHttpResponse(iter_order_lines(queryset), content_type="application/x-ndjson")
+
+
+def export_customers_csv(request):
+    """Stream the customers matching the CustomerFilter parameters as CSV."""
+    filterset = get_filterset(CustomerFilter, request)
+    if not filterset.is_valid():
+        return JsonResponse({"errors": filterset.errors}, status=400)
+    queryset = export_queryset(filterset)
+    writer = csv.writer(Echo())
+    rows = queryset.values_list(*CUSTOMER_EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    response = StreamingHttpResponse(
+        chain([writer.writerow(CUSTOMER_EXPORT_FIELDS)], (writer.writerow(row) for row in rows)),
+        content_type="text/csv",
+    )
+    response["Content-Disposition"] = 'attachment; filename="customers.csv"'
+    return response